@@ -1,6 +1,18 @@
 import api from './Api';
 import { getCookie } from './components/utils';
 
+// Paged lists answer {next, results}; follow next until every row is read
+const getAllPages = async (url) => {
+    const results = [];
+    let response = await api.get(url, { params: { page_size: 500 } });
+    results.push(...response.data.results);
+    while (response.data.next) {
+        response = await api.get(response.data.next);
+        results.push(...response.data.results);
+    }
+    return results;
+}
+
 export const login = {
     ownerLogin: async (email, password) => {
         const response = await api.post('owner/login', {
@@ -278,8 +290,7 @@ export const deleteProduct = async (id) => {
 
 export const getProductByStation = async (station_id) => {
     try {
-        const response = await api.get(`/products/station/${station_id}`);
-        return response.data;
+        return await getAllPages(`/products/station/${station_id}`);
     } catch (error) {
         console.error('Failed to get product', error);
         throw error;
@@ -318,8 +329,7 @@ export const deletePump = async (id) => {
 
 export const getPumpsByStation = async (station_id) => {
     try {
-        const response = await api.get(`/pumps/station/${station_id}`);
-        return response.data;
+        return await getAllPages(`/pumps/station/${station_id}`);
     } catch (error) {
         console.error('Failed to get pump', error);
         throw error;
@@ -328,8 +338,7 @@ export const getPumpsByStation = async (station_id) => {
 
 export const getPumpByProduct = async (product_id) => {
     try {
-        const response = await api.get(`/pumps/product/${product_id}`);
-        return response.data;
+        return await getAllPages(`/pumps/product/${product_id}`);
     } catch (error) {
         console.error('Failed to get pump', error);
         throw error;
@@ -338,8 +347,7 @@ export const getPumpByProduct = async (product_id) => {
 
 export const getPumpByPit = async (pit_id) => {
     try {
-        const response = await api.get(`/pumps/pit/${pit_id}`);
-        return response.data;
+        return await getAllPages(`/pumps/pit/${pit_id}`);
     } catch (error) {
         console.error('Failed to get pump', error);
         throw error;
@@ -378,8 +386,7 @@ export const deletePit = async (id) => {
 
 export const getPitsByStation = async (station_id) => {
     try {
-        const response = await api.get(`/pits/station/${station_id}`);
-        return response.data;
+        return await getAllPages(`/pits/station/${station_id}`);
     } catch (error) {
         console.error('Failed to get pits', error);
         throw error;
@@ -388,8 +395,7 @@ export const getPitsByStation = async (station_id) => {
 
 export const getPitsByProduct = async (product_id) => {
     try {
-        const response = await api.get(`/pits/product/${product_id}`);
-        return response.data;
+        return await getAllPages(`/pits/product/${product_id}`);
     } catch (error) {
         console.error('Failed to get pits for product');
         throw error;
@@ -428,8 +434,7 @@ export const deleteShift = async (id) => {
 
 export const getShifts = async (type, id) => {
     try {
-        const response = await api.get(`/pumpreadings/${type}/${id}`);
-        return response.data;
+        return await getAllPages(`/pumpreadings/${type}/${id}`);
     } catch (error) {
         console.error(`Failed to get shifts by ${type}`, error);
         throw error;
@@ -481,8 +486,7 @@ export const deletePitShift = async (id) => {
 
 export const getPitShiftsByStation = async (station_id) => {
     try {
-        const response = await api.get(`/pitreadings/station/${station_id}`);
-        return response.data;
+        return await getAllPages(`/pitreadings/station/${station_id}`);
     } catch (error) {
         console.error('Failed to get pit shifts', error);
         throw error;
@@ -491,8 +495,7 @@ export const getPitShiftsByStation = async (station_id) => {
 
 export const getPitShiftByPump = async (pump_id) => {
     try {
-        const response = await api.get(`/pitreadings/pump/${pump_id}`);
-        return response.data;
+        return await getAllPages(`/pitreadings/pump/${pump_id}`);
     } catch (error) {
         console.error('Failed to get pit shifts', error);
         throw error;
@@ -501,8 +504,7 @@ export const getPitShiftByPump = async (pump_id) => {
 
 export const getPitShiftByPit = async (pit_id) => {
     try {
-        const response = await api.get(`/pitreadings/pit-get/${pit_id}`);
-        return response.data;
+        return await getAllPages(`/pitreadings/pit-get/${pit_id}`);
     } catch (error) {
         console.error('Failed to get pit shifts', error);
         throw error;
@@ -511,8 +513,7 @@ export const getPitShiftByPit = async (pit_id) => {
 
 export const getSalesByAttendant = async (attendant_id) => {
     try {
-        const response = await api.get(`/sales/attendant/${attendant_id}`);
-        return response.data;
+        return await getAllPages(`/sales/attendant/${attendant_id}`);
     } catch (error) {
         console.error('Failed to get sales', error);
         throw error;
@@ -521,8 +522,7 @@ export const getSalesByAttendant = async (attendant_id) => {
 
 export const getSalesByStation = async (station_id) => {
     try {
-        const response = await api.get(`/sales/station/${station_id}`);
-        return response.data;
+        return await getAllPages(`/sales/station/${station_id}`);
     } catch (error) {
         console.error('Failed to get sales', error);
         throw error;
@@ -531,8 +531,7 @@ export const getSalesByStation = async (station_id) => {
 
 export const getSalesByPump = async (pump_id) => {
     try {
-        const response = await api.get(`/sales/pump/${pump_id}`);
-        return response.data;
+        return await getAllPages(`/sales/pump/${pump_id}`);
     } catch (error) {
         console.error('Failed to get sales', error);
         throw error;
@@ -1,116 +1,131 @@
+from asgiref.sync import (
+    iscoroutinefunction, markcoroutinefunction, sync_to_async
+)
 from django.contrib.auth.backends import ModelBackend
-from owner.models import Owner
-from manager.models import Manager
-from station_attendant.models import Attendant
-from station.models import Station
-from product.models import Pump
+from django.core.exceptions import PermissionDenied
+from owner.models import User
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from rest_framework_simplejwt.tokens import RefreshToken
-from django.core.cache import cache
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from service.cache_keys import user_namespace
 from rest_framework_simplejwt.views import TokenRefreshView
 from service.token_utils import set_tokens_and_response
-from django.contrib.auth import get_user_model
+from service.tokens import CachedRefreshToken, ScopedTokenRefreshSerializer
+from whitenoise.middleware import WhiteNoiseMiddleware
 
 
 class CustomAuthBackend(ModelBackend):
+    """
+    Authenticates owners, managers and attendants by email.
+
+    The user and its role are resolved with one indexed query and the
+    password is hashed exactly once. A failed email login raises
+    PermissionDenied so Django does not retry it on ModelBackend with
+    another lookup and hash.
+    """
     def authenticate(self, request, email=None, password=None, **kwargs):
-        try:
-            user = Owner.objects.get(email=email)
-            if user.check_password(password):
-                return user
-        except Owner.DoesNotExist:
-            pass
-
-        try:
-            user = Manager.objects.get(email=email)
-            if user.check_password(password):
-                return user
-        except Manager.DoesNotExist:
-            pass
+        if email is None or password is None:
+            return None
 
-        try:
-            user = Attendant.objects.get(email=email)
-            if user.check_password(password):
-                return user
-        except Attendant.DoesNotExist:
-            pass
+        user = User.objects.get_with_role(email=email)
+        if user is None:
+            # Hash anyway so unknown emails cost as much as bad passwords
+            User().set_password(password)
+            raise PermissionDenied
 
-        return None
+        if user.check_password(password) and self.user_can_authenticate(user):
+            return user
+        raise PermissionDenied
 
 
 class CookieTokenMiddleware:
+    async_capable = True
+    sync_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
 
     def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        self.use_cookies(request)
+        response = self.get_response(request)
+        return response
+
+    async def __acall__(self, request):
+        self.use_cookies(request)
+        return await self.get_response(request)
+
+    def use_cookies(self, request):
         token = request.COOKIES.get('access')
         csrftoken = request.COOKIES.get('csrftoken')
         if token:
             request.META['HTTP_AUTHORIZATION'] = f'Bearer {token}'
         if csrftoken:
             request.META['HTTP_X_CSRFTOKEN'] = csrftoken
-        response = self.get_response(request)
-        return response
+
+
+class StaticFilesMiddleware(WhiteNoiseMiddleware):
+    """
+    WhiteNoiseMiddleware that also runs in async mode.
+
+    A single sync-only middleware makes Django run the whole chain, and
+    every async view behind it, in a worker thread under ASGI. Only the
+    rare static file is served from a thread here.
+    """
+    async_capable = True
+    sync_capable = True
+
+    def __init__(self, get_response=None, *args, **kwargs):
+        super().__init__(get_response, *args, **kwargs)
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = self.find_file(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return await sync_to_async(self.serve)(static_file, request)
+        return await self.get_response(request)
 
 
 class CustomTokenRefreshView(TokenRefreshView):
+    serializer_class = ScopedTokenRefreshSerializer
+
     def post(self, request, *args, **kwargs):
-        response = super().post(request, *args, **kwargs)
-        refresh_token = request.data.get('refresh')
-
-        if response.status_code == 200 and refresh_token:
-            # Decode the refresh token to get the user
-            refresh = RefreshToken(refresh_token)
-            user_id = refresh.payload.get('user_id')
-            User = get_user_model()
-            user = User.objects.get(id=user_id)
-            # Use the function to set cookies and return response
-            return set_tokens_and_response(request, user, refresh)
+        serializer = self.get_serializer(data=request.data)
+        try:
+            serializer.is_valid(raise_exception=True)
+        except TokenError as e:
+            raise InvalidToken(e.args[0])
 
-        return response
+        # The token is decoded once and carries the current scope
+        return set_tokens_and_response(
+            request,
+            serializer.validated_data['user'],
+            serializer.validated_data['refresh']
+            )
 
 
 class LogoutView(APIView):
     def post(self, request, *args, **kwargs):
         try:
             refresh_token = request.data['refresh']
-            token = RefreshToken(refresh_token)
+            token = CachedRefreshToken(refresh_token)
             token.blacklist()
 
-            user_id = token['user_id']
-
-            # Clear the cache for this user
-            keys_to_clear = [
-                f"is_manager_{user_id}",
-                f"manager_station_{user_id}",
-                f"is_attendant_{user_id}",
-                f"attendant_station_{user_id}",
-                f"attendant_{user_id}_pump_readings",
-                f"is_owner_{user_id}",
-            ]
-
-            # Clear attendant and pump keys
-            attendants = Attendant.objects.filter(station=user_id).values('id')
-            for attendant in attendants:
-                keys_to_clear.append(
-                    f"manager_{user_id}_attendant_{attendant['id']}"
-                    )
-
-            pumps = Pump.objects.filter(station=user_id).values('id')
-            for pump in pumps:
-                keys_to_clear.append(f"manager_{user_id}_pump_{pump['id']}")
-
-            # Clear owner station keys
-            stations = Station.objects.filter(owner=user_id).values('id')
-            for station in stations:
-                keys_to_clear.append(
-                    f"owner_{user_id}_station_{station['id']}"
-                    )
-
-            for key in keys_to_clear:
-                cache.delete(key)
+            # Drop everything cached for this user in one round trip
+            user_namespace(token['user_id']).invalidate()
 
             return Response(
                 {"detail": "Logout successful"},
@@ -64,13 +64,15 @@ MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
+    'service.metrics.MetricsMiddleware',
+    'service.tracing.TracingMiddleware',
     'gas_world.backends.CookieTokenMiddleware',
     # 'django.middleware.csrf.CsrfViewMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'gas_world.backends.StaticFilesMiddleware',
 ]
 
 ROOT_URLCONF = 'gas_world.urls'
@@ -103,6 +105,8 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # A file, so threaded tests can open their own connections
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
     }
 }
 
@@ -198,13 +202,30 @@ CACHES = {
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'service.claims.ClaimsJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
     ),
 }
 
+# Keyset pagination for list and by_station/by_pump/by_attendant endpoints
+PAGINATION_PAGE_SIZE = 100
+PAGINATION_MAX_PAGE_SIZE = 500
+
+# Seconds an authenticated user is cached between checks that it still
+# exists and is active; None trusts access tokens until they expire
+AUTH_USER_CACHE_SECONDS = 60
+
+# Requests at least this slow are logged with their SQL
+METRICS_SLOW_REQUEST_MS = 500
+
+# Traces are appended to this file; unset leaves tracing off
+TRACE_FILE = os.environ.get('TRACE_FILE')
+# Share of traces kept, plus every trace at least TRACE_SLOW_MS long
+TRACE_SAMPLE_RATE = 0.01
+TRACE_SLOW_MS = 500
+
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(hours=1),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
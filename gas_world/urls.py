@@ -17,6 +17,7 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include, re_path
 from .backends import LogoutView, CustomTokenRefreshView
+from service.metrics import MetricsView
 from django.views.generic import TemplateView
 
 urlpatterns = [
@@ -32,6 +33,7 @@ urlpatterns = [
          CustomTokenRefreshView.as_view(),
          name='token_refresh'),
     path('api/v1/logout', LogoutView.as_view(), name='logout'),
+    path('api/v1/metrics', MetricsView.as_view(), name='metrics'),
     # Catch-all route to serve your index.html file
     re_path(r'^.*', TemplateView.as_view(template_name='index.html')),
 ]
@@ -1,5 +1,6 @@
 from django.db import models
 from owner.models import User
+from service.claims import revoke_scope, track_cached_user
 
 
 class Manager(User):
@@ -14,3 +15,20 @@ class Manager(User):
     is_manager = models.BooleanField(default=True)
 
     REQUIRED_FIELDS = ['station']
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._recorded_station_id = instance.__dict__.get('station_id')
+        return instance
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        previous_station_id = getattr(self, '_recorded_station_id', None)
+        if previous_station_id and previous_station_id != self.station_id:
+            # Tokens signed for the old station must not be honoured
+            revoke_scope(self.pk)
+        self._recorded_station_id = self.station_id
+
+
+track_cached_user(Manager)
@@ -1,4 +1,3 @@
-from django.core.cache import cache
 from rest_framework import viewsets, status
 from rest_framework.permissions import OR
 from rest_framework.decorators import action
@@ -7,12 +6,14 @@ from manager.serializers import *
 from owner.permissions import IsStationOwner, IsAuthenticatedManager
 from rest_framework.response import Response
 from rest_framework_simplejwt.views import TokenObtainPairView
-from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework_simplejwt.exceptions import TokenError, InvalidToken
 from rest_framework.exceptions import PermissionDenied
 from product.models import Pump
 from station_attendant.models import Attendant
-from service.token_utils import set_tokens_and_response
+from service.cache_keys import (
+    station_namespace, STATION_ATTENDANT, STATION_PUMP
+)
+from service.token_utils import get_refresh_token, set_tokens_and_response
 
 
 class ManagerViewSet(viewsets.ModelViewSet):
@@ -95,36 +96,23 @@ class ManagerLoginView(TokenObtainPairView):
         # Retrieve the authenticated user
         user = serializer.validated_data['user']
 
-        if user.is_manager:
-            refresh = RefreshToken.for_user(user)
-            cache.set(f"is_manager_{user.id}", user.is_manager, timeout=3600)
-            cache.set(
-                f"manager_station_{user.id}",
-                user.station_id,
-                timeout=3600
-                )
+        if user.role == 'manager':
+            refresh = get_refresh_token(user)
 
-            attendants = Attendant.objects.filter(
+            # Warm the station's attendants and pumps, one round trip each
+            station_cache = station_namespace(user.station_id)
+            attendant_ids = Attendant.objects.filter(
                 station=user.station_id
-                ).values('id', 'name')
-
-            for attendant in attendants:
-                cache.set(
-                    f"manager_{user.id}_attendant_{attendant['id']}",
-                    attendant['name'],
-                    timeout=3600
-                    )
-
-            # Save all pumps for the manager's
-            # station in Redis with unique keys
-            pumps = Pump.objects.filter(station=user.station_id).values(
+                ).values_list('id', flat=True)
+            station_cache.set_many(
+                STATION_ATTENDANT,
+                {attendant_id: attendant_id for attendant_id in attendant_ids}
+                )
+
+            pumps = Pump.objects.filter(station=user.station_id).values_list(
                 'id', 'name'
                 )
-            for pump in pumps:
-                cache.set(
-                    f"manager_{user.id}_pump_{pump['id']}",
-                    pump['name'], timeout=3600
-                    )
+            station_cache.set_many(STATION_PUMP, dict(pumps))
 
             return set_tokens_and_response(request, user, refresh)
 
@@ -1,7 +1,12 @@
 from django.contrib.auth.base_user import BaseUserManager
+from django.core.exceptions import ObjectDoesNotExist
 from django.utils.translation import gettext_lazy as _
 
 
+# Reverse one-to-one accessors from User to its role subclasses
+ROLES = ('owner', 'manager', 'attendant')
+
+
 class CustomUserManager(BaseUserManager):
     """
     Custom user model manager where email is the unique identifiers
@@ -32,3 +37,27 @@ class CustomUserManager(BaseUserManager):
         if extra_fields.get("is_superuser") is not True:
             raise ValueError(_("Superuser must have is_superuser=True."))
         return self.create_user(email, password, **extra_fields)
+
+    def get_with_role(self, **lookup):
+        """
+        Fetch a user together with its Owner, Manager or Attendant row in
+        a single query.
+
+        Returns the concrete role instance with a ``role`` attribute set
+        to 'owner', 'manager', 'attendant' or None, or None if no user
+        matches the lookup.
+        """
+        user = self.select_related(*ROLES).filter(**lookup).first()
+        if user is None:
+            return None
+
+        for role in ROLES:
+            try:
+                concrete = getattr(user, role)
+            except ObjectDoesNotExist:
+                continue
+            concrete.role = role
+            return concrete
+
+        user.role = None
+        return user
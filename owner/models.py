@@ -2,6 +2,7 @@ from django.db import models
 from django.contrib.auth.models import AbstractBaseUser, PermissionsMixin
 from uuid import uuid4
 from owner.manager import CustomUserManager
+from service.claims import track_cached_user
 
 
 class BaseModel(models.Model):
@@ -93,3 +94,7 @@ class Owner(User):
     is_owner = models.BooleanField(default=True)
 
     REQUIRED_FIELDS = ['company_name']
+
+
+track_cached_user(User)
+track_cached_user(Owner)
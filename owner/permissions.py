@@ -1,13 +1,74 @@
 from rest_framework import permissions
-from django.core.cache import cache
 from station.models import Station
 from manager.models import Manager
-from owner.models import Owner
-from station_attendant.models import Attendant
 from station_attendant.models import Attendant
 from product.models import Product, Pump, PumpReading
 from pit.models import Pit, PitReading
 from sales.models import Sales
+from service.claims import token_claims
+from service.tracing import traced
+
+
+def get_station_id(obj):
+    """
+    Return the id of the station an object belongs to, or None.
+
+    Only foreign key ids are read, so objects fetched with the viewsets'
+    select_related querysets are resolved without further queries.
+    """
+    if isinstance(obj, Station):
+        return obj.id
+    if isinstance(obj, PumpReading):
+        return obj.pump.station_id
+    if isinstance(obj, PitReading):
+        return obj.reading_pit.station_id
+    if isinstance(obj, (Manager, Attendant, Product, Pump, Pit, Sales)):
+        return obj.station_id
+    return None
+
+
+@traced()
+def owns_station(request, station_id):
+    """
+    Check whether the requesting owner owns a station.
+
+    The token's station claims answer this for every station the owner
+    had when the token was signed. Only stations created since then
+    need a database check.
+    """
+    claims = token_claims(request)
+    if claims.get('role') != 'owner' or not station_id:
+        return False
+    if str(station_id) in claims.get('station_ids', ()):
+        return True
+    return Station.objects.filter(
+        id=station_id,
+        owner_id=request.user.id
+        ).exists()
+
+
+async def aowns_station(request, station_id):
+    """
+    owns_station for async views. Call service.claims.atoken_claims on
+    the request first.
+    """
+    claims = token_claims(request)
+    if claims.get('role') != 'owner' or not station_id:
+        return False
+    if str(station_id) in claims.get('station_ids', ()):
+        return True
+    return await Station.objects.filter(
+        id=station_id,
+        owner_id=claims['user_id']
+        ).aexists()
+
+
+def works_at_station(request, role, station_id):
+    """Check whether the requesting manager or attendant works at a station."""
+    claims = token_claims(request)
+    if claims.get('role') != role or not station_id:
+        return False
+    return claims.get('station_id') == str(station_id)
 
 
 class IsAuthenticatedOwner(permissions.BasePermission):
@@ -15,20 +76,12 @@ class IsAuthenticatedOwner(permissions.BasePermission):
     Allows access only to authenticated owners (those who can create stations).
     """
 
+    @traced()
     def has_permission(self, request, view):
         if not request.user.is_authenticated:
             return False
 
-        # Check if the user is an owner using cached value first
-        is_owner_cache_key = f"is_owner_{request.user.id}"
-        is_owner = cache.get(is_owner_cache_key)
-
-        if is_owner is None:
-            # Cache miss: Fetch from the database and store in cache
-            is_owner = request.user.is_owner
-            cache.set(is_owner_cache_key, is_owner, timeout=3600)
-
-        return is_owner
+        return token_claims(request).get('role') == 'owner'
 
 
 class IsStationOwner(permissions.BasePermission):
@@ -36,95 +89,38 @@ class IsStationOwner(permissions.BasePermission):
     Allows access only if the user is the owner of the station
     associated with the object (Station or Manager).
     """
+    @traced()
     def has_object_permission(self, request, view, obj):
         if not request.user.is_authenticated:
             return False
 
-        try:
-            # Check if the user is an owner.
-            owner = Owner.objects.get(pk=request.user.pk)
-        except Owner.DoesNotExist:
-            return False  # User is not an owner
-
-        # Determine the station associated with the object
-        if isinstance(obj, Station):
-            station = obj
-        elif isinstance(obj, Manager):
-            station = obj.station
-        elif isinstance(obj, Product):
-            station = obj.station
-        elif isinstance(obj, Pump):
-            station = obj.station
-        elif isinstance(obj, Pit):
-            station = obj.station
-        else:
+        if not isinstance(obj, (Station, Manager, Product, Pump, Pit)):
             return False
 
         # Check if the user owns the station
-        return station.owner == owner
+        return owns_station(request, get_station_id(obj))
 
 
 class IsAuthenticatedManager(permissions.BasePermission):
     """Allows access only to authenticated managers of the current station."""
 
+    @traced()
     def has_permission(self, request, view):
         if not request.user.is_authenticated:
             return False
 
-        # Allow general access if user is a manager
-        try:
-            manager = Manager.objects.get(pk=request.user.pk)
-            if manager.station_id:
-                return True
-        except Manager.DoesNotExist:
-            return False
-
-        return False
+        claims = token_claims(request)
+        return claims.get('role') == 'manager' and bool(
+            claims.get('station_id')
+            )
 
+    @traced()
     def has_object_permission(self, request, view, obj):
         if not request.user.is_authenticated:
             return False
 
-        try:
-            manager = Manager.objects.get(pk=request.user.pk)
-        except Manager.DoesNotExist:
-            return False
-
-        # Determine the station associated with the object
-        station = None
-        if isinstance(obj, Manager):
-            station = obj.station
-        if isinstance(obj, Product):
-            station = obj.station
-        elif isinstance(obj, Pump):
-            station = obj.station
-        elif isinstance(obj, Pit):
-            station = obj.station
-        elif isinstance(obj, Attendant):
-            station = obj.station
-        elif isinstance(obj, PumpReading):
-            station = obj.pump.station
-        elif isinstance(obj, PitReading):
-            station = obj.reading_pit.station
-        elif isinstance(obj, Sales):
-            station = obj.station
-
-        if not station:
-            return False
-
         # Check if manager's station matches the object's station
-        manager_station_cache_key = f"manager_station_{manager.id}"
-        manager_station_id = cache.get(manager_station_cache_key)
-
-        if manager_station_id is None:
-            manager_station_id = manager.station_id
-            cache.set(
-                manager_station_cache_key,
-                manager_station_id,
-                timeout=3600
-                )
-
-        return station.id == manager_station_id
+        return works_at_station(request, 'manager', get_station_id(obj))
 
 
 class IsAuthenticatedAttendant(permissions.BasePermission):
@@ -132,80 +128,30 @@ class IsAuthenticatedAttendant(permissions.BasePermission):
     Allows access only to authenticatedattendants of the current station.
     """
 
+    @traced()
     def has_permission(self, request, view):
         return request.user.is_authenticated
 
-    def is_user_attendant(self, user):
-        """Check if the user is an attendant and cache the result."""
-        is_attendant_cache_key = f"is_attendant_{user.id}"
-        is_attendant = cache.get(is_attendant_cache_key)
-
-        if is_attendant is None:
-            is_attendant = Attendant.objects.filter(pk=user.pk).exists()
-            cache.set(is_attendant_cache_key, is_attendant, timeout=3600)
-
-        return is_attendant
-
-    def get_user_station_id(self, user):
-        """Get the user's station ID and cache the result."""
-        attendant_station_cache_key = f"attendant_station_{user.id}"
-        attendant_station_id = cache.get(attendant_station_cache_key)
-
-        if attendant_station_id is None:
-            # Check if the user is an attendant and get the station_id
-            try:
-                attendant = Attendant.objects.get(pk=user.pk)
-                attendant_station_id = attendant.station_id
-                cache.set(
-                    attendant_station_cache_key,
-                    attendant_station_id,
-                    timeout=3600
-                    )
-            except Attendant.DoesNotExist:
-                return None
-
-        return attendant_station_id
-
+    @traced()
     def has_object_permission(self, request, view, obj):
         if not self.has_permission(request, view):
             return False
 
-        if not self.is_user_attendant(request.user):
-            return False
-
-        station = None
-        if isinstance(obj, PumpReading):
-            station = obj.pump.station
-        elif isinstance(obj, Attendant):
-            station = obj.station
-        elif isinstance(obj, Sales):
-            station = obj.station
-        elif hasattr(obj, 'station'):
-            station = obj.station
-
-        if not station:
-            return False
+        station_id = get_station_id(obj)
+        if station_id is None and hasattr(obj, 'station_id'):
+            station_id = obj.station_id
 
-        attendant_station_id = self.get_user_station_id(request.user)
-        return attendant_station_id == station.id
+        return works_at_station(request, 'attendant', station_id)
 
 
 class IsOwnerOrManagerOfStation(permissions.BasePermission):
+    @traced()
     def has_permission(self, request, view):
-        station_id = request.data.get('station')
-        if hasattr(request.user, 'owner'):
-            station_name = cache.get(
-                f"owner_{request.user.id}_station_{station_id}"
-                )
-            if not station_name:
-                return False
-            station = Station.objects.get(id=station_id, owner=request.user)
-        elif hasattr(request.user, 'is_manager'):
-            manager_id = request.user.id
-            station_id_cache = cache.get(f"manager_station_{manager_id}")
-            if station_id != station_id_cache:
-                return False
-            station = Station.objects.get(id=station_id)
-        else:
+        if not request.user.is_authenticated:
             return False
-        return True
+
+        station_id = request.data.get('station')
+        return (
+            owns_station(request, station_id) or
+            works_at_station(request, 'manager', station_id)
+        )
@@ -1,7 +1,6 @@
 from django.contrib.auth.hashers import make_password
 from rest_framework import serializers
 from rest_framework.serializers import ValidationError
-from rest_framework_simplejwt.tokens import RefreshToken
 from django.core.exceptions import ValidationError as dv
 from owner.models import Owner
 from django.contrib.auth import authenticate
@@ -94,9 +93,9 @@ class TokenObtainPairSerializer(serializers.Serializer):
     """
     Serializer for obtaining a JSON web token pair.
 
-    This serializer takes in an email and password,
-    validates the credentials, and returns a JSON web token
-    pair (refresh token and access token) along with the user object.
+    This serializer takes in an email and password and
+    validates the credentials. The tokens themselves are minted
+    once by the login view, after it has checked the user's role.
 
     Attributes:
         email (str): The email of the user.
@@ -105,7 +104,7 @@ class TokenObtainPairSerializer(serializers.Serializer):
 
     Methods:
         validate(attrs): Validates the email and password,
-        and returns the JSON web token pair and user object.
+        and returns the authenticated user with its role.
 
     """
 
@@ -120,20 +119,13 @@ class TokenObtainPairSerializer(serializers.Serializer):
             password=attrs['password']
             )
         if not user:
-            try:
-                self.model.objects.get(email=attrs['email'])
+            if self.model.objects.filter(email=attrs['email']).exists():
                 raise ValidationError({'password': ['Incorrect password.']})
-            except self.model.DoesNotExist:
-                raise ValidationError(
-                    {'email': ['No active account found with this email.']}
-                    )
-
-        refresh = RefreshToken.for_user(user)
-        return {
-            'refresh': str(refresh),
-            'access': str(refresh.access_token),
-            'user': user,
-        }
+            raise ValidationError(
+                {'email': ['No active account found with this email.']}
+                )
+
+        return {'user': user}
 
 
 class OwnerTokenObtainPairSerializer(TokenObtainPairSerializer):
@@ -1,15 +1,12 @@
-from django.core.cache import cache
 from django.shortcuts import get_object_or_404
 from rest_framework import status, generics, permissions, views
 from rest_framework.response import Response
-from rest_framework_simplejwt.tokens import RefreshToken
 from owner.models import Owner
 from owner.serializers import *
 from owner.permissions import IsAuthenticatedOwner
 from rest_framework_simplejwt.views import TokenObtainPairView
 from rest_framework_simplejwt.exceptions import TokenError, InvalidToken
-from station.models import Station
-from service.token_utils import set_tokens_and_response
+from service.token_utils import get_refresh_token, set_tokens_and_response
 from rest_framework.decorators import action
 
 
@@ -47,9 +44,8 @@ class LoginView(TokenObtainPairView):
 
         This method validates the user's credentials
         using the serializer, checks if the user is an owner,
-        and generates tokens for authentication.
-        If the user is an owner, it also stores the
-        owner status and their stations in Redis with unique keys.
+        and generates tokens for authentication whose claims
+        carry the owner role and the ids of the owner's stations.
 
         Args:
             request (HttpRequest): The HTTP request object.
@@ -74,19 +70,9 @@ class LoginView(TokenObtainPairView):
         # Retrieve the authenticated user
         user = serializer.validated_data['user']
 
-        if user.is_owner:
-            refresh = RefreshToken.for_user(user)
-
-            # Store owner status and their stations in Redis with unique keys
-            cache.set(f"is_owner_{user.id}", user.is_owner, timeout=3600)
-            stations = Station.objects.filter(owner=user).values('id', 'name')
-            for station in stations:
-                cache.set(
-                    f"owner_{user.id}_station_{station['id']}",
-                    station['name'],
-                    timeout=3600
-                )
-
+        if user.role == 'owner':
+            # The token carries the owner's role and stations as claims
+            refresh = get_refresh_token(user)
             return set_tokens_and_response(request, user, refresh)
 
         else:
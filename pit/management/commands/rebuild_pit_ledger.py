@@ -0,0 +1,65 @@
+from decimal import Decimal
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from pit.models import Pit, PitStockLedger
+
+
+class Command(BaseCommand):
+    """
+    Rebuild the per-pit stock ledgers from the full reading history and
+    check them against the original full-history computation.
+    """
+    help = "Rebuild pit stock ledgers from history and verify them."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--pit',
+            action='append',
+            dest='pit_ids',
+            help="Only rebuild this pit (may be repeated).",
+        )
+        parser.add_argument(
+            '--verify-only',
+            action='store_true',
+            help="Compare the stored ledgers without rebuilding them.",
+        )
+
+    def handle(self, *args, **options):
+        pit_ids = options['pit_ids']
+
+        if not options['verify_only']:
+            with transaction.atomic():
+                ledgers = PitStockLedger.rebuild(pit_ids=pit_ids)
+            self.stdout.write(f"Rebuilt {len(ledgers)} pit ledger(s).")
+
+        pits = Pit.objects.prefetch_related('pumps__readings')
+        if pit_ids:
+            pits = pits.filter(id__in=pit_ids)
+
+        mismatches = 0
+        for pit in pits:
+            expected = self.legacy_liters_dispensed(pit)
+            actual = PitStockLedger.liters_dispensed_for(pit.id)
+            if expected != actual:
+                mismatches += 1
+                self.stderr.write(
+                    f"Pit {pit.id} ({pit.name}): "
+                    f"ledger {actual} != history {expected}"
+                )
+
+        if mismatches:
+            raise CommandError(f"{mismatches} pit ledger(s) do not match.")
+        self.stdout.write(self.style.SUCCESS("All pit ledgers match."))
+
+    @staticmethod
+    def legacy_liters_dispensed(pit):
+        """
+        The liters sold through a pit as PitReading.calculate_closing_stock
+        used to compute them: every reading of every pump, summed in Python.
+        """
+        return sum(
+            (reading.liters_sold
+             for pump in pit.pumps.all()
+             for reading in pump.readings.all()),
+            Decimal(0)
+        )
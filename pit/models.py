@@ -1,7 +1,16 @@
+from django.core.exceptions import ValidationError
 from django.db import models
+from django.db.models import F, Sum
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
 from .service import BaseModel
 from station.models import Station
+from service.events import publish
+from service.models import Tombstone
+from service.tracing import current_span, traced
+from service.versions import bump_station_data, track_station_data
 from decimal import Decimal
+from operator import attrgetter
 
 
 class Pit(BaseModel):
@@ -19,9 +28,173 @@ class Pit(BaseModel):
     current_volume = models.FloatField(default=0)
     max_volume = models.FloatField()
 
+    # Fields sent to station event streams
+    EVENT_FIELDS = ('id', 'name', 'current_volume', 'max_volume')
+
+    def event_data(self):
+        return {field: getattr(self, field) for field in self.EVENT_FIELDS}
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        publish(self.station_id, ('pit.volume', self.event_data()))
+
     def update_volume(self, amount):
-        self.current_volume += amount
-        self.save()
+        """
+        Add liters to the pit, or remove them with a negative amount.
+
+        The change is a single conditional UPDATE, so concurrent updates
+        never overwrite each other and the volume never leaves the range
+        0 to max_volume.
+
+        Raises:
+            ValidationError: If the pit cannot hold or does not hold
+                enough stock for the change.
+        """
+        pits = Pit.objects.filter(pk=self.pk)
+        if amount > 0:
+            pits = pits.filter(current_volume__lte=F('max_volume') - amount)
+        elif amount < 0:
+            pits = pits.filter(current_volume__gte=-amount)
+        if not pits.update(current_volume=F('current_volume') + amount):
+            raise ValidationError(
+                f"Pit {self.name} cannot take a change of {amount} liters."
+                )
+        self.refresh_from_db(fields=['current_volume'])
+        bump_station_data(self.station_id)
+        publish(self.station_id, ('pit.volume', self.event_data()))
+
+
+class PitStockLedger(BaseModel):
+    """
+    Running totals for a pit, maintained incrementally as pump readings
+    and pit readings are written, so closing stock never has to rescan
+    the pit's reading history.
+
+    Attributes:
+        liters_dispensed (Decimal):
+            Liters sold through every pump currently on the pit.
+        supplies (float): Total supply recorded by pit readings.
+        dips (int): Number of pit readings with a measured (dipped) stock.
+        last_dip (float): The most recent measured stock.
+    """
+    pit = models.OneToOneField(
+        Pit,
+        on_delete=models.CASCADE,
+        related_name='ledger'
+        )
+    liters_dispensed = models.DecimalField(
+        max_digits=20,
+        decimal_places=2,
+        default=0
+        )
+    supplies = models.FloatField(default=0)
+    dips = models.PositiveIntegerField(default=0)
+    last_dip = models.FloatField(null=True, blank=True)
+
+    @classmethod
+    def record(cls, pit_id, liters=0, supply=0, dips=0, dip=None):
+        """
+        Apply a change to the pit's ledger with a single UPDATE,
+        rebuilding the ledger from history the first time it is touched.
+        """
+        updates = {}
+        if liters:
+            updates['liters_dispensed'] = F('liters_dispensed') + liters
+        if supply:
+            updates['supplies'] = F('supplies') + supply
+        if dips:
+            updates['dips'] = F('dips') + dips
+        if dip is not None:
+            updates['last_dip'] = dip
+        if not updates:
+            return
+
+        if not cls.objects.filter(pit_id=pit_id).update(**updates):
+            # No ledger yet: the history already includes this change.
+            cls.rebuild(pit_ids=[pit_id])
+
+    @classmethod
+    def liters_dispensed_for(cls, pit_id):
+        """Return the liters dispensed from a pit as a Decimal."""
+        liters = cls.objects.filter(pit_id=pit_id).values_list(
+            'liters_dispensed', flat=True
+            ).first()
+        if liters is None:
+            liters = cls.rebuild(pit_ids=[pit_id])[0].liters_dispensed
+        return Decimal(liters)
+
+    @classmethod
+    def liters_dispensed_for_pits(cls, pit_ids):
+        """Return {pit_id: liters dispensed} for several pits at once."""
+        pit_ids = set(pit_ids)
+        liters = dict(
+            cls.objects.filter(pit_id__in=pit_ids).values_list(
+                'pit_id', 'liters_dispensed'
+                )
+            )
+        missing = pit_ids - liters.keys()
+        if missing:
+            for ledger in cls.rebuild(pit_ids=missing):
+                liters[ledger.pit_id] = ledger.liters_dispensed
+        return {pit_id: Decimal(value) for pit_id, value in liters.items()}
+
+    @classmethod
+    def rebuild(cls, pit_ids=None):
+        """
+        Recompute ledgers from the full reading history with database
+        aggregation and persist them.
+
+        Args:
+            pit_ids (list): Restrict the rebuild to these pits.
+                All pits are rebuilt when omitted.
+
+        Returns:
+            list: The rebuilt PitStockLedger instances.
+        """
+        from django.apps import apps
+        PumpReading = apps.get_model('product', 'PumpReading')
+
+        pits = Pit.objects.all()
+        readings = PumpReading.objects.all()
+        pit_readings = PitReading.objects.all()
+        if pit_ids is not None:
+            pits = pits.filter(id__in=pit_ids)
+            readings = readings.filter(pump__pump_pit__in=pit_ids)
+            pit_readings = pit_readings.filter(reading_pit__in=pit_ids)
+
+        liters = dict(
+            readings.values_list('pump__pump_pit').annotate(
+                total=Sum(F('closing_meter') - F('opening_meter'))
+                )
+            )
+        supplies = dict(
+            pit_readings.values_list('reading_pit').annotate(
+                total=Sum('supply')
+                )
+            )
+        dips = {}
+        dipped = pit_readings.filter(
+            actual_closing_stock__isnull=False
+            ).order_by('timestamp')
+        for pit_id, actual in dipped.values_list(
+                'reading_pit', 'actual_closing_stock'):
+            count, _ = dips.get(pit_id, (0, None))
+            dips[pit_id] = (count + 1, actual)
+
+        ledgers = []
+        for pit_id in pits.values_list('id', flat=True):
+            dip_count, last_dip = dips.get(pit_id, (0, None))
+            ledger, _ = cls.objects.update_or_create(
+                pit_id=pit_id,
+                defaults={
+                    'liters_dispensed': liters.get(pit_id) or 0,
+                    'supplies': supplies.get(pit_id) or 0,
+                    'dips': dip_count,
+                    'last_dip': last_dip,
+                    }
+                )
+            ledgers.append(ledger)
+        return ledgers
 
 
 class PitReading(BaseModel):
@@ -36,6 +209,44 @@ class PitReading(BaseModel):
     actual_closing_stock = models.FloatField(null=True, blank=True)
     timestamp = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # A pit's readings newest first, in keyset order
+            models.Index(
+                fields=['reading_pit', '-timestamp', '-id'],
+                name='pitreading_pit_recent_idx'
+                ),
+            # A pit's changes in sync order
+            models.Index(
+                fields=['reading_pit', 'updated_at', 'id'],
+                name='pitreading_pit_updated_idx'
+                ),
+        ]
+
+    # Fields sent to station event streams
+    EVENT_FIELDS = (
+        'id',
+        'reading_pit_id',
+        'supply',
+        'opening_stock',
+        'closing_stock',
+        'actual_closing_stock',
+        'timestamp'
+    )
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember what the ledger already holds for this reading
+        instance._recorded_stock = (
+            instance.__dict__.get('supply'),
+            instance.__dict__.get('actual_closing_stock'),
+            )
+        return instance
+
+    def event_data(self):
+        return {field: getattr(self, field) for field in self.EVENT_FIELDS}
+
     @property
     def excess_or_shortage(self):
         actual_stock = self.actual_closing_stock
@@ -45,7 +256,9 @@ class PitReading(BaseModel):
             return actual_closing_stock_decimal - closing_stock_decimal
         return None
 
+    @traced('PitReading.save')
     def save(self, *args, **kwargs):
+        current_span().set(pit_reading=self.pk, adding=self._state.adding)
         if not self.opening_stock:
             self.opening_stock = self.reading_pit.current_volume
         self.closing_stock = self.calculate_closing_stock()
@@ -58,12 +271,49 @@ class PitReading(BaseModel):
         else:
             self.supply = 0
 
+        if self._state.adding:
+            recorded_supply, recorded_dip = 0, None
+        else:
+            recorded_supply, recorded_dip = getattr(
+                self, '_recorded_stock', (None, None)
+                )
+            if recorded_supply is None:
+                recorded_supply, recorded_dip = PitReading.objects.filter(
+                    pk=self.pk
+                    ).values_list('supply', 'actual_closing_stock').first()
+
         super().save(*args, **kwargs)
 
+        PitStockLedger.record(
+            self.reading_pit_id,
+            supply=self.supply - (recorded_supply or 0),
+            dips=int(actual_stock is not None and recorded_dip is None),
+            dip=actual_stock if actual_stock != recorded_dip else None,
+            )
+        self._recorded_stock = (self.supply, actual_stock)
+        publish(
+            self.reading_pit.station_id, ('pit.reading', self.event_data())
+            )
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        PitStockLedger.rebuild(pit_ids=[self.reading_pit_id])
+        return result
+
+    @traced('PitReading.calculate_closing_stock')
     def calculate_closing_stock(self):
-        from django.apps import apps
-        Pump = apps.get_model('product', 'Pump')
-        pumps = Pump.objects.filter(pump_pit=self.reading_pit)
-        liters_sold = sum(
-            pump_reading.liters_sold for pump in pumps for pump_reading in pump.readings.all())
+        liters_sold = PitStockLedger.liters_dispensed_for(self.reading_pit_id)
         return Decimal(self.opening_stock) - liters_sold
+
+
+@receiver(post_delete, sender=PitReading)
+def bury_pit_reading(sender, instance, **kwargs):
+    """Tell devices syncing the station to drop the pit reading."""
+    station_id = Pit.objects.filter(pk=instance.reading_pit_id).values_list(
+        'station_id', flat=True
+        ).first()
+    Tombstone.record(station_id, 'pit_readings', instance.pk)
+
+
+track_station_data(Pit, attrgetter('station_id'))
+track_station_data(PitReading, attrgetter('reading_pit.station_id'))
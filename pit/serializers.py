@@ -7,7 +7,10 @@ class PitSerializer(serializers.ModelSerializer):
     pit_product = serializers.PrimaryKeyRelatedField(
         queryset=Product.objects.all()
         )
-    product_name = serializers.SerializerMethodField()
+    product_name = serializers.CharField(
+        source='pit_product.name',
+        read_only=True
+        )
 
     class Meta:
         model = Pit
@@ -23,12 +26,9 @@ class PitSerializer(serializers.ModelSerializer):
             'updated_at'
             ]
 
-    def get_product_name(self, obj):
-        return obj.pit_product.name
-
 
 class PitReadingSerializer(serializers.ModelSerializer):
-    pit_name = serializers.SerializerMethodField()
+    pit_name = serializers.CharField(source='reading_pit.name', read_only=True)
 
     class Meta:
         model = PitReading
@@ -46,9 +46,6 @@ class PitReadingSerializer(serializers.ModelSerializer):
             'supply'
             ]
 
-    def get_pit_name(self, obj):
-        return obj.reading_pit.name
-
     def create(self, validated_data):
         pit = validated_data['reading_pit']
         validated_data['opening_stock'] = pit.current_volume
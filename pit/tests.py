@@ -1,3 +1,142 @@
-from django.test import TestCase
+import threading
+from django.core.exceptions import ValidationError
+from django.db import connection, connections, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from pit.models import Pit, PitReading, PitStockLedger
+from product.models import PumpReading
+from service.testing import (
+    LOCAL_CACHES, FlatQueriesMixin, add_pit_readings, add_pumps,
+    api_client, create_station
+)
 
-# Create your tests here.
+
+@override_settings(CACHES=LOCAL_CACHES)
+class PitQueryCountTests(FlatQueriesMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.fixture = create_station()
+        add_pit_readings(cls.fixture, cls.small_rows)
+        add_pumps(cls.fixture, cls.small_rows)
+
+    def test_queries_do_not_grow_with_pit_readings(self):
+        fixture = self.fixture
+        reading = PitReading.objects.first()
+        urls = [
+            f'/api/v1/pitreadings/{reading.id}',
+            f'/api/v1/pitreadings/station/{fixture.station.id}'
+            '?page_size=500',
+            f'/api/v1/pitreadings/pit-get/{fixture.pit.id}?page_size=500',
+            f'/api/v1/pitreadings/pump/{fixture.pump.id}?page_size=500',
+        ]
+        self.assertFlatQueries(
+            api_client(fixture.manager), urls,
+            lambda rows: add_pit_readings(fixture, rows)
+            )
+
+    def test_queries_do_not_grow_with_pits(self):
+        fixture = self.fixture
+        urls = [
+            '/api/v1/pits?page_size=500',
+            f'/api/v1/pits/{fixture.pit.id}',
+            f'/api/v1/pits/station/{fixture.station.id}?page_size=500',
+            f'/api/v1/pits/product/{fixture.product.id}?page_size=500',
+        ]
+        self.assertFlatQueries(
+            api_client(fixture.manager), urls,
+            lambda rows: add_pumps(fixture, rows)
+            )
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class ConcurrentStockTests(TransactionTestCase):
+    """
+    Many threads, each with its own connection, write one pit's volume
+    and ledger, or one pump's readings, at once; no change may be lost,
+    push the volume past its limits or start from a meter already used.
+    """
+    workers = 8
+    iterations = 25
+
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest("An in-memory SQLite database has one writer.")
+        self.fixture = create_station()
+
+    def run_concurrently(self, work):
+        """Run work() iterations times in every worker, all at once."""
+        errors = []
+        start = threading.Barrier(self.workers)
+
+        def run():
+            try:
+                start.wait()
+                for _ in range(self.iterations):
+                    work()
+            except Exception as error:
+                errors.append(error)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=run) for _ in range(self.workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+    def test_no_update_is_lost(self):
+        pit = self.fixture.pit
+        PitStockLedger.rebuild(pit_ids=[pit.id])
+        changes = self.workers * self.iterations
+        # Only half of the deliveries fit
+        Pit.objects.filter(pk=pit.pk).update(
+            current_volume=1000, max_volume=1000 + changes // 2
+            )
+        applied = []
+        refused = []
+
+        def work():
+            PitStockLedger.record(pit.id, liters=1)
+            try:
+                Pit.objects.get(pk=pit.pk).update_volume(1)
+                applied.append(1)
+            except ValidationError:
+                refused.append(1)
+
+        self.run_concurrently(work)
+
+        pit.refresh_from_db()
+        self.assertEqual(len(applied), changes // 2)
+        self.assertEqual(len(refused), changes - changes // 2)
+        self.assertEqual(pit.current_volume, 1000 + changes // 2)
+        self.assertEqual(PitStockLedger.objects.get(pit=pit).liters_dispensed,
+                         changes)
+
+    def test_readings_continue_the_pump_meter(self):
+        pump = self.fixture.pump
+        attendant = self.fixture.attendant
+
+        def work():
+            with transaction.atomic():
+                reading = PumpReading(
+                    pump_id=pump.id, attendant_id=attendant.id,
+                    opening_meter=None, rate=1
+                    )
+                reading.save()
+                reading.closing_meter = reading.opening_meter + 1
+                reading.save()
+
+        self.run_concurrently(work)
+
+        meters = list(PumpReading.objects.filter(pump=pump).order_by(
+            'opening_meter'
+            ).values_list('opening_meter', 'closing_meter'))
+        self.assertEqual(len(meters), self.workers * self.iterations)
+        meter = pump.initial_meter
+        for opening, closing in meters:
+            self.assertEqual(opening, meter)
+            meter = closing
+        pump.refresh_from_db()
+        self.assertEqual(pump.current_meter, meter)
+        self.assertEqual(meter, self.workers * self.iterations)
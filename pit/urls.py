@@ -1,5 +1,7 @@
 from django.urls import path
-from .views import PitViewSet, PitReadingViewSet
+from .views import (
+    PitViewSet, PitReadingViewSet, PitReadingsByStationAsyncView
+    )
 
 app_name = 'pit'
 
@@ -29,6 +31,9 @@ urlpatterns = [
     path('pitreadings/station/<uuid:station_id>',
          PitReadingViewSet.as_view({'get': 'by_station'}),
          name='readings-by-station'),
+    path('async/pitreadings/station/<uuid:station_id>',
+         PitReadingsByStationAsyncView.as_view(),
+         name='async-readings-by-station'),
     path('pitreadings/pump/<uuid:pump_id>',
          PitReadingViewSet.as_view({'get': 'by_pump'}),
          name='readings-by-pump'),
@@ -1,15 +1,25 @@
 from rest_framework import viewsets, permissions, serializers
 from rest_framework.response import Response
 from .models import PitReading, Pit
-from product.models import Pump
 from .serializers import PitSerializer, PitReadingSerializer
 from owner.permissions import IsStationOwner, IsAuthenticatedManager
-from django.core.cache import cache
+from django.db import DatabaseError
+from product.models import Product, Pump
+from service.async_views import AsyncStationListView
+from service.conditional import CachedListMixin
+from service.pagination import KeysetPaginatedMixin
 
 
-class PitViewSet(viewsets.ModelViewSet):
-    queryset = Pit.objects.all()
+class PitViewSet(CachedListMixin, KeysetPaginatedMixin,
+                 viewsets.ModelViewSet):
+    queryset = Pit.objects.select_related('pit_product')
     serializer_class = PitSerializer
+    cursor_field = 'created_at'
+    etag_actions = {
+        'list': None,
+        'by_station': 'station_id',
+        'by_product': ('product_id', Product),
+    }
     permission_classes_by_action = {
         'create': [IsStationOwner | IsAuthenticatedManager],
         'retrieve': [IsStationOwner | IsAuthenticatedManager],
@@ -34,24 +44,29 @@ class PitViewSet(viewsets.ModelViewSet):
 
     def by_station(self, request, station_id=None):
         try:
-            pits = Pit.objects.filter(station__id=station_id)
-            serializer = self.get_serializer(pits, many=True)
-            return Response(serializer.data)
-        except Exception as e:
+            pits = self.get_queryset().filter(station__id=station_id)
+            return self.paginated_response(pits)
+        except DatabaseError:
             return Response({"error": "Error fetching Pits"}, status=500)
 
     def by_product(self, request, product_id=None):
         try:
-            pits = Pit.objects.filter(pit_product__id=product_id)
-            serializer = self.get_serializer(pits, many=True)
-            return Response(serializer.data)
-        except Exception as e:
+            pits = self.get_queryset().filter(pit_product__id=product_id)
+            return self.paginated_response(pits)
+        except DatabaseError:
             return Response({"error": "Error fetching Pits"}, status=500)
 
 
-class PitReadingViewSet(viewsets.ModelViewSet):
-    queryset = PitReading.objects.all()
+class PitReadingViewSet(CachedListMixin, KeysetPaginatedMixin,
+                        viewsets.ModelViewSet):
+    queryset = PitReading.objects.select_related('reading_pit')
     serializer_class = PitReadingSerializer
+    etag_actions = {
+        'list': None,
+        'by_station': 'station_id',
+        'by_pit': ('pit_id', Pit),
+        'by_pump': ('pump_id', Pump),
+    }
     permission_classes_by_action = {
         'create': [IsStationOwner | IsAuthenticatedManager],
         'retrieve': [IsStationOwner | IsAuthenticatedManager],
@@ -73,13 +88,10 @@ class PitReadingViewSet(viewsets.ModelViewSet):
         if not pit_id:
             raise serializers.ValidationError("Pit ID must be provided.")
 
-        pit = cache.get(f"pit_{pit_id}")
-        if pit is None:
-            try:
-                pit = Pit.objects.get(id=pit_id)
-                cache.set(f"pit_{pit_id}", pit, timeout=3600)
-            except Pit.DoesNotExist:
-                raise serializers.ValidationError("Pit ID not found.")
+        try:
+            pit = Pit.objects.get(id=pit_id)
+        except Pit.DoesNotExist:
+            raise serializers.ValidationError("Pit ID not found.")
 
         serializer.save(reading_pit=pit)
 
@@ -87,16 +99,6 @@ class PitReadingViewSet(viewsets.ModelViewSet):
         instance = self.get_object()
         actual_closing_stock = self.request.data.get('actual_closing_stock')
         if actual_closing_stock is not None:
-            pit_id = instance.reading_pit.id
-            pit = cache.get(f"pit_{pit_id}")
-
-            if pit is None:
-                try:
-                    pit = Pit.objects.get(id=pit_id)
-                    cache.set(f"pit_{pit_id}", pit, timeout=3600)
-                except Pit.DoesNotExist:
-                    raise serializers.ValidationError("Pit ID not found.")
-
             instance.actual_closing_stock = actual_closing_stock
             instance.save()
         else:
@@ -108,32 +110,37 @@ class PitReadingViewSet(viewsets.ModelViewSet):
 
     def by_station(self, request, station_id=None):
         try:
-            pit_readings = PitReading.objects.filter(
+            pit_readings = self.get_queryset().filter(
                 reading_pit__station__id=station_id
                 )
-            serializer = self.get_serializer(pit_readings, many=True)
-            return Response(serializer.data)
-        except Exception as e:
+            return self.paginated_response(pit_readings)
+        except DatabaseError:
             return Response({"error": "Error fetching pits"}, status=500)
 
     def by_pit(self, request, pit_id=None):
         try:
-            pit_readings = PitReading.objects.filter(reading_pit__id=pit_id)
-            serializer = self.get_serializer(pit_readings, many=True)
-            return Response(serializer.data)
-        except Exception as e:
+            pit_readings = self.get_queryset().filter(reading_pit__id=pit_id)
+            return self.paginated_response(pit_readings)
+        except DatabaseError:
             return Response({"error": "Error fetching pits"}, status=500)
 
     def by_pump(self, request, pump_id=None):
         try:
             pump = Pump.objects.get(id=pump_id)
-            pit_readings = PitReading.objects.filter(reading_pit=pump.pump_pit)
-            serializer = self.get_serializer(pit_readings, many=True)
-            return Response(serializer.data)
+            pit_readings = self.get_queryset().filter(
+                reading_pit_id=pump.pump_pit_id
+                )
+            return self.paginated_response(pit_readings)
         except Pump.DoesNotExist:
             return Response({"error": "Pump not found"}, status=404)
-        except Exception as e:
+        except DatabaseError:
             return Response(
                 {"error": "Error fetching pit readings"},
                 status=500
                 )
+
+
+class PitReadingsByStationAsyncView(AsyncStationListView):
+    """Async variant of PitReadingViewSet.by_station."""
+    viewset_class = PitReadingViewSet
+    station_lookup = 'reading_pit__station_id'
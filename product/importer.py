@@ -0,0 +1,252 @@
+"""
+Bulk import of a station's historical pump readings and sales.
+
+Readings come as NDJSON, one JSON object per line, in the format of
+ImportReadingSerializer. Each pump's lines must be in time order and
+continue its meter: a reading opens at the meter the pump's previous
+reading closed at, starting from the pump's current meter. Lines that do
+not are reported and skipped, and the rest of the file is still
+imported.
+
+Valid lines are inserted BATCH_SIZE at a time, one transaction per batch
+with the batch's pumps locked, together with their sales records and
+daily rollup totals. Pit ledgers are rebuilt once, after the last batch.
+Imported readings get no pit readings, as no dips were taken for them.
+"""
+import json
+from decimal import Decimal
+from django.db import transaction
+from pit.models import PitStockLedger
+from product.models import Pump, PumpReading
+from product.serializers import ImportReadingSerializer
+from sales.models import DailySalesRollup, Sales
+from service.events import publish
+from service.versions import bump_station_data
+
+# Readings inserted per transaction
+BATCH_SIZE = 1000
+# Line errors kept for the report; later ones are only counted
+MAX_REPORTED_ERRORS = 1000
+
+
+class ReadingImport:
+    """
+    Import NDJSON lines into one station.
+
+    Attributes:
+        lines (int): Lines read, not counting blank ones.
+        imported (int): Readings inserted.
+        errors (list): {'line': number, 'errors': ...} for the first
+            MAX_REPORTED_ERRORS lines that were skipped.
+        error_count (int): Every line that was skipped.
+    """
+
+    def __init__(self, station, batch_size=BATCH_SIZE):
+        self.station = station
+        self.batch_size = batch_size
+        self.pumps = {
+            pump_id: (pit_id, product_id)
+            for pump_id, pit_id, product_id in station.pumps.values_list(
+                'id', 'pump_pit_id', 'product_type_id'
+                )
+        }
+        self.attendant_ids = set(
+            station.attendants.values_list('id', flat=True)
+            )
+        self.scopes = {
+            pump_id: (station.id, product_id, station.timezone)
+            for pump_id, (_, product_id) in self.pumps.items()
+        }
+        self.pump_ids = set()
+        self.lines = 0
+        self.imported = 0
+        self.errors = []
+        self.error_count = 0
+
+    def run(self, lines):
+        """
+        Import an iterable of NDJSON lines, as str or bytes.
+
+        Returns:
+            dict: The import report.
+        """
+        batch = []
+        for number, line in enumerate(lines, start=1):
+            row = self.parse(number, line)
+            if row is not None:
+                batch.append(row)
+            if len(batch) >= self.batch_size:
+                self.write(batch)
+                batch = []
+        if batch:
+            self.write(batch)
+        self.finish()
+        return self.report()
+
+    def report(self):
+        return {
+            'lines': self.lines,
+            'imported': self.imported,
+            'error_count': self.error_count,
+            'errors': sorted(self.errors, key=lambda error: error['line']),
+        }
+
+    def reject(self, number, errors):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': number, 'errors': errors})
+
+    def parse(self, number, line):
+        """Return a line's (number, validated data), or None if skipped."""
+        if not line.strip():
+            return None
+        self.lines += 1
+        try:
+            data = json.loads(line)
+        except ValueError:
+            data = None
+        if not isinstance(data, dict):
+            self.reject(number, ["Not a JSON object."])
+            return None
+
+        serializer = ImportReadingSerializer(
+            data=data, context={'tzinfo': self.station.tzinfo}
+            )
+        if not serializer.is_valid():
+            self.reject(number, serializer.errors)
+            return None
+        row = serializer.validated_data
+        if row['pump'] not in self.pumps:
+            self.reject(number, {'pump': ["Not a pump of this station."]})
+            return None
+        if row['attendant'] not in self.attendant_ids:
+            self.reject(
+                number, {'attendant': ["Not an attendant of this station."]}
+                )
+            return None
+        return number, row
+
+    @transaction.atomic
+    def write(self, batch):
+        """Check a batch against its locked pumps and insert what follows."""
+        pumps = Pump.objects.filter(pk__in={row['pump'] for _, row in batch})
+        # Readings saved before pumps tracked their latest one
+        Pump.sync_latest_readings(pumps.filter(latest_reading__isnull=True))
+        pumps = pumps.select_for_update(of=('self',)).values_list(
+            'id', 'current_meter', 'initial_meter',
+            'latest_reading__timestamp', 'latest_reading__status'
+            )
+        chains = {}
+        for pump_id, current_meter, initial_meter, latest, status in pumps:
+            meter = initial_meter if current_meter is None else current_meter
+            chains[pump_id] = (meter, latest, status)
+
+        readings = []
+        sales = []
+        timestamps = []
+        for number, row in batch:
+            meter, latest, status = chains[row['pump']]
+            error = None
+            if status == 'PENDING':
+                error = "The pump has an open reading; close it first."
+            elif latest is not None and row['timestamp'] <= latest:
+                error = (
+                    f"Must be after the pump's previous reading at "
+                    f"{latest.isoformat()}."
+                    )
+            elif row['opening_meter'] != meter:
+                error = (
+                    f"opening_meter {row['opening_meter']} does not continue "
+                    f"from the pump's meter {meter}."
+                    )
+            if error:
+                self.reject(number, [error])
+                continue
+            chains[row['pump']] = (
+                row['closing_meter'], row['timestamp'], row['status']
+                )
+            reading, sale = self.build(row)
+            readings.append(reading)
+            sales.append(sale)
+            timestamps.append(row['timestamp'])
+        if not readings:
+            return
+
+        PumpReading.objects.bulk_create(readings)
+        Sales.objects.bulk_create(sales)
+        # auto_now_add stamps inserts with the current time; backdate them
+        for reading, sale, timestamp in zip(readings, sales, timestamps):
+            reading.timestamp = sale.timestamp = timestamp
+        PumpReading.objects.bulk_update(readings, ['timestamp'])
+        Sales.objects.bulk_update(sales, ['timestamp'])
+        pump_ids = {reading.pump_id for reading in readings}
+        Pump.sync_latest_readings(Pump.objects.filter(pk__in=pump_ids))
+
+        # One rollup write per (day, product, attendant) in the batch
+        deltas = {}
+        for reading, sale in zip(readings, sales):
+            for contribution in (
+                    DailySalesRollup.reading_contribution(
+                        reading.tracked_state(), self.scopes
+                        ),
+                    DailySalesRollup.sales_contribution(
+                        sale.tracked_state(), self.scopes, reading
+                        )):
+                if contribution is None:
+                    continue
+                key, totals = contribution
+                delta = deltas.setdefault(key, {})
+                for field, value in totals.items():
+                    delta[field] = delta.get(field, 0) + value
+        DailySalesRollup.record_deltas(deltas)
+
+        bump_station_data(self.station.id)
+        self.pump_ids.update(pump_ids)
+        self.imported += len(readings)
+
+    def build(self, row):
+        """The unsaved reading and sales record for a validated line."""
+        reading = PumpReading(
+            pump_id=row['pump'],
+            attendant_id=row['attendant'],
+            opening_meter=row['opening_meter'],
+            closing_meter=row['closing_meter'],
+            rate=row['rate'],
+            status=row['status']
+            )
+        figures = row.get('sales', {})
+        cash = figures.get('cash', Decimal(0))
+        transfer = figures.get('transfer', Decimal(0))
+        pos = figures.get('pos', Decimal(0))
+        expenses = figures.get('expenses', Decimal(0))
+        sale = Sales(
+            station=self.station,
+            pump_reading=reading,
+            attendant_id=row['attendant'],
+            cash=cash,
+            transfer=transfer,
+            pos=pos,
+            expenses=expenses,
+            shortage_or_excess=(
+                reading.amount - (cash + transfer + pos + expenses)
+                ),
+            # Only open readings still have an open sale
+            is_active=row['status'] != 'COMPLETED'
+            )
+        return reading, sale
+
+    def finish(self):
+        """Rebuild the ledgers of the pits that were imported into."""
+        if not self.pump_ids:
+            return
+        pit_ids = {self.pumps[pump_id][0] for pump_id in self.pump_ids}
+        with transaction.atomic():
+            # Hold back concurrent ledger updates until the rebuild is in
+            list(PitStockLedger.objects.select_for_update().filter(
+                pit_id__in=pit_ids
+                ))
+            PitStockLedger.rebuild(pit_ids=list(pit_ids))
+        publish(self.station.id, ('readings.imported', {
+            'readings': self.imported,
+            'pumps': sorted(self.pump_ids),
+        }))
@@ -0,0 +1,50 @@
+import sys
+from django.core.management.base import BaseCommand, CommandError
+from product.importer import BATCH_SIZE, ReadingImport
+from station.models import Station
+
+
+class Command(BaseCommand):
+    """
+    Import a station's historical pump readings and sales from an NDJSON
+    file, as the pumpreadings import endpoint does. Skipped lines are
+    listed with their errors.
+    """
+    help = "Bulk import historical pump readings and sales from NDJSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument('station_id')
+        parser.add_argument(
+            'path', help="The NDJSON file, or - to read standard input."
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=BATCH_SIZE,
+            help="Readings inserted per transaction.",
+        )
+
+    def handle(self, *args, **options):
+        station = Station.objects.filter(id=options['station_id']).first()
+        if station is None:
+            raise CommandError("Station not found.")
+
+        importer = ReadingImport(station, batch_size=options['batch_size'])
+        if options['path'] == '-':
+            report = importer.run(sys.stdin.buffer)
+        else:
+            with open(options['path'], 'rb') as lines:
+                report = importer.run(lines)
+
+        for error in report['errors']:
+            self.stderr.write(f"Line {error['line']}: {error['errors']}")
+        unlisted = report['error_count'] - len(report['errors'])
+        if unlisted:
+            self.stderr.write(f"...and {unlisted} more skipped line(s).")
+        self.stdout.write(
+            f"Imported {report['imported']} of {report['lines']} reading(s)."
+        )
+        if report['error_count']:
+            raise CommandError(
+                f"{report['error_count']} line(s) were not imported."
+            )
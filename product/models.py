@@ -1,11 +1,21 @@
 from django.db import models
 from product.service import BaseModel
 from station.models import Station
-from sales.models import Sales
-from pit.models import PitReading
+from sales.models import DailySalesRollup, Sales
+from pit.models import PitReading, PitStockLedger
 from decimal import Decimal
-from django.db import transaction
+from django.db import connection, transaction
+from django.db.models import F, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Greatest
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
 from django.core.exceptions import ValidationError
+from operator import attrgetter
+from service.cache_keys import station_namespace
+from service.events import publish
+from service.models import Tombstone
+from service.tracing import current_span, traced
+from service.versions import bump_station_data, track_station_data
 
 
 class Product(BaseModel):
@@ -39,6 +49,104 @@ class Pump(BaseModel):
         on_delete=models.CASCADE,
         related_name='pumps'
         )
+    # Maintained by PumpReading.save, never written by Pump.save
+    latest_reading = models.ForeignKey(
+        'product.PumpReading',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        editable=False,
+        related_name='+'
+        )
+    current_meter = models.DecimalField(
+        max_digits=20,
+        decimal_places=2,
+        null=True,
+        blank=True,
+        editable=False
+        )
+
+    READING_STATE_FIELDS = ('latest_reading', 'current_meter')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._recorded_pit_id = instance.__dict__.get('pump_pit_id')
+        instance._recorded_station_id = instance.__dict__.get('station_id')
+        return instance
+
+    @classmethod
+    def sync_latest_readings(cls, pumps=None):
+        """
+        Point pumps at their newest reading and take their current meter
+        from it, with a single UPDATE.
+
+        Args:
+            pumps (QuerySet): The pumps to sync. Defaults to every pump.
+        """
+        if pumps is None:
+            pumps = cls.objects.all()
+        newest = PumpReading.objects.filter(
+            pump=OuterRef('pk')
+            ).order_by('-timestamp')
+        return pumps.update(
+            latest_reading=Subquery(newest.values('pk')[:1]),
+            current_meter=Subquery(
+                newest.annotate(
+                    meter=Greatest('opening_meter', 'closing_meter')
+                    ).values('meter')[:1]
+                )
+            )
+
+    @classmethod
+    def lock_meter(cls, pump_id):
+        """
+        Lock a pump for a new reading, so readings on it are created one at
+        a time, and return the meter the new reading starts from.
+        """
+        pumps = cls.objects.filter(pk=pump_id)
+        if not connection.features.has_select_for_update:
+            # SQLite ignores FOR UPDATE; writing first takes its database
+            # lock, which waits for other writers instead of failing later
+            pumps.update(current_meter=F('current_meter'))
+        fields = ('current_meter', 'latest_reading_id', 'initial_meter')
+        current_meter, latest_reading_id, initial_meter = (
+            pumps.select_for_update().values_list(*fields).get()
+            )
+        if latest_reading_id is None:
+            # Readings saved before pumps tracked their latest one
+            cls.sync_latest_readings(pumps)
+            current_meter = pumps.values_list(
+                'current_meter', flat=True
+                ).get()
+        return initial_meter if current_meter is None else current_meter
+
+    @transaction.atomic
+    def save(self, *args, **kwargs):
+        previous_pit_id = getattr(self, '_recorded_pit_id', None)
+        previous_station_id = getattr(self, '_recorded_station_id', None)
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            # Never overwrite the reading state with a stale copy
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and
+                field.name not in self.READING_STATE_FIELDS
+            ]
+        super().save(*args, **kwargs)
+
+        if previous_station_id and previous_station_id != self.station_id:
+            station_namespace(previous_station_id).invalidate()
+            bump_station_data(previous_station_id)
+        self._recorded_station_id = self.station_id
+
+        if previous_pit_id and previous_pit_id != self.pump_pit_id:
+            # Move this pump's dispensed liters to its new pit's ledger
+            liters = self.readings.aggregate(
+                total=Sum(F('closing_meter') - F('opening_meter'))
+                )['total'] or 0
+            PitStockLedger.record(previous_pit_id, liters=-liters)
+            PitStockLedger.record(self.pump_pit_id, liters=liters)
+        self._recorded_pit_id = self.pump_pit_id
 
 
 class PumpReading(BaseModel):
@@ -78,33 +186,286 @@ class PumpReading(BaseModel):
         )
     timestamp = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # A pump's latest reading, and pump or attendant lists newest
+            # first in keyset order
+            models.Index(
+                fields=['pump', '-timestamp', '-id'],
+                name='pumpreading_pump_recent_idx'
+                ),
+            models.Index(
+                fields=['attendant', '-timestamp', '-id'],
+                name='pumpreading_att_recent_idx'
+                ),
+            # Open shifts, a small slice of the history
+            models.Index(
+                fields=['pump', '-timestamp'],
+                condition=Q(status='PENDING'),
+                name='pumpreading_pending_pump_idx'
+                ),
+            models.Index(
+                fields=['attendant', '-timestamp'],
+                condition=Q(status='PENDING'),
+                name='pumpreading_pending_att_idx'
+                ),
+            # A pump's changes in sync order
+            models.Index(
+                fields=['pump', 'updated_at', 'id'],
+                name='pumpreading_pump_updated_idx'
+                ),
+        ]
+
+    # Fields whose stored values the pit ledger and daily rollups depend on
+    TRACKED_FIELDS = (
+        'pump_id',
+        'attendant_id',
+        'timestamp',
+        'opening_meter',
+        'closing_meter',
+        'rate'
+    )
+
+    # Fields sent to station event streams
+    EVENT_FIELDS = (
+        'id',
+        'pump_id',
+        'attendant_id',
+        'status',
+        'opening_meter',
+        'closing_meter',
+        'rate',
+        'timestamp'
+    )
+
+    def tracked_state(self):
+        return {field: getattr(self, field) for field in self.TRACKED_FIELDS}
+
+    def event_data(self):
+        return {field: getattr(self, field) for field in self.EVENT_FIELDS}
+
+    @staticmethod
+    def state_meter(state):
+        """The pump meter a reading's tracked state leaves behind."""
+        return max(
+            Decimal(str(state['opening_meter'])),
+            Decimal(str(state['closing_meter']))
+            )
+
+    @staticmethod
+    def state_liters(state):
+        """The liters sold according to a tracked state, or 0 for None."""
+        if not state:
+            return 0
+        return Decimal(str(state['closing_meter'])) - Decimal(
+            str(state['opening_meter'])
+            )
+
+    @traced('PumpReading.save')
     @transaction.atomic
     def save(self, *args, **kwargs):
-        if self.opening_meter is None:
-            pump_reading = PumpReading.objects.filter(pump=self.pump)
-            last_reading = pump_reading.order_by('-timestamp').first()
-            closing_meter = last_reading.closing_meter
-            initial = self.pump.initial_meter
-            self.opening_meter = closing_meter if last_reading else initial
+        adding = self._state.adding
+        current_span().set(pump_reading=self.pk, adding=adding)
+        if adding:
+            # Two readings can never continue from the same meter
+            current_meter = Pump.lock_meter(self.pump_id)
+            if self.opening_meter is None:
+                self.opening_meter = current_meter
+
+        # What the pit ledger and rollups hold for this reading, read under
+        # a row lock so stale instances and concurrent saves cannot skew them
+        recorded = None
+        recorded_status = None
+        if not self._state.adding:
+            recorded = PumpReading.objects.select_for_update().filter(
+                pk=self.pk
+                ).values(*self.TRACKED_FIELDS, 'status').first()
+            if recorded is not None:
+                recorded_status = recorded.pop('status')
         super().save(*args, **kwargs)
 
+        state = self.tracked_state()
+        liters_delta = self.state_liters(state) - self.state_liters(recorded)
+        if liters_delta:
+            PitStockLedger.record(self.pump.pump_pit_id, liters=liters_delta)
+        DailySalesRollup.record_reading_change(recorded, state)
+
+        meter = self.state_meter(state)
+        if adding:
+            Pump.objects.filter(pk=self.pump_id).update(
+                latest_reading=self, current_meter=meter
+                )
+        elif recorded is None or self.state_meter(recorded) != meter:
+            # Only the pump's latest reading sets its meter
+            Pump.objects.filter(pk=self.pump_id, latest_reading=self).update(
+                current_meter=meter
+                )
+
+        if adding:
+            kind = 'reading.opened'
+        elif self.status == 'COMPLETED' and recorded_status != 'COMPLETED':
+            kind = 'reading.closed'
+        else:
+            kind = 'reading.updated'
+        publish(self.pump.station_id, (kind, self.event_data()))
+
         if not hasattr(self, 'sales'):
             self.create_sales_record()
         if not hasattr(self, 'pit_reading'):
             self.create_pit_reading()
 
+    @classmethod
+    @transaction.atomic
+    def open_shift(cls, station_id, assignments):
+        """
+        Open a shift on several pumps of a station at once.
+
+        Creates a reading, its sales record and a pit reading for every
+        assignment with one batched INSERT per table, inside a single
+        transaction. Opening meters continue from each pump's current meter
+        and a missing rate defaults to the rate of the pump's latest reading.
+
+        Args:
+            station_id: The station whose pumps are being opened.
+            assignments (list): Dicts with 'pump' and 'attendant' ids and
+                an optional 'rate'.
+
+        Returns:
+            list: The created PumpReading instances.
+
+        Raises:
+            ValidationError: If a pump or attendant is not at the station,
+                or a pump's latest reading is still open.
+        """
+        from station_attendant.models import Attendant
+
+        pumps = Pump.objects.filter(
+            station_id=station_id,
+            id__in=[assignment['pump'] for assignment in assignments]
+            )
+        # Readings saved before pumps tracked their latest one
+        Pump.sync_latest_readings(pumps.filter(latest_reading__isnull=True))
+        pumps = pumps.select_for_update(of=('self',)).select_related(
+            'pump_pit', 'station', 'latest_reading'
+            ).in_bulk()
+        attendants = Attendant.objects.filter(
+            station_id=station_id,
+            id__in=[assignment['attendant'] for assignment in assignments]
+            ).in_bulk()
+
+        readings = []
+        for assignment in assignments:
+            pump = pumps.get(assignment['pump'])
+            attendant = attendants.get(assignment['attendant'])
+            if pump is None:
+                raise ValidationError(
+                    f"Pump {assignment['pump']} is not at this station."
+                    )
+            if attendant is None:
+                raise ValidationError(
+                    f"Attendant {assignment['attendant']} "
+                    "is not at this station."
+                    )
+            if pump.latest_reading and (
+                    pump.latest_reading.status == 'PENDING'):
+                raise ValidationError(
+                    f"Pump {pump.id} has an open reading; close it first."
+                    )
+
+            opening_meter = pump.current_meter
+            if opening_meter is None:
+                opening_meter = pump.initial_meter
+            rate = assignment.get('rate')
+            if rate is None and pump.latest_reading:
+                rate = pump.latest_reading.rate
+
+            reading = cls(
+                pump=pump,
+                attendant=attendant,
+                opening_meter=opening_meter,
+                closing_meter=opening_meter,
+                rate=rate or 0
+                )
+            readings.append(reading)
+        cls.objects.bulk_create(readings)
+
+        for reading in readings:
+            reading.pump.latest_reading = reading
+            reading.pump.current_meter = reading.opening_meter
+        Pump.objects.bulk_update(
+            [reading.pump for reading in readings],
+            Pump.READING_STATE_FIELDS
+            )
+
+        # One rollup write per (product, attendant) instead of per reading
+        scopes = {
+            pump.id: (pump.station_id, pump.product_type_id,
+                      pump.station.timezone)
+            for pump in pumps.values()
+        }
+        rollup_deltas = {}
+        for reading in readings:
+            key, totals = DailySalesRollup.reading_contribution(
+                reading.tracked_state(), scopes
+                )
+            delta = rollup_deltas.setdefault(key, {})
+            for field, value in totals.items():
+                delta[field] = delta.get(field, 0) + value
+        DailySalesRollup.record_deltas(rollup_deltas)
+
+        # A fresh reading has sold nothing, so nothing is owed either
+        sales = Sales.objects.bulk_create(
+            Sales(
+                pump_reading=reading,
+                attendant=reading.attendant,
+                station=reading.pump.station,
+                shortage_or_excess=0
+                )
+            for reading in readings
+            )
+
+        liters_dispensed = PitStockLedger.liters_dispensed_for_pits(
+            reading.pump.pump_pit_id for reading in readings
+            )
+        pit_readings = []
+        for reading in readings:
+            pit = reading.pump.pump_pit
+            opening_stock = pit.current_volume
+            closing_stock = (
+                Decimal(opening_stock) - liters_dispensed[pit.id]
+                )
+            pit_readings.append(PitReading(
+                reading_pit=pit,
+                opening_stock=opening_stock,
+                closing_stock=closing_stock
+                ))
+        PitReading.objects.bulk_create(pit_readings)
+
+        bump_station_data(station_id)
+        publish(
+            station_id,
+            *[('reading.opened', reading.event_data())
+              for reading in readings],
+            *[('sales.created', sale.event_data()) for sale in sales],
+            *[('pit.reading', pit_reading.event_data())
+              for pit_reading in pit_readings]
+            )
+        return readings
+
     @property
     def liters_sold(self):
-        return self.closing_meter - self.opening_meter
+        return Decimal(str(self.closing_meter)) - Decimal(
+            str(self.opening_meter)
+            )
 
     @property
     def amount(self):
         return Decimal(self.liters_sold) * self.rate
 
+    @traced('PumpReading.create_sales_record')
     def create_sales_record(self):
-        print(f"Creating sales record for pump reading ID {self.id}")
         if Sales.objects.filter(pump_reading_id=self.id).exists():
-            print(f"Sales record already exists for pump reading ID {self.id}")
+            current_span().set(sales_exists=True)
             raise ValidationError("Pump reading ID already exists")
         else:
             Sales.objects.create(
@@ -112,7 +473,6 @@ class PumpReading(BaseModel):
                 attendant=self.attendant,
                 station=self.pump.station
             )
-            print(f"Sales record created for pump reading ID {self.id}")
 
     def create_pit_reading(self):
         reading_pit = self.pump.pump_pit
@@ -121,3 +481,46 @@ class PumpReading(BaseModel):
             reading_pit=reading_pit,
             opening_stock=opening_stock
             )
+
+
+@receiver(post_delete, sender=Pump)
+def forget_station_pump(sender, instance, **kwargs):
+    """Stop treating a deleted pump as part of its station."""
+    station_namespace(instance.station_id).invalidate()
+
+
+@receiver(post_delete, sender=PumpReading)
+def release_dispensed_liters(sender, instance, **kwargs):
+    """
+    Take a deleted reading's liters back out of its pit's ledger and its
+    totals out of its daily rollup, and move its pump's latest reading
+    pointer back to the reading before it.
+    """
+    recorded = instance.tracked_state()
+    DailySalesRollup.record_reading_change(recorded, None)
+
+    # Deleting the latest reading set the pointer to NULL
+    Pump.sync_latest_readings(Pump.objects.filter(
+        pk=instance.pump_id, latest_reading__isnull=True
+        ))
+
+    liters_sold = PumpReading.state_liters(recorded)
+    if liters_sold:
+        # A plain UPDATE: a missing ledger means the pit is being deleted
+        PitStockLedger.objects.filter(pit__pumps=instance.pump_id).update(
+            liters_dispensed=F('liters_dispensed') - liters_sold
+            )
+
+
+@receiver(post_delete, sender=PumpReading)
+def bury_pump_reading(sender, instance, **kwargs):
+    """Tell devices syncing the station to drop the reading."""
+    station_id = Pump.objects.filter(pk=instance.pump_id).values_list(
+        'station_id', flat=True
+        ).first()
+    Tombstone.record(station_id, 'pump_readings', instance.pk)
+
+
+track_station_data(Product, attrgetter('station_id'))
+track_station_data(Pump, attrgetter('station_id'))
+track_station_data(PumpReading, attrgetter('pump.station_id'))
@@ -1,4 +1,5 @@
 from rest_framework import serializers
+from django.utils import timezone
 from product.models import Product, Pump, PumpReading
 from station.models import Station
 from station_attendant.models import Attendant
@@ -18,8 +19,16 @@ class PumpSerializer(serializers.ModelSerializer):
     product_type = serializers.PrimaryKeyRelatedField(
         queryset=Product.objects.all())
     pump_pit = serializers.PrimaryKeyRelatedField(queryset=Pit.objects.all())
-    product_name = serializers.SerializerMethodField()
-    pit_name = serializers.SerializerMethodField()
+    product_name = serializers.CharField(
+        source='product_type.name',
+        read_only=True
+        )
+    pit_name = serializers.CharField(source='pump_pit.name', read_only=True)
+    latest_reading_status = serializers.CharField(
+        source='latest_reading.status',
+        read_only=True,
+        allow_null=True
+        )
 
     class Meta:
         model = Pump
@@ -30,22 +39,23 @@ class PumpSerializer(serializers.ModelSerializer):
             'product_type',
             'product_name',
             'initial_meter',
+            'current_meter',
+            'latest_reading',
+            'latest_reading_status',
             'pump_pit',
             'pit_name',
             'created_at',
             'updated_at'
             ]
-
-    def get_product_name(self, obj):
-        return obj.product_type.name
-
-    def get_pit_name(self, obj):
-        return obj.pump_pit.name
+        read_only_fields = ['current_meter', 'latest_reading']
 
 
 class PumpReadingSerializer(serializers.ModelSerializer):
-    attendant_name = serializers.SerializerMethodField()
-    pump_name = serializers.SerializerMethodField()
+    attendant_name = serializers.CharField(
+        source='attendant.name',
+        read_only=True
+        )
+    pump_name = serializers.CharField(source='pump.name', read_only=True)
 
     class Meta:
         model = PumpReading
@@ -68,19 +78,13 @@ class PumpReadingSerializer(serializers.ModelSerializer):
             ]
         read_only_fields = ['liters_sold', 'amount']
 
-    def get_attendant_name(self, obj):
-        return obj.attendant.name
-
-    def get_pump_name(self, obj):
-        return obj.pump.name
-
     def create(self, validated_data):
         pump = validated_data.get('pump')
         rate = validated_data.get('rate')
 
         if rate is None:
-            pump_reading = PumpReading.objects.filter(pump=pump)
-            last_reading = pump_reading.order_by('-timestamp').first()
+            # A primary key read through the pump's latest reading pointer
+            last_reading = pump.latest_reading
             if last_reading:
                 rate = last_reading.rate
             else:
@@ -89,3 +93,79 @@ class PumpReadingSerializer(serializers.ModelSerializer):
             validated_data['rate'] = rate
 
         return super().create(validated_data)
+
+
+class ShiftAssignmentSerializer(serializers.Serializer):
+    pump = serializers.UUIDField()
+    attendant = serializers.UUIDField()
+    rate = serializers.DecimalField(
+        max_digits=15,
+        decimal_places=2,
+        required=False
+        )
+
+
+class OpenShiftSerializer(serializers.Serializer):
+    """
+    Serializer for opening a shift on several pumps of a station at once.
+    """
+    assignments = ShiftAssignmentSerializer(many=True, allow_empty=False)
+
+    def validate_assignments(self, value):
+        pump_ids = [assignment['pump'] for assignment in value]
+        if len(pump_ids) != len(set(pump_ids)):
+            raise serializers.ValidationError(
+                "Each pump can only be assigned once per shift."
+                )
+        return value
+
+
+class ImportSalesSerializer(serializers.Serializer):
+    cash = serializers.DecimalField(
+        max_digits=10, decimal_places=2, default=0
+        )
+    transfer = serializers.DecimalField(
+        max_digits=10, decimal_places=2, default=0
+        )
+    pos = serializers.DecimalField(max_digits=10, decimal_places=2, default=0)
+    expenses = serializers.DecimalField(
+        max_digits=10, decimal_places=2, default=0
+        )
+
+
+class ImportReadingSerializer(serializers.Serializer):
+    """
+    One line of a reading import: a historical pump reading and the
+    figures of its sales record.
+
+    Timestamps without an offset are taken to be in the time zone passed
+    in the 'tzinfo' context.
+    """
+    pump = serializers.UUIDField()
+    attendant = serializers.UUIDField()
+    timestamp = serializers.DateTimeField()
+    opening_meter = serializers.DecimalField(max_digits=20, decimal_places=2)
+    closing_meter = serializers.DecimalField(max_digits=20, decimal_places=2)
+    rate = serializers.DecimalField(max_digits=15, decimal_places=2)
+    status = serializers.ChoiceField(
+        choices=PumpReading.STATUS_CHOICES,
+        default='COMPLETED'
+        )
+    sales = ImportSalesSerializer(required=False)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if 'tzinfo' in self.context:
+            self.fields['timestamp'].timezone = self.context['tzinfo']
+
+    def validate_timestamp(self, value):
+        if value > timezone.now():
+            raise serializers.ValidationError("Must not be in the future.")
+        return value
+
+    def validate(self, data):
+        if data['closing_meter'] < data['opening_meter']:
+            raise serializers.ValidationError(
+                "closing_meter must not be below opening_meter."
+                )
+        return data
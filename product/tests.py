@@ -1,3 +1,52 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
+from product.models import PumpReading
+from service.testing import (
+    LOCAL_CACHES, FlatQueriesMixin, add_products, add_pumps, add_readings,
+    api_client, create_station
+)
 
-# Create your tests here.
+
+@override_settings(CACHES=LOCAL_CACHES)
+class ProductQueryCountTests(FlatQueriesMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.fixture = create_station()
+        add_readings(cls.fixture, cls.small_rows)
+        add_products(cls.fixture, cls.small_rows)
+        add_pumps(cls.fixture, cls.small_rows)
+
+    def test_queries_do_not_grow_with_readings(self):
+        fixture = self.fixture
+        reading = PumpReading.objects.first()
+        urls = [
+            f'/api/v1/pumpreadings/pump/{fixture.pump.id}?page_size=500',
+            f'/api/v1/pumpreadings/{reading.id}',
+            f'/api/v1/pumpreadings/station/{fixture.station.id}'
+            '?page_size=500',
+            f'/api/v1/pumpreadings/attendant/{fixture.attendant.id}'
+            '?page_size=500',
+        ]
+        self.assertFlatQueries(
+            api_client(fixture.manager), urls,
+            lambda rows: add_readings(fixture, rows)
+            )
+
+    def test_queries_do_not_grow_with_pumps(self):
+        fixture = self.fixture
+
+        def grow(rows):
+            add_products(fixture, rows)
+            add_pumps(fixture, rows)
+
+        urls = [
+            '/api/v1/products?page_size=500',
+            f'/api/v1/products/{fixture.product.id}',
+            f'/api/v1/products/station/{fixture.station.id}?page_size=500',
+            '/api/v1/pumps?page_size=500',
+            f'/api/v1/pumps/{fixture.pump.id}',
+            f'/api/v1/pumps/station/{fixture.station.id}?page_size=500',
+            f'/api/v1/pumps/product/{fixture.product.id}?page_size=500',
+            f'/api/v1/pumps/pit/{fixture.pit.id}/?page_size=500',
+        ]
+        self.assertFlatQueries(api_client(fixture.manager), urls, grow)
@@ -1,5 +1,8 @@
 from django.urls import path
-from .views import ProductViewSet, PumpViewSet, PumpReadingViewSet
+from .views import (
+    ProductViewSet, PumpViewSet, PumpReadingViewSet,
+    PumpReadingsByStationAsyncView
+    )
 
 urlpatterns = [
     path('products', ProductViewSet.as_view(
@@ -49,6 +52,18 @@ urlpatterns = [
     path('pumpreadings/station/<uuid:station_id>',
          PumpReadingViewSet.as_view({'get': 'by_station'}),
          name='pumpreadings-by-station'),
+    path('async/pumpreadings/station/<uuid:station_id>',
+         PumpReadingsByStationAsyncView.as_view(),
+         name='async-pumpreadings-by-station'),
+    path('pumpreadings/import/station/<uuid:station_id>',
+         PumpReadingViewSet.as_view({'post': 'import_readings'}),
+         name='pumpreadings-import'),
+    path('pumpreadings/export/station/<uuid:station_id>',
+         PumpReadingViewSet.as_view({'get': 'export'}),
+         name='pumpreadings-export'),
+    path('pumpreadings/station/<uuid:station_id>/open_shift',
+         PumpReadingViewSet.as_view({'post': 'open_shift'}),
+         name='pumpreadings-open-shift'),
     path('pumpreadings/pump/<uuid:pump_id>',
          PumpReadingViewSet.as_view({'get': 'by_pump'}),
          name='pumpreadings-by-pump'),
@@ -1,16 +1,31 @@
 from rest_framework import viewsets
+from product.importer import ReadingImport
 from product.models import Product, Pump, PumpReading
 from product.serializers import *
 from owner.permissions import (
-    IsStationOwner, IsAuthenticatedManager, IsAuthenticatedAttendant
+    IsStationOwner, IsAuthenticatedManager, IsAuthenticatedAttendant,
+    owns_station, works_at_station
 )
 from station.models import Station
-from manager.models import Manager
-from rest_framework import serializers
 from station_attendant.models import Attendant
-from django.core.cache import cache
+from rest_framework import serializers, status
+from rest_framework.exceptions import PermissionDenied
+from django.core.exceptions import ValidationError
+from django.db import DatabaseError
+from django.db.models import DecimalField, ExpressionWrapper, F
+from django.utils import timezone
 from rest_framework.response import Response
 from pit.models import Pit
+from service.cache_keys import (
+    station_namespace, user_namespace,
+    STATION_ATTENDANT, STATION_PUMP, USER_PUMP_READINGS
+)
+from service.async_views import AsyncStationListView
+from service.claims import token_claims
+from service.conditional import CachedListMixin
+from service.exports import csv_response
+from service.pagination import KeysetPaginatedMixin
+from service.reports import ReportingMixin
 
 
 class BaseViewSet(viewsets.ModelViewSet):
@@ -20,53 +35,55 @@ class BaseViewSet(viewsets.ModelViewSet):
         if not station_id:
             raise serializers.ValidationError("Station ID must be provided.")
 
-        if hasattr(self.request.user, 'owner'):
-            station_name = cache.get(
-                f"owner_{self.request.user.id}_station_{station_id}"
-                )
-            if not station_name:
+        role = token_claims(self.request).get('role')
+        if role == 'owner':
+            if not owns_station(self.request, station_id):
                 raise serializers.ValidationError(
                     "Invalid station ID or you do not own this station."
                     )
-            station = Station.objects.get(
-                id=station_id,
-                owner=self.request.user
-                )
-        else:
-            try:
-                manager = Manager.objects.get(user_ptr=self.request.user)
-            except Manager.DoesNotExist:
-                raise serializers.ValidationError(
-                    "You do not have permission to create this resource."
-                    )
-
-            try:
-                station = Station.objects.get(id=station_id, manager=manager)
-            except Station.DoesNotExist:
+        elif role == 'manager':
+            if not works_at_station(self.request, 'manager', station_id):
                 raise serializers.ValidationError(
                     "You do not manage this station."
                     )
+        else:
+            raise serializers.ValidationError(
+                "You do not have permission to create this resource."
+                )
 
+        station = Station.objects.get(id=station_id)
         serializer.save(station=station)
 
 
-class ProductViewSet(BaseViewSet):
+class ProductViewSet(CachedListMixin, KeysetPaginatedMixin,
+                     BaseViewSet):
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
+    cursor_field = 'created_at'
+    etag_actions = {'list': None, 'by_station': 'station_id'}
     permission_classes = [IsStationOwner | IsAuthenticatedManager]
 
     def by_station(self, request, station_id=None):
         try:
-            products = Product.objects.filter(station__id=station_id)
-            serializer = self.get_serializer(products, many=True)
-            return Response(serializer.data)
-        except Exception as e:
+            products = self.get_queryset().filter(station__id=station_id)
+            return self.paginated_response(products)
+        except DatabaseError:
             return Response({"error": "Error fetching Products"}, status=500)
 
 
-class PumpViewSet(viewsets.ModelViewSet):
-    queryset = Pump.objects.all()
+class PumpViewSet(CachedListMixin, KeysetPaginatedMixin,
+                  viewsets.ModelViewSet):
+    queryset = Pump.objects.select_related(
+        'product_type', 'pump_pit', 'latest_reading'
+        )
     serializer_class = PumpSerializer
+    cursor_field = 'created_at'
+    etag_actions = {
+        'list': None,
+        'by_station': 'station_id',
+        'by_pump_pit': ('pump_pit_id', Pit),
+        'by_product': ('product_id', Product),
+    }
     permission_classes = [IsStationOwner | IsAuthenticatedManager]
 
     def perform_create(self, serializer):
@@ -104,36 +121,41 @@ class PumpViewSet(viewsets.ModelViewSet):
 
     def by_station(self, request, station_id=None):
         try:
-            pumps = Pump.objects.filter(station__id=station_id)
-            serializer = self.get_serializer(pumps, many=True)
-            return Response(serializer.data)
-        except Exception as e:
+            pumps = self.get_queryset().filter(station__id=station_id)
+            return self.paginated_response(pumps)
+        except DatabaseError:
             return Response({"error": "Error fetching Pumps"}, status=500)
 
     def by_pump_pit(self, request, pump_pit_id=None):
         try:
-            pumps = Pump.objects.filter(pump_pit__id=pump_pit_id)
-            serializer = self.get_serializer(pumps, many=True)
-            return Response(serializer.data)
-        except Exception as e:
+            pumps = self.get_queryset().filter(pump_pit__id=pump_pit_id)
+            return self.paginated_response(pumps)
+        except DatabaseError:
             return Response({"error": "Error fetching Pumps"}, status=500)
 
     def by_product(self, request, product_id=None):
         try:
-            pumps = Pump.objects.filter(product_type__id=product_id)
-            serializer = self.get_serializer(pumps, many=True)
-            return Response(serializer.data)
-        except Exception as e:
-            print(str(e))
+            pumps = self.get_queryset().filter(product_type__id=product_id)
+            return self.paginated_response(pumps)
+        except DatabaseError:
             return Response({"error": "Error fetching Pumps"}, status=500)
 
 
-class PumpReadingViewSet(viewsets.ModelViewSet):
-    queryset = PumpReading.objects.all()
+class PumpReadingViewSet(CachedListMixin, ReportingMixin,
+                         KeysetPaginatedMixin, viewsets.ModelViewSet):
+    queryset = PumpReading.objects.select_related('pump', 'attendant')
     serializer_class = PumpReadingSerializer
+    etag_actions = {
+        'list': None,
+        'by_station': 'station_id',
+        'by_pump': ('pump_id', Pump),
+        'by_attendant': ('attendant_id', Attendant),
+    }
+    # Longest date range one export may cover
+    max_export_days = 366
 
     def get_permissions(self):
-        if self.action == 'create':
+        if self.action in ['create', 'open_shift']:
             self.permission_classes = [IsAuthenticatedManager]
         elif self.action in ['update', 'partial_update']:
             self.permission_classes = [
@@ -143,35 +165,45 @@ class PumpReadingViewSet(viewsets.ModelViewSet):
             self.permission_classes = [IsStationOwner | IsAuthenticatedManager]
         return super().get_permissions()
 
-    def perform_create(self, serializer):
-        manager_id = self.request.user.id
-        attendant_id = cache.get(
-            f"manager_{manager_id}_attendant_{self.request.data['attendant']}"
-            )
-        print(f"Received data: {self.request.data}")
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        # ?status=PENDING narrows a list to open shifts
+        reading_status = self.request.query_params.get('status')
+        if reading_status:
+            queryset = queryset.filter(status=reading_status.upper())
+        return queryset
 
-        if attendant_id is None:
-            try:
-                attendant = Attendant.objects.get(
-                    id=self.request.data['attendant'])
-                cache.set(
-                    f"manager_{manager_id}_attendant_{attendant.id}",
-                    attendant.id, timeout=3600)
-            except Attendant.DoesNotExist:
+    def perform_create(self, serializer):
+        attendant = serializer.validated_data['attendant']
+        pump = serializer.validated_data['pump']
+        station_id = token_claims(self.request).get('station_id')
+
+        # The pump and attendant must both belong to the manager's station
+        station_cache = station_namespace(station_id)
+        cached = station_cache.get_many({
+            'attendant': (STATION_ATTENDANT, {'attendant_id': attendant.id}),
+            'pump': (STATION_PUMP, {'pump_id': pump.id}),
+            })
+
+        if cached['attendant'] is None:
+            if str(attendant.station_id) != station_id:
                 raise serializers.ValidationError("Attendant ID not found.")
-        else:
-            attendant = Attendant.objects.get(id=attendant_id)
+            station_cache.set(
+                STATION_ATTENDANT, attendant.id, attendant_id=attendant.id
+                )
+        if cached['pump'] is None:
+            if str(pump.station_id) != station_id:
+                raise serializers.ValidationError("Pump ID not found.")
+            station_cache.set(STATION_PUMP, pump.name, pump_id=pump.id)
 
         serializer.save(attendant=attendant)
 
     def perform_update(self, serializer):
         current_pump_reading = self.get_object()
-        last_pump_reading = PumpReading.objects.filter(
-            pump=current_pump_reading.pump).order_by('-timestamp').first()
-        attendant = last_pump_reading.attendant
-        closing_meter = last_pump_reading.closing_meter
+        last_pump_reading = current_pump_reading.pump.latest_reading
 
-        if last_pump_reading and attendant and closing_meter is None:
+        if last_pump_reading and last_pump_reading.attendant_id and (
+                last_pump_reading.closing_meter is None):
             raise serializers.ValidationError(
                 "Rate can't be changed while a pump activity is ongoing"
                 )
@@ -179,11 +211,12 @@ class PumpReadingViewSet(viewsets.ModelViewSet):
         if 'closing_meter' in self.request.data:
             pump_reading_id = current_pump_reading.id
             attendant_id = self.request.user.id
-            cached_pump_readings = cache.get(
-                f"attendant_{attendant_id}_pump_readings"
+            cached_pump_readings = user_namespace(attendant_id).get(
+                USER_PUMP_READINGS, default=()
                 )
 
-            if cached_pump_readings is None:
+            # Readings assigned since login are not cached yet
+            if pump_reading_id not in cached_pump_readings:
                 pump_reading_exists = PumpReading.objects.filter(
                     id=pump_reading_id, attendant_id=attendant_id
                     ).exists()
@@ -191,20 +224,15 @@ class PumpReadingViewSet(viewsets.ModelViewSet):
                     raise serializers.ValidationError(
                         "Only assigned attendant can input the closing meter"
                         )
-            elif pump_reading_id not in cached_pump_readings:
-                raise serializers.ValidationError(
-                    "Only the assigned attendant can input the closing meter"
-                    )
 
         serializer.save()
 
     def get_pump_readings(self, filter_field, filter_value):
         try:
             filter_kwargs = {f'{filter_field}__id': filter_value}
-            pump_readings = PumpReading.objects.filter(**filter_kwargs)
-            serializer = self.get_serializer(pump_readings, many=True)
-            return Response(serializer.data)
-        except Exception as e:
+            pump_readings = self.get_queryset().filter(**filter_kwargs)
+            return self.paginated_response(pump_readings)
+        except DatabaseError:
             return Response(
                 {"error": "Error fetching pump readings"},
                 status=500
@@ -212,10 +240,11 @@ class PumpReadingViewSet(viewsets.ModelViewSet):
 
     def by_station(self, request, station_id=None):
         try:
-            readings = PumpReading.objects.filter(pump__station__id=station_id)
-            serializer = self.get_serializer(readings, many=True)
-            return Response(serializer.data)
-        except Exception as e:
+            readings = self.get_queryset().filter(
+                pump__station__id=station_id
+                )
+            return self.paginated_response(readings)
+        except DatabaseError:
             return Response(
                 {"error": "Error fetching pump readings"},
                 status=500
@@ -224,5 +253,104 @@ class PumpReadingViewSet(viewsets.ModelViewSet):
     def by_pump(self, request, pump_id=None):
         return self.get_pump_readings('pump', pump_id)
 
+    def open_shift(self, request, station_id=None):
+        """
+        Open readings for many pumps of the manager's station in one
+        transaction, along with their sales records and pit readings.
+        """
+        if not works_at_station(request, 'manager', station_id):
+            raise PermissionDenied("You do not manage this station.")
+
+        serializer = OpenShiftSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            readings = PumpReading.open_shift(
+                station_id,
+                serializer.validated_data['assignments']
+                )
+        except ValidationError as e:
+            raise serializers.ValidationError(e.messages)
+
+        return Response(
+            self.get_serializer(readings, many=True).data,
+            status=status.HTTP_201_CREATED
+            )
+
     def by_attendant(self, request, attendant_id=None):
         return self.get_pump_readings('attendant', attendant_id)
+
+    def import_readings(self, request, station_id=None):
+        """
+        Import a station's historical pump readings and sales from an
+        NDJSON request body, one reading per line.
+
+        Lines that fail validation or do not continue their pump's meter
+        are reported by line number and skipped; the rest are imported.
+        See product.importer for the format and the checks made.
+        """
+        station = self.reporting_station(request, station_id)
+        report = ReadingImport(station).run(request.stream or ())
+        return Response(report)
+
+    def export(self, request, station_id=None):
+        """
+        Stream one station's pump readings between the 'start' and 'end'
+        query parameters as CSV, oldest first.
+
+        Includes the computed liters_sold and amount, and the
+        shortage_or_excess of each reading's sales record. Timestamps are
+        in the station's time zone.
+
+        Query parameters:
+            start, end: Inclusive local dates, at most a year apart.
+            attendant: Optionally, one attendant's id.
+            status: Optionally 'ACCEPTED', 'PENDING' or 'COMPLETED'.
+        """
+        station = self.reporting_station(request, station_id)
+        start, end = self.reporting_dates(
+            request, station, self.max_export_days
+            )
+        readings = self.get_queryset().filter(
+            pump__station=station,
+            **self.reporting_period(station, start, end)
+            )
+        attendant_id = self.reporting_attendant(request)
+        if attendant_id:
+            readings = readings.filter(attendant_id=attendant_id)
+
+        liters_sold = F('closing_meter') - F('opening_meter')
+        rows = readings.annotate(
+            liters_sold=ExpressionWrapper(
+                liters_sold,
+                output_field=DecimalField(max_digits=20, decimal_places=2)
+                ),
+            amount=ExpressionWrapper(
+                liters_sold * F('rate'),
+                output_field=DecimalField(max_digits=24, decimal_places=4)
+                ),
+            ).order_by('timestamp', 'id').values_list(
+                'id', 'timestamp', 'pump_id', 'pump__name',
+                'pump__product_type__name', 'attendant_id', 'attendant__name',
+                'status', 'opening_meter', 'closing_meter', 'rate',
+                'liters_sold', 'amount', 'sales__shortage_or_excess'
+                )
+        header = [
+            'id', 'timestamp', 'pump_id', 'pump', 'product', 'attendant_id',
+            'attendant', 'status', 'opening_meter', 'closing_meter', 'rate',
+            'liters_sold', 'amount', 'shortage_or_excess'
+            ]
+
+        def format_row(row):
+            timestamp = timezone.localtime(row[1], station.tzinfo)
+            return (row[0], timestamp.isoformat(), *row[2:])
+
+        return csv_response(
+            request, f'pump-readings-{station.id}-{start}-{end}.csv',
+            header, rows, format_row
+            )
+
+
+class PumpReadingsByStationAsyncView(AsyncStationListView):
+    """Async variant of PumpReadingViewSet.by_station."""
+    viewset_class = PumpReadingViewSet
+    station_lookup = 'pump__station_id'
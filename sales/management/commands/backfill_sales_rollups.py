@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand, CommandError
+from sales.models import DailySalesRollup
+from station.models import Station
+
+
+class Command(BaseCommand):
+    """
+    Rebuild the daily station rollups from the full reading and sales
+    history, and check the stored rows against that history.
+    """
+    help = "Backfill daily sales rollups from history and verify them."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--station',
+            action='append',
+            dest='station_ids',
+            help="Only backfill this station (may be repeated).",
+        )
+        parser.add_argument(
+            '--verify-only',
+            action='store_true',
+            help="Compare the stored rollups without rebuilding them.",
+        )
+
+    def handle(self, *args, **options):
+        station_ids = options['station_ids']
+
+        if not options['verify_only']:
+            rollups = DailySalesRollup.rebuild(station_ids=station_ids)
+            self.stdout.write(f"Rebuilt {len(rollups)} daily rollup row(s).")
+
+        stations = Station.objects.all()
+        if station_ids:
+            stations = stations.filter(id__in=station_ids)
+
+        mismatches = 0
+        for station in stations:
+            expected = DailySalesRollup.aggregate(station)
+            stored = {
+                (rollup.date, rollup.product_id, rollup.attendant_id): rollup
+                for rollup in DailySalesRollup.objects.filter(station=station)
+            }
+            for key in expected.keys() | stored.keys():
+                totals = expected.get(key, {})
+                rollup = stored.get(key)
+                for field in DailySalesRollup.FIELDS:
+                    actual = getattr(rollup, field) if rollup else 0
+                    if actual != totals.get(field, 0):
+                        mismatches += 1
+                        self.stderr.write(
+                            f"Station {station.id} {key}: {field} "
+                            f"{actual} != history {totals.get(field, 0)}"
+                        )
+
+        if mismatches:
+            raise CommandError(f"{mismatches} rollup total(s) do not match.")
+        self.stdout.write(self.style.SUCCESS("All daily rollups match."))
@@ -1,7 +1,19 @@
 from django.db import models
-from decimal import Decimal
+from decimal import ROUND_DOWN, Decimal
+from operator import attrgetter
 from uuid import uuid4
-from django.db import transaction
+from zoneinfo import ZoneInfo
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+from service.events import publish
+from service.models import Tombstone
+from service.tracing import current_span, traced
+from service.versions import bump_station_data, track_station_data
 
 
 class Sales(models.Model):
@@ -55,17 +67,647 @@ class Sales(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # Station reports and lists scan one station's sales by time
+            models.Index(
+                fields=['station', '-timestamp', '-id'],
+                name='sales_station_timestamp_idx'
+                ),
+            models.Index(
+                fields=['attendant', '-timestamp', '-id'],
+                name='sales_attendant_recent_idx'
+                ),
+            # Sales not yet closed by a manager
+            models.Index(
+                fields=['station', '-timestamp'],
+                condition=models.Q(is_active=True),
+                name='sales_active_station_idx'
+                ),
+            models.Index(
+                fields=['attendant', '-timestamp'],
+                condition=models.Q(is_active=True),
+                name='sales_active_attendant_idx'
+                ),
+            # A station's changes in sync order
+            models.Index(
+                fields=['station', 'updated_at', 'id'],
+                name='sales_station_updated_idx'
+                ),
+        ]
+
+    # Fields whose stored values the daily rollups depend on
+    TRACKED_FIELDS = (
+        'pump_reading_id',
+        'attendant_id',
+        'cash',
+        'transfer',
+        'pos',
+        'expenses',
+        'shortage_or_excess'
+    )
+    # Figures an attendant hands in at the end of a shift
+    FIGURE_FIELDS = ('cash', 'transfer', 'pos', 'expenses')
+    # Fields sent to station event streams
+    EVENT_FIELDS = (
+        'id',
+        'pump_reading_id',
+        'attendant_id',
+        'cash',
+        'transfer',
+        'pos',
+        'expenses',
+        'shortage_or_excess',
+        'is_active',
+        'timestamp'
+    )
+
+    def tracked_state(self):
+        return {field: getattr(self, field) for field in self.TRACKED_FIELDS}
+
+    def event_data(self):
+        return {field: getattr(self, field) for field in self.EVENT_FIELDS}
+
+    @traced('Sales.save')
+    @transaction.atomic
     def save(self, *args, **kwargs):
+        current_span().set(sale=self.pk, adding=self._state.adding)
         cash_flow = Decimal(
             self.cash + self.transfer + self.pos + self.expenses
             )
         pump_reading_amount = Decimal(self.pump_reading.amount)
         self.shortage_or_excess = pump_reading_amount - cash_flow
+
+        # What the daily rollups hold for this sale, read under a row lock
+        adding = self._state.adding
+        recorded = None
+        was_active = None
+        if not adding:
+            recorded = Sales.objects.select_for_update().filter(
+                pk=self.pk
+                ).values(*self.TRACKED_FIELDS, 'is_active').first()
+            if recorded is not None:
+                was_active = recorded.pop('is_active')
         super().save(*args, **kwargs)
 
+        DailySalesRollup.record_sales_change(
+            recorded, self.tracked_state(), reading=self.pump_reading
+            )
+
+        if adding:
+            kind = 'sales.created'
+        elif not self.is_active and was_active:
+            kind = 'sales.closed'
+        else:
+            kind = 'sales.updated'
+        publish(self.station_id, (kind, self.event_data()))
+
         if not self.is_active:
             with transaction.atomic():
                 pump_reading = self.pump_reading
                 if pump_reading.status != 'COMPLETED':
                     pump_reading.status = 'COMPLETED'
                     pump_reading.save()
+
+    @classmethod
+    @traced('Sales.close_shift')
+    @transaction.atomic
+    def close_shift(cls, station_id, figures):
+        """
+        Close every active sale of a station at once.
+
+        Each attendant's figures for the shift are spread over their sales
+        in proportion to the amount each pump reading sold, in cents, so
+        they add up to exactly what was counted. Attendants without figures
+        keep the ones recorded on their sales. Sales and their readings are
+        updated with one batched UPDATE per table, inside a single
+        transaction, and the readings get pit readings as when closed one
+        by one.
+
+        Args:
+            station_id: The station whose shift is being closed.
+            figures (dict): Maps attendant ids to dicts with the 'cash',
+                'transfer', 'pos' and 'expenses' they handed in.
+
+        Returns:
+            dict: The number of 'readings' completed, and per 'attendant'
+                and station 'totals' of the closed sales.
+
+        Raises:
+            ValidationError: If figures are given for an attendant with no
+                active sales at the station.
+        """
+        from pit.models import Pit, PitReading, PitStockLedger
+        from product.models import Pump, PumpReading
+
+        # Locked in the order Sales.save locks them: sales, then readings
+        sales = list(cls.objects.select_for_update(of=('self',)).filter(
+            station_id=station_id, is_active=True
+            ).select_related('attendant').order_by('timestamp', 'id'))
+        readings = PumpReading.objects.select_for_update().filter(
+            pk__in=[sale.pump_reading_id for sale in sales]
+            ).in_bulk()
+        current_span().set(station=station_id, sales=len(sales))
+        by_attendant = {}
+        for sale in sales:
+            sale.pump_reading = readings[sale.pump_reading_id]
+            by_attendant.setdefault(sale.attendant_id, []).append(sale)
+        for attendant_id in figures:
+            if attendant_id not in by_attendant:
+                raise ValidationError(
+                    f"Attendant {attendant_id} has no active sales "
+                    "at this station."
+                    )
+
+        if not sales:
+            return cls.shift_summary(sales, 0)
+
+        recorded = [sale.tracked_state() for sale in sales]
+        now = timezone.now()
+        for attendant_id, attendant_sales in by_attendant.items():
+            if attendant_id in figures:
+                weights = [
+                    max(sale.pump_reading.amount, 0)
+                    for sale in attendant_sales
+                ]
+                for field in cls.FIGURE_FIELDS:
+                    shares = cls.apportion(
+                        figures[attendant_id].get(field, Decimal(0)), weights
+                        )
+                    for sale, share in zip(attendant_sales, shares):
+                        setattr(sale, field, share)
+            for sale in attendant_sales:
+                cash_flow = sum(
+                    Decimal(getattr(sale, field))
+                    for field in cls.FIGURE_FIELDS
+                    )
+                # Rounded as stored, so the rollups match the rows
+                sale.shortage_or_excess = (
+                    sale.pump_reading.amount - cash_flow
+                    ).quantize(Decimal('0.01'))
+                sale.is_active = False
+                # bulk_update leaves auto_now fields alone
+                sale.updated_at = now
+        cls.objects.bulk_update(sales, [
+            *cls.FIGURE_FIELDS, 'shortage_or_excess', 'is_active', 'updated_at'
+            ])
+
+        closed = [
+            reading for reading in readings.values()
+            if reading.status != 'COMPLETED'
+        ]
+        PumpReading.objects.filter(
+            pk__in=[reading.pk for reading in closed]
+            ).update(status='COMPLETED', updated_at=now)
+        for reading in closed:
+            reading.status = 'COMPLETED'
+            reading.updated_at = now
+
+        # One rollup write per (day, product, attendant) instead of per sale
+        scopes = {
+            pump_id: (station_id, product_id, tz_name)
+            for pump_id, product_id, tz_name in Pump.objects.filter(
+                pk__in={reading.pump_id for reading in readings.values()}
+                ).values_list('id', 'product_type_id', 'station__timezone')
+        }
+        rollup_deltas = {}
+        for sale, previous in zip(sales, recorded):
+            for state, sign in ((previous, -1), (sale.tracked_state(), 1)):
+                contribution = DailySalesRollup.sales_contribution(
+                    state, scopes, sale.pump_reading
+                    )
+                if contribution is None:
+                    # The pump is gone, and its rollups with it
+                    continue
+                key, totals = contribution
+                delta = rollup_deltas.setdefault(key, {})
+                for field, value in totals.items():
+                    delta[field] = delta.get(field, 0) + sign * value
+        DailySalesRollup.record_deltas(rollup_deltas)
+
+        pit_ids = dict(Pump.objects.filter(
+            pk__in={reading.pump_id for reading in closed}
+            ).values_list('id', 'pump_pit_id'))
+        pits = Pit.objects.in_bulk(set(pit_ids.values()))
+        liters_dispensed = PitStockLedger.liters_dispensed_for_pits(pits)
+        pit_readings = []
+        for reading in closed:
+            pit = pits.get(pit_ids.get(reading.pump_id))
+            if pit is None:
+                continue
+            opening_stock = pit.current_volume
+            pit_readings.append(PitReading(
+                reading_pit=pit,
+                opening_stock=opening_stock,
+                closing_stock=(
+                    Decimal(opening_stock) - liters_dispensed[pit.id]
+                    )
+                ))
+        PitReading.objects.bulk_create(pit_readings)
+
+        bump_station_data(station_id)
+        publish(
+            station_id,
+            *[('sales.closed', sale.event_data()) for sale in sales],
+            *[('reading.closed', reading.event_data()) for reading in closed],
+            *[('pit.reading', pit_reading.event_data())
+              for pit_reading in pit_readings]
+            )
+        return cls.shift_summary(sales, len(closed))
+
+    @staticmethod
+    def apportion(total, weights):
+        """
+        Split a total into cents in proportion to weights. Shares are
+        rounded down and the last one takes what is left, so they always
+        add up to the total; equal weights are used if all are zero.
+        """
+        if not any(weights):
+            weights = [1] * len(weights)
+        weight_sum = sum(weights)
+        shares = [
+            (total * weight / weight_sum).quantize(
+                Decimal('0.01'), rounding=ROUND_DOWN
+                )
+            for weight in weights[:-1]
+        ]
+        shares.append(total - sum(shares))
+        return shares
+
+    @staticmethod
+    def shift_summary(sales, readings):
+        """Per attendant and station totals of a closed shift's sales."""
+        def totals(group):
+            return {
+                'sales': len(group),
+                'liters_sold': sum(
+                    (sale.pump_reading.liters_sold for sale in group),
+                    Decimal(0)
+                    ),
+                'amount': sum(
+                    (sale.pump_reading.amount for sale in group), Decimal(0)
+                    ),
+                **{
+                    field: sum(
+                        (Decimal(getattr(sale, field)) for sale in group),
+                        Decimal(0)
+                        )
+                    for field in DailySalesRollup.SALES_FIELDS
+                },
+            }
+
+        by_attendant = {}
+        for sale in sales:
+            by_attendant.setdefault(sale.attendant, []).append(sale)
+        return {
+            'readings': readings,
+            'attendants': [
+                {
+                    'attendant': attendant.id,
+                    'attendant_name': attendant.name,
+                    **totals(attendant_sales),
+                }
+                for attendant, attendant_sales in sorted(
+                    by_attendant.items(), key=lambda item: item[0].name
+                    )
+            ],
+            'totals': totals(sales),
+        }
+
+
+class DailySalesRollup(models.Model):
+    """
+    Sales and volume totals for one station, local day, product and
+    attendant.
+
+    Rows are kept current by applying the difference every saved or
+    deleted PumpReading and Sales record makes, once its transaction
+    commits. Days are the station's local days.
+    """
+    READING_FIELDS = ('readings', 'liters_sold', 'amount')
+    SALES_FIELDS = (
+        'cash', 'transfer', 'pos', 'expenses', 'shortage_or_excess'
+    )
+    FIELDS = READING_FIELDS + SALES_FIELDS
+
+    id = models.UUIDField(
+        default=uuid4,
+        editable=False,
+        unique=True,
+        primary_key=True)
+    station = models.ForeignKey(
+        'station.Station',
+        on_delete=models.CASCADE,
+        related_name='daily_rollups'
+        )
+    date = models.DateField()
+    product = models.ForeignKey(
+        'product.Product',
+        on_delete=models.CASCADE,
+        related_name='daily_rollups'
+        )
+    attendant = models.ForeignKey(
+        'station_attendant.Attendant',
+        on_delete=models.CASCADE,
+        related_name='daily_rollups'
+        )
+    readings = models.IntegerField(default=0)
+    liters_sold = models.DecimalField(
+        max_digits=20,
+        decimal_places=2,
+        default=0
+        )
+    # Liters times rate, kept exact so rollups always equal the history
+    amount = models.DecimalField(
+        max_digits=24,
+        decimal_places=4,
+        default=0
+        )
+    cash = models.DecimalField(
+        max_digits=20,
+        decimal_places=2,
+        default=0
+        )
+    transfer = models.DecimalField(
+        max_digits=20,
+        decimal_places=2,
+        default=0
+        )
+    pos = models.DecimalField(
+        max_digits=20,
+        decimal_places=2,
+        default=0
+        )
+    expenses = models.DecimalField(
+        max_digits=20,
+        decimal_places=2,
+        default=0
+        )
+    shortage_or_excess = models.DecimalField(
+        max_digits=20,
+        decimal_places=2,
+        default=0
+        )
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['station', 'date', 'product', 'attendant'],
+                name='unique_daily_sales_rollup'
+                ),
+        ]
+
+    @staticmethod
+    def pump_scope(pump_id, scopes):
+        """
+        Return a pump's (station id, product id, station time zone), or
+        None if the pump no longer exists.
+
+        Args:
+            scopes (dict): Lookups already made, shared across calls.
+        """
+        from product.models import Pump
+
+        if pump_id not in scopes:
+            scopes[pump_id] = Pump.objects.filter(pk=pump_id).values_list(
+                'station_id', 'product_type_id', 'station__timezone'
+                ).first()
+        return scopes[pump_id]
+
+    @classmethod
+    def rollup_key(cls, pump_id, attendant_id, timestamp, scopes):
+        scope = cls.pump_scope(pump_id, scopes)
+        if scope is None or timestamp is None:
+            return None
+        station_id, product_id, tz_name = scope
+        date = timezone.localdate(timestamp, ZoneInfo(tz_name))
+        return (station_id, date, product_id, attendant_id)
+
+    @classmethod
+    def reading_contribution(cls, state, scopes):
+        """The (key, totals) a PumpReading's tracked state adds."""
+        if not state:
+            return None
+        key = cls.rollup_key(
+            state['pump_id'], state['attendant_id'], state['timestamp'],
+            scopes
+            )
+        if key is None:
+            return None
+        liters_sold = Decimal(str(state['closing_meter'])) - Decimal(
+            str(state['opening_meter'])
+            )
+        return key, {
+            'readings': 1,
+            'liters_sold': liters_sold,
+            'amount': liters_sold * Decimal(str(state['rate'])),
+        }
+
+    @classmethod
+    def sales_contribution(cls, state, scopes, reading=None):
+        """
+        The (key, totals) a Sales record's tracked state adds. The day and
+        product come from its pump reading, which is read from the
+        database unless the loaded one is passed in.
+        """
+        if not state:
+            return None
+        if reading is not None and reading.pk == state['pump_reading_id']:
+            origin = (reading.pump_id, reading.timestamp)
+        else:
+            from product.models import PumpReading
+            origin = PumpReading.objects.filter(
+                pk=state['pump_reading_id']
+                ).values_list('pump_id', 'timestamp').first()
+        if origin is None:
+            return None
+        key = cls.rollup_key(origin[0], state['attendant_id'], origin[1], scopes)
+        if key is None:
+            return None
+        return key, {
+            field: Decimal(str(state[field] or 0))
+            for field in cls.SALES_FIELDS
+        }
+
+    @classmethod
+    def record_reading_change(cls, previous, current):
+        """Apply the change between two PumpReading tracked states."""
+        scopes = {}
+        cls.record_change(
+            cls.reading_contribution(previous, scopes),
+            cls.reading_contribution(current, scopes)
+            )
+
+    @classmethod
+    def record_sales_change(cls, previous, current, reading=None):
+        """Apply the change between two Sales tracked states."""
+        scopes = {}
+        cls.record_change(
+            cls.sales_contribution(previous, scopes, reading),
+            cls.sales_contribution(current, scopes, reading)
+            )
+
+    @classmethod
+    def record_change(cls, previous, current):
+        """
+        Move totals from the previous contribution to the current one once
+        the surrounding transaction commits.
+
+        Args:
+            previous: A (key, totals) pair no longer held, or None.
+            current: A (key, totals) pair now held, or None.
+        """
+        deltas = {}
+        for contribution, sign in ((previous, -1), (current, 1)):
+            if contribution is None:
+                continue
+            key, totals = contribution
+            delta = deltas.setdefault(key, {})
+            for field, value in totals.items():
+                delta[field] = delta.get(field, 0) + sign * value
+        cls.record_deltas(deltas)
+
+    @classmethod
+    def record_deltas(cls, deltas):
+        """
+        Add per-key deltas to the rollups once the surrounding transaction
+        commits, so rolled back writes never reach them.
+
+        Args:
+            deltas (dict): Maps (station id, date, product id, attendant id)
+                to a dict of field deltas.
+        """
+        deltas = {
+            key: {field: value for field, value in delta.items() if value}
+            for key, delta in deltas.items()
+        }
+        deltas = {key: delta for key, delta in deltas.items() if delta}
+        if deltas:
+            transaction.on_commit(lambda: cls.apply_deltas(deltas))
+
+    @classmethod
+    def apply_deltas(cls, deltas):
+        for (station_id, date, product_id, attendant_id), delta in (
+                deltas.items()):
+            rows = cls.objects.filter(
+                station_id=station_id,
+                date=date,
+                product_id=product_id,
+                attendant_id=attendant_id
+                )
+            changes = {field: F(field) + value for field, value in delta.items()}
+            changes['updated_at'] = timezone.now()
+            if rows.update(**changes):
+                continue
+            try:
+                with transaction.atomic():
+                    cls.objects.create(
+                        station_id=station_id,
+                        date=date,
+                        product_id=product_id,
+                        attendant_id=attendant_id,
+                        **delta
+                        )
+            except IntegrityError:
+                # Either a concurrent writer created the row first, or the
+                # station, product or attendant is gone with its rollups
+                rows.update(**changes)
+
+    @classmethod
+    def aggregate(cls, station):
+        """
+        Compute a station's rollups from its full reading and sales history.
+
+        Returns:
+            dict: Maps (date, product id, attendant id) to a dict of totals.
+        """
+        from product.models import PumpReading
+
+        tzinfo = ZoneInfo(station.timezone)
+        liters_sold = F('closing_meter') - F('opening_meter')
+        totals = {}
+
+        readings = PumpReading.objects.filter(pump__station=station).annotate(
+            date=TruncDate('timestamp', tzinfo=tzinfo)
+            ).values('date', 'pump__product_type_id', 'attendant_id').annotate(
+                total_readings=Count('id'),
+                total_liters_sold=Sum(liters_sold),
+                total_amount=Sum(liters_sold * F('rate')),
+                ).order_by()
+        for row in readings:
+            key = (row['date'], row['pump__product_type_id'],
+                   row['attendant_id'])
+            totals.setdefault(key, {}).update({
+                field: row[f'total_{field}'] or 0
+                for field in cls.READING_FIELDS
+            })
+
+        sales = Sales.objects.filter(
+            pump_reading__pump__station=station
+            ).annotate(
+                date=TruncDate('pump_reading__timestamp', tzinfo=tzinfo)
+                ).values(
+                    'date', 'pump_reading__pump__product_type_id',
+                    'attendant_id'
+                    ).annotate(
+                        **{f'total_{field}': Sum(field)
+                           for field in cls.SALES_FIELDS}
+                        ).order_by()
+        for row in sales:
+            key = (row['date'], row['pump_reading__pump__product_type_id'],
+                   row['attendant_id'])
+            totals.setdefault(key, {}).update({
+                field: row[f'total_{field}'] or 0
+                for field in cls.SALES_FIELDS
+            })
+        return totals
+
+    @classmethod
+    @transaction.atomic
+    def rebuild(cls, station_ids=None):
+        """
+        Recompute rollups from history, replacing the stored rows.
+
+        Args:
+            station_ids (list): Only rebuild these stations. Defaults to all.
+
+        Returns:
+            list: The rebuilt DailySalesRollup rows.
+        """
+        from station.models import Station
+
+        stations = Station.objects.all()
+        if station_ids is not None:
+            stations = stations.filter(id__in=station_ids)
+
+        rollups = []
+        for station in stations:
+            cls.objects.filter(station=station).delete()
+            rollups.extend(
+                cls(
+                    station=station,
+                    date=date,
+                    product_id=product_id,
+                    attendant_id=attendant_id,
+                    **totals
+                    )
+                for (date, product_id, attendant_id), totals
+                in cls.aggregate(station).items()
+                )
+        return cls.objects.bulk_create(rollups)
+
+
+@receiver(post_delete, sender=Sales)
+def release_sales_rollup(sender, instance, **kwargs):
+    """Take a deleted sale's totals back out of its daily rollup."""
+    DailySalesRollup.record_sales_change(instance.tracked_state(), None)
+
+
+@receiver(post_delete, sender=Sales)
+def bury_sale(sender, instance, **kwargs):
+    """Tell devices syncing the station to drop the sale."""
+    Tombstone.record(instance.station_id, 'sales', instance.pk)
+
+
+track_station_data(Sales, attrgetter('station_id'))
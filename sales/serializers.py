@@ -1,12 +1,17 @@
+from decimal import Decimal
 from rest_framework import serializers
-from sales.models import Sales
-from product.models import PumpReading
-from station_attendant.models import Attendant
+from sales.models import DailySalesRollup, Sales
 
 
 class SalesSerializer(serializers.ModelSerializer):
-    pump_reading_name = serializers.SerializerMethodField()
-    attendant_name = serializers.SerializerMethodField()
+    pump_reading_name = serializers.CharField(
+        source='pump_reading.pump.name',
+        read_only=True
+        )
+    attendant_name = serializers.CharField(
+        source='attendant.name',
+        read_only=True
+        )
 
     class Meta:
         model = Sales
@@ -25,13 +30,141 @@ class SalesSerializer(serializers.ModelSerializer):
             'updated_at'
             ]
 
-    def get_attendant_name(self, obj):
-        return obj.attendant.name if obj.attendant else None
 
-    def get_pump_reading_name(self, obj):
-        try:
-            pump_reading = PumpReading.objects.get(id=obj.pump_reading_id)
-            pump_name = pump_reading.pump.name
-            return pump_name
-        except PumpReading.DoesNotExist:
-            return "PumpReading not found"
+class SyncSalesSerializer(SalesSerializer):
+    """A sales record with the ids devices link it by."""
+
+    class Meta(SalesSerializer.Meta):
+        fields = [*SalesSerializer.Meta.fields, 'pump_reading', 'attendant']
+        read_only_fields = fields
+
+
+class DailySalesRollupSerializer(serializers.ModelSerializer):
+    product_name = serializers.CharField(
+        source='product.name',
+        read_only=True
+        )
+    attendant_name = serializers.CharField(
+        source='attendant.name',
+        read_only=True
+        )
+
+    class Meta:
+        model = DailySalesRollup
+        fields = [
+            'date',
+            'product',
+            'product_name',
+            'attendant',
+            'attendant_name',
+            'readings',
+            'liters_sold',
+            'amount',
+            'cash',
+            'transfer',
+            'pos',
+            'expenses',
+            'shortage_or_excess',
+            'updated_at'
+            ]
+
+
+class SalesAnalyticsSerializer(serializers.Serializer):
+    """One bucket (and optional group) of SalesView.analytics totals."""
+    period = serializers.DateTimeField()
+    group_id = serializers.UUIDField(required=False)
+    group_name = serializers.CharField(required=False)
+    readings = serializers.IntegerField()
+    liters_sold = serializers.DecimalField(max_digits=20, decimal_places=2)
+    revenue = serializers.DecimalField(max_digits=24, decimal_places=4)
+    total_cash = serializers.DecimalField(max_digits=20, decimal_places=2)
+    total_transfer = serializers.DecimalField(
+        max_digits=20,
+        decimal_places=2
+        )
+    total_pos = serializers.DecimalField(max_digits=20, decimal_places=2)
+    total_expenses = serializers.DecimalField(
+        max_digits=20,
+        decimal_places=2
+        )
+    total_shortage_or_excess = serializers.DecimalField(
+        max_digits=20,
+        decimal_places=2
+        )
+
+
+class DailySalesTotalsSerializer(serializers.Serializer):
+    """A station's daily rollups summed over one day."""
+    date = serializers.DateField()
+    open_shifts = serializers.IntegerField()
+    readings = serializers.IntegerField()
+    liters_sold = serializers.DecimalField(max_digits=20, decimal_places=2)
+    amount = serializers.DecimalField(max_digits=24, decimal_places=4)
+    cash = serializers.DecimalField(max_digits=20, decimal_places=2)
+    transfer = serializers.DecimalField(max_digits=20, decimal_places=2)
+    pos = serializers.DecimalField(max_digits=20, decimal_places=2)
+    expenses = serializers.DecimalField(max_digits=20, decimal_places=2)
+    shortage_or_excess = serializers.DecimalField(
+        max_digits=20,
+        decimal_places=2
+        )
+
+
+class ShiftFiguresSerializer(serializers.Serializer):
+    """What one attendant handed in at the end of a shift."""
+    attendant = serializers.UUIDField()
+    cash = serializers.DecimalField(
+        max_digits=10, decimal_places=2, min_value=Decimal('0'), default=0
+        )
+    transfer = serializers.DecimalField(
+        max_digits=10, decimal_places=2, min_value=Decimal('0'), default=0
+        )
+    pos = serializers.DecimalField(
+        max_digits=10, decimal_places=2, min_value=Decimal('0'), default=0
+        )
+    expenses = serializers.DecimalField(
+        max_digits=10, decimal_places=2, min_value=Decimal('0'), default=0
+        )
+
+
+class CloseShiftSerializer(serializers.Serializer):
+    """
+    Serializer for closing every active sale of a station at once.
+    Attendants left out keep the figures recorded on their sales.
+    """
+    figures = ShiftFiguresSerializer(many=True, default=list)
+
+    def validate_figures(self, value):
+        attendant_ids = [figures['attendant'] for figures in value]
+        if len(attendant_ids) != len(set(attendant_ids)):
+            raise serializers.ValidationError(
+                "Each attendant can only hand in one set of figures."
+                )
+        return value
+
+
+class ShiftTotalsSerializer(serializers.Serializer):
+    """Totals of the sales closed with a shift."""
+    sales = serializers.IntegerField()
+    liters_sold = serializers.DecimalField(max_digits=20, decimal_places=2)
+    amount = serializers.DecimalField(max_digits=24, decimal_places=4)
+    cash = serializers.DecimalField(max_digits=20, decimal_places=2)
+    transfer = serializers.DecimalField(max_digits=20, decimal_places=2)
+    pos = serializers.DecimalField(max_digits=20, decimal_places=2)
+    expenses = serializers.DecimalField(max_digits=20, decimal_places=2)
+    shortage_or_excess = serializers.DecimalField(
+        max_digits=20,
+        decimal_places=2
+        )
+
+
+class AttendantShiftTotalsSerializer(ShiftTotalsSerializer):
+    attendant = serializers.UUIDField()
+    attendant_name = serializers.CharField()
+
+
+class ShiftReconciliationSerializer(serializers.Serializer):
+    """The summary SalesView.close_shift returns."""
+    readings = serializers.IntegerField()
+    attendants = AttendantShiftTotalsSerializer(many=True)
+    totals = ShiftTotalsSerializer()
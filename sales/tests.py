@@ -1,3 +1,41 @@
-from django.test import TestCase
+import json
+from base64 import urlsafe_b64encode
+from django.test import TestCase, override_settings
+from sales.models import Sales
+from service.testing import (
+    LOCAL_CACHES, FlatQueriesMixin, add_readings, api_client, create_station
+)
 
-# Create your tests here.
+
+@override_settings(CACHES=LOCAL_CACHES)
+class SalesQueryCountTests(FlatQueriesMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.fixture = create_station()
+        add_readings(cls.fixture, cls.small_rows)
+
+    def test_queries_do_not_grow_with_sales(self):
+        fixture = self.fixture
+        sale = Sales.objects.first()
+        urls = [
+            '/api/v1/sales?page_size=500',
+            f'/api/v1/sales/{sale.id}',
+            f'/api/v1/sales/station/{fixture.station.id}?page_size=500',
+            f'/api/v1/sales/pump/{fixture.pump.id}?page_size=500',
+            f'/api/v1/sales/attendant/{fixture.attendant.id}?page_size=500',
+        ]
+        self.assertFlatQueries(
+            api_client(fixture.manager), urls,
+            lambda rows: add_readings(fixture, rows)
+            )
+
+    def test_cursor_with_a_bad_id_is_not_found(self):
+        cursor = urlsafe_b64encode(json.dumps({
+            'p': '2024-01-01T00:00:00+00:00', 'id': 'abc'
+        }).encode()).decode()
+        response = api_client(self.fixture.manager).get(
+            f'/api/v1/sales/station/{self.fixture.station.id}',
+            {'cursor': cursor}
+            )
+        self.assertEqual(response.status_code, 404)
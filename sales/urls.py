@@ -1,5 +1,5 @@
 from django.urls import path
-from sales.views import SalesView
+from sales.views import SalesByStationAsyncView, SalesView
 
 sales_list = SalesView.as_view({
     'get': 'list',
@@ -23,6 +23,22 @@ sales_by_attendant = SalesView.as_view({
     'get': 'by_attendant',
 })
 
+sales_close_shift = SalesView.as_view({
+    'post': 'close_shift',
+})
+
+sales_rollups = SalesView.as_view({
+    'get': 'rollups',
+})
+
+sales_analytics = SalesView.as_view({
+    'get': 'analytics',
+})
+
+sales_export = SalesView.as_view({
+    'get': 'export',
+})
+
 urlpatterns = [
     path('sales', sales_list, name='sales-list'),
     path('sales/<uuid:pk>', sales_retrieve_update, name='sales-detail'),
@@ -31,4 +47,14 @@ urlpatterns = [
     path('sales/pump/<uuid:pump_id>', sales_by_pump, name='sales-by-pump'),
     path('sales/attendant/<uuid:attendant_id>',
          sales_by_attendant, name='sales-by-attendant'),
+    path('sales/station/<uuid:station_id>/close_shift',
+         sales_close_shift, name='sales-close-shift'),
+    path('sales/rollups/station/<uuid:station_id>',
+         sales_rollups, name='sales-rollups'),
+    path('sales/analytics/station/<uuid:station_id>',
+         sales_analytics, name='sales-analytics'),
+    path('sales/export/station/<uuid:station_id>',
+         sales_export, name='sales-export'),
+    path('async/sales/station/<uuid:station_id>',
+         SalesByStationAsyncView.as_view(), name='async-sales-by-station'),
 ]
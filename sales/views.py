@@ -1,29 +1,80 @@
 from rest_framework import viewsets, serializers, permissions
+from rest_framework.exceptions import PermissionDenied
 from rest_framework.response import Response
-from sales.models import Sales
-from sales.serializers import SalesSerializer
+from django.db.models import (
+    Count, DecimalField, ExpressionWrapper, F, Sum
+)
+from django.db.models.functions import Trunc
+from django.utils import timezone
+from sales.models import DailySalesRollup, Sales
+from sales.serializers import (
+    CloseShiftSerializer, DailySalesRollupSerializer,
+    SalesAnalyticsSerializer, SalesSerializer, ShiftReconciliationSerializer
+)
+from product.models import Pump
 from station_attendant.models import Attendant
-from manager.models import Manager
-from django.core.exceptions import ObjectDoesNotExist
+from django.core.exceptions import ValidationError
+from django.db import DatabaseError
 from django.core.cache import cache
 from owner.permissions import (
-    IsAuthenticatedManager, IsAuthenticatedAttendant, IsStationOwner
+    IsAuthenticatedManager, IsAuthenticatedAttendant, IsAuthenticatedOwner,
+    IsStationOwner, works_at_station
 )
-from product.models import PumpReading
+from service.async_views import AsyncStationListView
+from service.claims import token_claims
+from service.conditional import CachedListMixin
+from service.exports import csv_response
+from service.pagination import KeysetPaginatedMixin
+from service.reports import ReportingMixin
+from service.tracing import current_span, traced
 import logging as logger
 
 
-class SalesView(viewsets.ModelViewSet):
-    queryset = Sales.objects.all()
+class SalesView(CachedListMixin, ReportingMixin, KeysetPaginatedMixin,
+                viewsets.ModelViewSet):
+    queryset = Sales.objects.select_related('pump_reading__pump', 'attendant')
     serializer_class = SalesSerializer
+    etag_actions = {
+        'list': None,
+        'by_station': 'station_id',
+        'by_pump': ('pump_id', Pump),
+        'by_attendant': ('attendant_id', Attendant),
+    }
+    # Longest date range one rollups request may cover
+    max_rollup_days = 366
+    # Longest date range one export may cover
+    max_export_days = 366
+    # Analytics bucket sizes and the longest range each may cover, in days
+    analytics_buckets = {'hour': 31, 'day': 366, 'week': 366, 'month': 366}
+    # Analytics groupings and the (id, name) fields they group by
+    analytics_groups = {
+        'product': (
+            'pump_reading__pump__product_type_id',
+            'pump_reading__pump__product_type__name'
+        ),
+        'pump': ('pump_reading__pump_id', 'pump_reading__pump__name'),
+        'attendant': ('attendant_id', 'attendant__name'),
+    }
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        # ?is_active=true narrows a list to sales not yet closed
+        is_active = self.request.query_params.get('is_active')
+        if is_active is not None:
+            queryset = queryset.filter(is_active=is_active.lower() == 'true')
+        return queryset
 
     def get_permissions(self):
-        if self.action == 'create':
+        if self.action in ('create', 'close_shift'):
             return [IsAuthenticatedManager()]
         elif self.action == 'list':
             return [permissions.OR(
                     IsAuthenticatedManager(), IsStationOwner()
                     )]
+        elif self.action in ('rollups', 'analytics', 'export'):
+            return [permissions.OR(
+                    IsAuthenticatedManager(), IsAuthenticatedOwner()
+                    )]
         elif self.action == 'retrieve':
             return [permissions.OR(
                     IsAuthenticatedManager(), IsAuthenticatedAttendant()
@@ -38,45 +89,228 @@ class SalesView(viewsets.ModelViewSet):
         else:
             return super().get_permissions()
 
+    @traced('SalesView.perform_update')
     def perform_update(self, serializer):
         sales_instance = self.get_object()
+        current_span().set(fields=sorted(self.request.data))
         if 'is_active' in self.request.data:
-            print(self.request.data)
             user = self.request.user
-            manager = Manager.objects.filter(pk=user.pk).exists()
+            manager = token_claims(self.request).get('role') == 'manager'
             if not user.is_authenticated or not manager:
                 raise serializers.ValidationError(
                     "Only managers can close the sales."
                     )
             sales_instance.is_active = self.request.data['is_active']
             sales_instance.save()
-        try:
-            attendant = Attendant.objects.get(user_ptr_id=self.request.user.id)
-            serializer.save(attendant=attendant)
-        except ObjectDoesNotExist:
+        if token_claims(self.request).get('role') == 'attendant':
+            serializer.save(attendant=self.request.user.role_user)
+        else:
             serializer.save()
 
     def by_station(self, request, station_id=None):
         try:
-            sales = Sales.objects.filter(station__id=station_id)
-            serializer = self.get_serializer(sales, many=True)
-            return Response(serializer.data)
-        except Exception as e:
+            sales = self.get_queryset().filter(station__id=station_id)
+            return self.paginated_response(sales)
+        except DatabaseError:
             return Response({"error": "Error fetching sales"}, status=500)
 
     def by_pump(self, request, pump_id=None):
         try:
-            pump_readings = PumpReading.objects.filter(pump_id=pump_id)
-            sales = Sales.objects.filter(pump_reading__in=pump_readings)
-            serializer = self.get_serializer(sales, many=True)
-            return Response(serializer.data)
-        except Exception as e:
+            sales = self.get_queryset().filter(pump_reading__pump_id=pump_id)
+            return self.paginated_response(sales)
+        except DatabaseError:
             return Response({"error": "Error fetching sales"}, status=500)
 
     def by_attendant(self, request, attendant_id=None):
         try:
-            sales = Sales.objects.filter(attendant__id=attendant_id)
-            serializer = self.get_serializer(sales, many=True)
-            return Response(serializer.data)
-        except Exception as e:
+            sales = self.get_queryset().filter(attendant__id=attendant_id)
+            return self.paginated_response(sales)
+        except DatabaseError:
             return Response({"error": "Error fetching sales"}, status=500)
+
+    def close_shift(self, request, station_id=None):
+        """
+        Close every active sale of the manager's station in one
+        transaction, spreading each attendant's handed in figures over
+        their sales, and return the shift's reconciliation.
+        """
+        if not works_at_station(request, 'manager', station_id):
+            raise PermissionDenied("You do not manage this station.")
+
+        serializer = CloseShiftSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        figures = {
+            attendant_figures.pop('attendant'): attendant_figures
+            for attendant_figures in serializer.validated_data['figures']
+        }
+        try:
+            summary = Sales.close_shift(station_id, figures)
+        except ValidationError as e:
+            raise serializers.ValidationError(e.messages)
+
+        return Response(ShiftReconciliationSerializer(summary).data)
+
+    def rollups(self, request, station_id=None):
+        """
+        Daily totals per product and attendant for one station.
+
+        Reads the pre-aggregated rollups for the station's local days
+        between the 'start' and 'end' query parameters.
+        """
+        station = self.reporting_station(request, station_id)
+        start, end = self.reporting_dates(
+            request, station, self.max_rollup_days
+            )
+
+        rollups = DailySalesRollup.objects.filter(
+            station=station,
+            date__range=(start, end)
+            ).select_related('product', 'attendant').order_by(
+                'date', 'product__name', 'attendant__name'
+                )
+        serializer = DailySalesRollupSerializer(rollups, many=True)
+        return Response(serializer.data)
+
+    def analytics(self, request, station_id=None):
+        """
+        Sales totals for one station in hour, day, week or month buckets.
+
+        Everything is aggregated by the database over the station's
+        (station, timestamp) index, so no reading is loaded into Python.
+
+        Query parameters:
+            bucket: 'hour', 'day' (default), 'week' or 'month', in the
+                station's time zone.
+            group_by: Optionally 'product', 'pump' or 'attendant'.
+            start, end: Inclusive local dates; 'hour' buckets may span at
+                most 31 days, the others a year.
+        """
+        station = self.reporting_station(request, station_id)
+        bucket = request.query_params.get('bucket', 'day')
+        if bucket not in self.analytics_buckets:
+            raise serializers.ValidationError(
+                f"bucket must be one of {', '.join(self.analytics_buckets)}."
+                )
+        group_by = request.query_params.get('group_by')
+        if group_by and group_by not in self.analytics_groups:
+            raise serializers.ValidationError(
+                f"group_by must be one of {', '.join(self.analytics_groups)}."
+                )
+        start, end = self.reporting_dates(
+            request, station, self.analytics_buckets[bucket]
+            )
+
+        tzinfo = station.tzinfo
+        sales = Sales.objects.filter(
+            station=station,
+            **self.reporting_period(station, start, end)
+            ).annotate(period=Trunc('timestamp', bucket, tzinfo=tzinfo))
+
+        group = ['period']
+        if group_by:
+            id_field, name_field = self.analytics_groups[group_by]
+            sales = sales.annotate(
+                group_id=F(id_field), group_name=F(name_field)
+                )
+            group += ['group_id', 'group_name']
+
+        liters_sold = (
+            F('pump_reading__closing_meter') - F('pump_reading__opening_meter')
+            )
+        totals = sales.values(*group).annotate(
+            readings=Count('id'),
+            liters_sold=Sum(
+                liters_sold,
+                output_field=DecimalField(max_digits=20, decimal_places=2)
+                ),
+            revenue=Sum(
+                liters_sold * F('pump_reading__rate'),
+                output_field=DecimalField(max_digits=24, decimal_places=4)
+                ),
+            total_cash=Sum('cash'),
+            total_transfer=Sum('transfer'),
+            total_pos=Sum('pos'),
+            total_expenses=Sum('expenses'),
+            total_shortage_or_excess=Sum('shortage_or_excess'),
+            ).order_by(*group)
+
+        # Periods are shown in the station's local time
+        with timezone.override(tzinfo):
+            results = SalesAnalyticsSerializer(totals, many=True).data
+        return Response({
+            'station': station.id,
+            'bucket': bucket,
+            'group_by': group_by,
+            'start': start,
+            'end': end,
+            'results': results,
+        })
+
+    def export(self, request, station_id=None):
+        """
+        Stream one station's sales between the 'start' and 'end' query
+        parameters as CSV, oldest first.
+
+        The computed liters_sold and amount columns come from each sale's
+        pump reading. Timestamps are in the station's time zone.
+
+        Query parameters:
+            start, end: Inclusive local dates, at most a year apart.
+            attendant: Optionally, one attendant's id.
+            is_active: Optionally 'true' or 'false'.
+        """
+        station = self.reporting_station(request, station_id)
+        start, end = self.reporting_dates(
+            request, station, self.max_export_days
+            )
+        sales = self.get_queryset().filter(
+            station=station,
+            **self.reporting_period(station, start, end)
+            )
+        attendant_id = self.reporting_attendant(request)
+        if attendant_id:
+            sales = sales.filter(attendant_id=attendant_id)
+
+        liters_sold = (
+            F('pump_reading__closing_meter') - F('pump_reading__opening_meter')
+            )
+        rows = sales.annotate(
+            liters_sold=ExpressionWrapper(
+                liters_sold,
+                output_field=DecimalField(max_digits=20, decimal_places=2)
+                ),
+            amount=ExpressionWrapper(
+                liters_sold * F('pump_reading__rate'),
+                output_field=DecimalField(max_digits=24, decimal_places=4)
+                ),
+            ).order_by('timestamp', 'id').values_list(
+                'id', 'timestamp', 'pump_reading_id',
+                'pump_reading__pump__name',
+                'pump_reading__pump__product_type__name',
+                'attendant_id', 'attendant__name',
+                'pump_reading__opening_meter', 'pump_reading__closing_meter',
+                'pump_reading__rate', 'liters_sold', 'amount',
+                'cash', 'transfer', 'pos', 'expenses', 'shortage_or_excess',
+                'is_active'
+                )
+        header = [
+            'id', 'timestamp', 'pump_reading', 'pump', 'product',
+            'attendant_id', 'attendant', 'opening_meter', 'closing_meter',
+            'rate', 'liters_sold', 'amount', 'cash', 'transfer', 'pos',
+            'expenses', 'shortage_or_excess', 'is_active'
+            ]
+
+        def format_row(row):
+            timestamp = timezone.localtime(row[1], station.tzinfo)
+            return (row[0], timestamp.isoformat(), *row[2:])
+
+        return csv_response(
+            request, f'sales-{station.id}-{start}-{end}.csv',
+            header, rows, format_row
+            )
+
+
+class SalesByStationAsyncView(AsyncStationListView):
+    """Async variant of SalesView.by_station."""
+    viewset_class = SalesView
+    station_lookup = 'station_id'
@@ -0,0 +1,98 @@
+"""
+Read-only async views for dashboards, served by the ASGI application.
+
+DRF views are synchronous, so under ASGI every request to them holds a
+worker thread from start to finish. These views are plain Django async
+views instead: they verify the access token from its claims, read with
+the async ORM and render the same JSON as their DRF counterparts, so one
+worker can keep many slow dashboard requests in flight at once.
+"""
+from django.http import HttpResponse
+from django.views import View
+from rest_framework.exceptions import (
+    APIException, NotAuthenticated, PermissionDenied
+)
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from owner.permissions import aowns_station, works_at_station
+from service.claims import atoken_claims
+
+
+class AsyncAPIView(View):
+    """
+    Base for async read views.
+
+    DRF exceptions raised by a handler are rendered as DRF renders them,
+    with the exception's status code.
+    """
+    http_method_names = ['get', 'options']
+
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            return await super().dispatch(request, *args, **kwargs)
+        except APIException as exc:
+            data = exc.detail
+            if not isinstance(data, (list, dict)):
+                data = {'detail': data}
+            return self.render(data, status=exc.status_code)
+
+    def render(self, data, status=200):
+        return HttpResponse(
+            JSONRenderer().render(data),
+            status=status,
+            content_type='application/json'
+        )
+
+    async def check_station_access(self, request, station_id):
+        """
+        Allow the station's owner and its manager, from the token's claims.
+
+        Raises:
+            NotAuthenticated: For requests without an access token.
+            PermissionDenied: For everyone else.
+        """
+        claims = await atoken_claims(request)
+        if not claims:
+            raise NotAuthenticated()
+        if works_at_station(request, 'manager', station_id):
+            return
+        if not await aowns_station(request, station_id):
+            raise PermissionDenied("You cannot view this station.")
+
+
+class AsyncStationListView(AsyncAPIView):
+    """
+    Async variant of a viewset's ``by_station`` action.
+
+    The viewset supplies the queryset, its query parameter filters, the
+    serializer and the keyset pagination, so both variants return the
+    same pages.
+
+    Attributes:
+        viewset_class: The DRF viewset whose list this view serves.
+        station_lookup (str): The queryset filter naming the station.
+    """
+    viewset_class = None
+    station_lookup = None
+
+    def get_viewset(self, request):
+        return self.viewset_class(
+            request=Request(request),
+            format_kwarg=None,
+            action='by_station',
+            args=self.args,
+            kwargs=self.kwargs
+        )
+
+    async def get(self, request, station_id):
+        await self.check_station_access(request, station_id)
+
+        viewset = self.get_viewset(request)
+        queryset = viewset.get_queryset().filter(
+            **{self.station_lookup: station_id}
+        )
+        page = await viewset.paginator.apaginate_queryset(
+            queryset, viewset.request, view=viewset
+        )
+        serializer = viewset.get_serializer(page, many=True)
+        return self.render(viewset.get_paginated_response(serializer.data).data)
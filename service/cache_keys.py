@@ -0,0 +1,179 @@
+"""
+Registry of every cache key the application uses.
+
+Keys live in namespaces owned by a user or a station. Each namespace
+has a version counter that is part of every key in it, so invalidating
+a namespace is a single INCR: the old keys become unreachable and
+expire on their own. Keys are never built by hand outside this module.
+
+Key layout::
+
+    gw:<kind>:<id>:v<version>:<name>
+"""
+import time
+from django.core.cache import cache
+from service.metrics import registry as metrics
+from service.tracing import span
+
+DEFAULT_TIMEOUT = 3600
+
+# Key names, formatted with the ids they describe
+STATION_ATTENDANT = 'attendant:{attendant_id}'
+STATION_PUMP = 'pump:{pump_id}'
+STATION_RESPONSE = 'response:{scope}:{variant}'
+USER_ACCOUNT = 'account'
+USER_PUMP_READINGS = 'pump_readings'
+USER_STATION_IDS = 'station_ids'
+
+# Told apart from a cached None
+MISSING = object()
+
+
+class CacheNamespace:
+    """
+    A versioned group of cache keys belonging to one user or station.
+
+    Attributes:
+        kind (str): 'user' or 'station'.
+        owner_id: The id of the user or station owning the namespace.
+    """
+
+    def __init__(self, kind, owner_id):
+        self.kind = kind
+        self.owner_id = owner_id
+        self._version = None
+
+    @property
+    def version_key(self):
+        return f"gw:{self.kind}:{self.owner_id}:version"
+
+    @property
+    def version(self):
+        """
+        The namespace's current version, fetched once per instance.
+
+        A namespace seen for the first time (or whose counter was evicted)
+        starts at the current time in milliseconds, so it can never reuse
+        a version whose keys are still cached.
+        """
+        if self._version is None:
+            with span('cache.version', namespace=self.kind):
+                version = cache.get(self.version_key)
+                if version is None:
+                    cache.add(
+                        self.version_key,
+                        int(time.time() * 1000),
+                        timeout=None
+                    )
+                    version = cache.get(self.version_key)
+            self._version = version
+        return self._version
+
+    def key(self, name, **ids):
+        """Build the full key for a registered key name."""
+        name = name.format(**ids)
+        return f"gw:{self.kind}:{self.owner_id}:v{self.version}:{name}"
+
+    def get(self, name, default=None, **ids):
+        key = self.key(name, **ids)
+        with span('cache.get', namespace=self.kind, key=name) as current:
+            value = cache.get(key, MISSING)
+            hit = value is not MISSING
+            current.set(hit=hit)
+        metrics.record_cache(self.kind, int(hit), int(not hit))
+        return value if hit else default
+
+    def get_many(self, names):
+        """
+        Fetch several keys in a single round trip.
+
+        Args:
+            names (dict): Maps a label to a (key name, ids) pair.
+
+        Returns:
+            dict: Maps each label to its cached value or None.
+        """
+        keys = {
+            label: self.key(name, **ids)
+            for label, (name, ids) in names.items()
+        }
+        with span('cache.get_many', namespace=self.kind, keys=len(keys)):
+            found = cache.get_many(list(keys.values()))
+        metrics.record_cache(self.kind, len(found), len(keys) - len(found))
+        return {label: found.get(key) for label, key in keys.items()}
+
+    def set(self, name, value, timeout=DEFAULT_TIMEOUT, **ids):
+        key = self.key(name, **ids)
+        with span('cache.set', namespace=self.kind, key=name):
+            cache.set(key, value, timeout=timeout)
+
+    def set_many(self, name, values, timeout=DEFAULT_TIMEOUT):
+        """
+        Warm many keys of one kind in a single round trip.
+
+        Args:
+            name (str): A registered key name with one placeholder.
+            values (dict): Maps placeholder values to the cached values.
+        """
+        field = name[name.index('{') + 1:name.index('}')]
+        entries = {
+            self.key(name, **{field: ident}): value
+            for ident, value in values.items()
+        }
+        with span('cache.set_many', namespace=self.kind, key=name):
+            cache.set_many(entries, timeout=timeout)
+
+    def invalidate(self):
+        """Drop every key in the namespace with one round trip."""
+        with span('cache.invalidate', namespace=self.kind) as current:
+            try:
+                self._version = cache.incr(self.version_key)
+            except ValueError:
+                # The counter was evicted; a fresh namespace is just as good
+                current.set(evicted=True)
+                self._version = None
+
+
+def station_event_sequence_key(station_id):
+    """
+    The id of the last event published to a station's stream.
+
+    Event keys live outside the versioned namespaces, so invalidating a
+    station's cache never drops events clients may still resume from.
+    """
+    return f"gw:events:{station_id}:seq"
+
+
+def station_event_key(station_id, event_id):
+    return f"gw:events:{station_id}:{event_id}"
+
+
+def blacklisted_token_key(jti):
+    """
+    Marks a refresh token as blacklisted until it expires. Outside the
+    user namespaces, so invalidating a user's cache never revives it.
+    """
+    return f"gw:blacklist:{jti}"
+
+
+def user_namespace(user_id):
+    """Keys describing what a user has loaded or may do."""
+    return CacheNamespace('user', user_id)
+
+
+def station_namespace(station_id):
+    """Keys describing a station's attendants and pumps."""
+    return CacheNamespace('station', station_id)
+
+
+# Owns the data version of lists that span every station
+ALL_STATIONS = 'all'
+
+
+def station_data_namespace(station_id):
+    """
+    Keys derived from a station's products, pumps, pits, readings and
+    sales, such as cached list responses. Its version is the station's
+    data version: it moves on every committed change to them.
+    """
+    return CacheNamespace('data', station_id)
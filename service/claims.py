@@ -0,0 +1,256 @@
+from uuid import uuid4
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.utils.functional import cached_property
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.models import TokenUser
+
+
+def scope_claims(user):
+    """
+    Return the role and station-scope claims to sign into a user's tokens.
+
+    Owners carry the ids of the stations they own, managers and
+    attendants the id of the station they work at and the version of
+    that assignment (see revoke_scope).
+    """
+    role = getattr(user, 'role', None)
+    if role == 'owner':
+        return {'role': role, 'station_ids': owner_station_ids(user)}
+    if role in ('manager', 'attendant'):
+        return {
+            'role': role,
+            'station_id': str(user.station_id),
+            'scope_version': cache.get(scope_version_key(user.id)),
+        }
+    return {'role': None}
+
+
+def owner_station_ids(owner):
+    """
+    The ids (as strings) of the stations an owner owns, cached in the
+    owner's namespace until a station is created or deleted.
+    """
+    # Imported late: service.cache_keys loads DRF's views, whose settings
+    # load this module
+    from service.cache_keys import USER_STATION_IDS, user_namespace
+
+    namespace = user_namespace(owner.id)
+    station_ids = namespace.get(USER_STATION_IDS)
+    if station_ids is None:
+        station_ids = [
+            str(station_id)
+            for station_id in owner.station_set.values_list('id', flat=True)
+        ]
+        namespace.set(USER_STATION_IDS, station_ids)
+    return station_ids
+
+
+def apply_scope_claims(token, user):
+    """Sign the user's current role and station scope into a token."""
+    for claim, value in scope_claims(user).items():
+        token[claim] = value
+    return token
+
+
+def revoke_scope(user_id):
+    """
+    Invalidate the role and station claims in every token issued to a
+    user so far.
+
+    Called when a manager or attendant moves to another station. The
+    user's scope gets a new version, and access tokens signed with any
+    other version are rejected with a 401 until the client refreshes; the
+    refresh view signs the new scope and version from the database. The
+    version only has to outlive the access tokens it rejects, since a
+    refresh always re-signs the scope.
+    """
+    lifetime = settings.SIMPLE_JWT['ACCESS_TOKEN_LIFETIME']
+    cache.set(
+        scope_version_key(user_id),
+        uuid4().hex,
+        timeout=int(lifetime.total_seconds())
+    )
+
+
+def token_claims(request):
+    """
+    Return the verified claims of the request's access token, or an
+    empty dict for unauthenticated requests.
+
+    Raises:
+        AuthenticationFailed: If the token's scope has been revoked.
+    """
+    if hasattr(request, '_token_claims'):
+        return request._token_claims
+
+    claims = {}
+    payload = getattr(request.auth, 'payload', None)
+    if payload and request.user.is_authenticated:
+        version = cache.get(scope_version_key(payload['user_id']))
+        check_scope(payload, version)
+        claims = payload
+
+    request._token_claims = claims
+    return claims
+
+
+async def atoken_claims(request):
+    """
+    token_claims for plain Django async views, which authenticate the
+    access token themselves instead of through DRF.
+
+    The token is verified without touching the database; one async query
+    checks that its user still exists, as JWTAuthentication does.
+
+    Raises:
+        AuthenticationFailed: If the token is invalid, its user deleted
+            or its scope revoked.
+    """
+    if hasattr(request, '_token_claims'):
+        return request._token_claims
+
+    claims = {}
+    authentication = JWTAuthentication()
+    header = authentication.get_header(request)
+    raw_token = header and authentication.get_raw_token(header)
+    if raw_token:
+        payload = authentication.get_validated_token(raw_token).payload
+        exists = await get_user_model().objects.filter(
+            id=payload['user_id']
+        ).aexists()
+        if not exists:
+            raise AuthenticationFailed(
+                "User not found", code='user_not_found'
+            )
+        version = await cache.aget(scope_version_key(payload['user_id']))
+        check_scope(payload, version)
+        claims = payload
+
+    request._token_claims = claims
+    return claims
+
+
+def scope_version_key(user_id):
+    return f"scope_version_{user_id}"
+
+
+def check_scope(payload, version):
+    """Reject a token signed with another version of its user's scope."""
+    if version is not None and payload.get('scope_version') != version:
+        raise AuthenticationFailed(
+            "Your station assignment has changed. Refresh your token.",
+            code='token_scope_revoked'
+        )
+
+
+def claims_station_ids(claims):
+    """Return the set of station ids (as strings) a token is scoped to."""
+    if claims.get('role') == 'owner':
+        return set(claims.get('station_ids', ()))
+    if claims.get('station_id'):
+        return {claims['station_id']}
+    return set()
+
+
+class ClaimsUser(TokenUser):
+    """
+    The request.user of token-authenticated requests, built from the
+    access token's claims without a query.
+
+    id, role and the station claims are read from the token. The user's
+    Owner, Manager or Attendant row is only loaded when a view needs it,
+    through role_user; other model attributes (email, is_superuser, ...)
+    are read from that row.
+    """
+
+    def __str__(self):
+        return f"ClaimsUser {self.id}"
+
+    @cached_property
+    def role(self):
+        return self.token.get('role')
+
+    @cached_property
+    def role_user(self):
+        """The user's concrete Owner, Manager or Attendant instance."""
+        user = load_user(self.id)
+        if user is None:
+            raise AuthenticationFailed(
+                "User not found", code='user_not_found'
+            )
+        return user
+
+    @property
+    def is_superuser(self):
+        return self.role_user.is_superuser
+
+    def __getattr__(self, attr):
+        if attr.startswith('_') or attr == 'token':
+            raise AttributeError(attr)
+        return getattr(self.role_user, attr)
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication without the per-request user query.
+
+    With settings.AUTH_USER_CACHE_SECONDS set, each request still checks
+    that its user exists and is active, against a copy of the user kept
+    that long in the user's cache namespace; saving or deleting the user
+    drops the copy. Without it the token's signature is trusted for the
+    token's lifetime and the database is only read when a view asks for
+    request.user.role_user.
+    """
+
+    def get_user(self, validated_token):
+        user = ClaimsUser(validated_token)
+        if user_cache_seconds():
+            if not user.role_user.is_active:
+                raise AuthenticationFailed(
+                    "User is inactive", code='user_inactive'
+                )
+        return user
+
+
+def user_cache_seconds():
+    return getattr(settings, 'AUTH_USER_CACHE_SECONDS', None)
+
+
+def load_user(user_id):
+    """
+    Return a user with its role (see get_with_role), from the cache when
+    AUTH_USER_CACHE_SECONDS allows it, or None if there is no such user.
+    """
+    from service.cache_keys import USER_ACCOUNT, user_namespace
+
+    timeout = user_cache_seconds()
+    if not timeout:
+        return get_user_model().objects.get_with_role(id=user_id)
+
+    namespace = user_namespace(user_id)
+    user = namespace.get(USER_ACCOUNT)
+    if user is None:
+        user = get_user_model().objects.get_with_role(id=user_id)
+        if user is not None:
+            namespace.set(USER_ACCOUNT, user, timeout=timeout)
+    return user
+
+
+def track_cached_user(model):
+    """
+    Drop a user's cached copy, with the rest of their cache namespace,
+    whenever a row of a user model is saved or deleted.
+    """
+    def changed(sender, instance, **kwargs):
+        from service.cache_keys import user_namespace
+        namespace = user_namespace(instance.pk)
+        transaction.on_commit(namespace.invalidate)
+
+    uid = f'cached_user:{model._meta.label}'
+    post_save.connect(changed, sender=model, weak=False, dispatch_uid=uid)
+    post_delete.connect(changed, sender=model, weak=False, dispatch_uid=uid)
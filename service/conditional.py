@@ -0,0 +1,167 @@
+import hashlib
+from django.http import HttpResponse
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.response import Response
+from service.cache_keys import (
+    ALL_STATIONS, STATION_RESPONSE, station_data_namespace
+)
+from service.claims import claims_station_ids, token_claims
+
+# Seconds a cached response is kept while its station's data is unchanged
+RESPONSE_TIMEOUT = 600
+# Larger bodies are rendered afresh every time
+MAX_CACHED_BYTES = 512 * 1024
+
+
+class NotModified(APIException):
+    status_code = status.HTTP_304_NOT_MODIFIED
+
+
+class ConditionalListMixin:
+    """
+    Tag list actions with an ETag built from the data version of the
+    station they show, and answer If-None-Match requests for unchanged
+    data with 304 Not Modified before any query or serializer runs.
+
+    Attributes:
+        etag_actions (dict): Maps an action to how its station is found:
+            None for lists across stations, the URL kwarg holding the
+            station id, or a (URL kwarg, model) pair naming a row whose
+            station_id it is.
+    """
+    etag_actions = {}
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self.etag = None
+        self.data_namespace = None
+        if request.method not in ('GET', 'HEAD') or (
+                self.action not in self.etag_actions):
+            return
+
+        lookup = self.etag_actions[self.action]
+        if lookup is None:
+            station_id = ALL_STATIONS
+        elif isinstance(lookup, str):
+            station_id = self.kwargs.get(lookup)
+        else:
+            kwarg, model = lookup
+            station_id = model.objects.filter(
+                pk=self.kwargs.get(kwarg)
+                ).values_list('station_id', flat=True).first()
+        if station_id is None:
+            # Nothing to show; the action answers for itself
+            return
+
+        self.data_namespace = station_data_namespace(station_id)
+        # The same data renders differently per URL and media type
+        variant = f'{request.get_full_path()} {request.accepted_media_type}'
+        self.variant = hashlib.md5(
+            variant.encode(), usedforsecurity=False
+            ).hexdigest()[:16]
+        self.etag = f'W/"{self.data_namespace.version}-{self.variant}"'
+
+        if_none_match = request.headers.get('If-None-Match')
+        if if_none_match:
+            tags = {
+                tag.removeprefix('W/') for tag in parse_etags(if_none_match)
+            }
+            if '*' in tags or self.etag.removeprefix('W/') in tags:
+                raise NotModified()
+
+    def handle_exception(self, exc):
+        if isinstance(exc, NotModified):
+            return Response(
+                status=exc.status_code, headers=self.etag_headers()
+                )
+        return super().handle_exception(exc)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(
+            request, response, *args, **kwargs
+            )
+        if getattr(self, 'etag', None) and response.status_code == 200:
+            for header, value in self.etag_headers().items():
+                response[header] = value
+        return response
+
+    def etag_headers(self):
+        # Stored by browsers, but always revalidated
+        return {'ETag': self.etag, 'Cache-Control': 'private, no-cache'}
+
+
+class CachedResponse(Exception):
+    """Carries a cached response past the action that would rebuild it."""
+
+    def __init__(self, response):
+        self.response = response
+
+
+class CachedListMixin(ConditionalListMixin):
+    """
+    Also keep the rendered responses of the etag_actions in the station's
+    data namespace, so requests without a matching ETag are answered from
+    the cache until the station's data changes.
+
+    Responses are keyed by the ETag variant and the caller's role and
+    station scope, and only looked up once authentication and permissions
+    have passed. The
+    data version is read before the action queries anything, so a
+    response built while a write commits is stored under the version
+    that write already retired, and is never served.
+    """
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if self.data_namespace is None:
+            return
+        self.response_key = {
+            'scope': self.response_scope(request),
+            'variant': self.variant,
+        }
+        cached = self.data_namespace.get(
+            STATION_RESPONSE, **self.response_key
+            )
+        if cached is not None:
+            content_type, content = cached
+            raise CachedResponse(
+                HttpResponse(content, content_type=content_type)
+                )
+
+    @staticmethod
+    def response_scope(request):
+        """
+        Tell apart callers whose lists may differ: the same role scoped to
+        other stations can be shown other rows.
+        """
+        claims = token_claims(request)
+        scope = ' '.join([
+            str(claims.get('role')), *sorted(claims_station_ids(claims))
+        ])
+        return hashlib.md5(scope.encode(), usedforsecurity=False).hexdigest()
+
+    def handle_exception(self, exc):
+        if isinstance(exc, CachedResponse):
+            return exc.response
+        return super().handle_exception(exc)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(
+            request, response, *args, **kwargs
+            )
+        if (getattr(self, 'data_namespace', None) is not None
+                and isinstance(response, Response)
+                and response.status_code == 200):
+            response.add_post_render_callback(self.store_response)
+        return response
+
+    def store_response(self, response):
+        if len(response.content) <= MAX_CACHED_BYTES:
+            self.data_namespace.set(
+                STATION_RESPONSE,
+                (response['Content-Type'], response.content),
+                timeout=RESPONSE_TIMEOUT,
+                **self.response_key
+                )
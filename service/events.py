@@ -0,0 +1,292 @@
+"""
+Per-station streams of live pump, sales and pit activity.
+
+Models publish events as their transactions commit. Each event takes the
+next id from the station's sequence in the cache and is kept there for
+EVENT_TTL seconds, so a client reconnecting with Last-Event-ID is sent
+what it missed. Every process polls the sequence once per watched
+station, however many clients watch it, and fans new events out to them
+as server-sent events.
+"""
+import asyncio
+import json
+import logging
+import time
+import weakref
+from contextlib import asynccontextmanager
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from service.cache_keys import station_event_key, station_event_sequence_key
+
+logger = logging.getLogger(__name__)
+
+# Seconds an event stays available to reconnecting clients
+EVENT_TTL = 600
+# Most events a client is sent to catch up; further behind, it reloads
+MAX_BACKLOG = 1000
+# Seconds between a process's checks for new events on a station
+POLL_INTERVAL = 0.5
+# Seconds an unwritten event is waited for before it is given up on
+GAP_TIMEOUT = 5
+# Seconds between keep-alive comments on an idle stream
+HEARTBEAT_INTERVAL = 15
+# Milliseconds a disconnected browser waits before reconnecting
+RETRY_MS = 3000
+
+
+def publish(station_id, *events):
+    """
+    Append events to a station's stream once the current transaction
+    commits; rolled back changes are never announced.
+
+    Args:
+        station_id: The station whose stream the events go to.
+        events: (kind, data) pairs, with JSON serializable data.
+    """
+    if station_id is None or not events:
+        return
+    encoded = [
+        (kind, json.dumps(data, cls=DjangoJSONEncoder))
+        for kind, data in events
+    ]
+    transaction.on_commit(lambda: append(station_id, encoded))
+
+
+def append(station_id, events):
+    """Number encoded events and write them to the cache."""
+    sequence_key = station_event_sequence_key(station_id)
+    try:
+        last_id = cache.incr(sequence_key, len(events))
+    except ValueError:
+        cache.add(sequence_key, first_sequence_id(), timeout=None)
+        last_id = cache.incr(sequence_key, len(events))
+    first_id = last_id - len(events) + 1
+    cache.set_many(
+        {station_event_key(station_id, first_id + offset): event
+         for offset, event in enumerate(events)},
+        timeout=EVENT_TTL
+    )
+
+
+def first_sequence_id():
+    """
+    Where a new or lost sequence starts: the current time, so it never
+    hands out ids clients have already seen.
+    """
+    return int(time.time() * 1000)
+
+
+async def last_event_id(station_id):
+    sequence_key = station_event_sequence_key(station_id)
+    event_id = await cache.aget(sequence_key)
+    if event_id is None:
+        await cache.aadd(sequence_key, first_sequence_id(), timeout=None)
+        event_id = await cache.aget(sequence_key)
+    return event_id
+
+
+async def read_events(station_id, after, upto):
+    """
+    Fetch the events with ids after ``after`` up to ``upto``.
+
+    Returns:
+        list: (id, kind, data) triples, stopping short of the first event
+            that is not in the cache.
+    """
+    event_ids = range(after + 1, upto + 1)
+    found = await cache.aget_many([
+        station_event_key(station_id, event_id) for event_id in event_ids
+    ])
+    events = []
+    for event_id in event_ids:
+        event = found.get(station_event_key(station_id, event_id))
+        if event is None:
+            break
+        events.append((event_id, *event))
+    return events
+
+
+class Subscription:
+    """
+    One client's queue of a station's events.
+
+    Attributes:
+        feed (StationFeed): The feed filling the queue.
+        lagged (bool): Set when events were lost to the client, because
+            it fell too far behind or an event could not be read. The
+            client has to reload before following the stream again.
+        closed (bool): Set when the station's feed failed.
+    """
+
+    def __init__(self, feed):
+        self.feed = feed
+        self.queue = asyncio.Queue(maxsize=MAX_BACKLOG)
+        self.lagged = False
+        self.closed = False
+
+    def put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.lagged = True
+
+    def wake(self):
+        """Unblock the client to notice a flag without sending an event."""
+        if self.queue.empty():
+            self.queue.put_nowait(None)
+
+
+class StationFeed:
+    """Polls one station's events for this process and fans them out."""
+
+    def __init__(self, station_id):
+        self.station_id = station_id
+        self.subscriptions = set()
+        self.last_id = None
+        self.ready = asyncio.Event()
+        self.task = asyncio.create_task(self.run())
+
+    async def run(self):
+        try:
+            self.last_id = await last_event_id(self.station_id)
+            self.ready.set()
+            await self.poll()
+        except Exception:
+            logger.exception(
+                "Event feed for station %s failed.", self.station_id
+            )
+        finally:
+            for subscription in self.subscriptions:
+                subscription.closed = True
+                subscription.wake()
+            self.ready.set()
+
+    async def poll(self):
+        loop = asyncio.get_running_loop()
+        gap_since = None
+        while True:
+            await asyncio.sleep(POLL_INTERVAL)
+            latest = await last_event_id(self.station_id)
+            if latest == self.last_id:
+                continue
+            if not 0 < latest - self.last_id <= MAX_BACKLOG:
+                # Too far behind, or the sequence was lost and restarted
+                self.skip_to(latest)
+                continue
+
+            events = await read_events(self.station_id, self.last_id, latest)
+            if events:
+                gap_since = None
+                self.last_id = events[-1][0]
+                for subscription in self.subscriptions:
+                    for event in events:
+                        subscription.put(event)
+            elif gap_since is None:
+                # Published but not written yet, or lost with its writer
+                gap_since = loop.time()
+            elif loop.time() - gap_since > GAP_TIMEOUT:
+                gap_since = None
+                self.skip_to(self.last_id + 1)
+
+    def skip_to(self, event_id):
+        """Jump past events that can no longer be delivered."""
+        self.last_id = event_id
+        for subscription in self.subscriptions:
+            subscription.lagged = True
+            subscription.wake()
+
+
+class EventHub:
+    """The station feeds of one event loop."""
+
+    def __init__(self):
+        self.feeds = {}
+
+    @asynccontextmanager
+    async def subscribe(self, station_id):
+        """
+        Follow a station's events.
+
+        Yields:
+            tuple: The Subscription, and the id of the last event that
+                will not be put on its queue.
+        """
+        feed = self.feeds.get(station_id)
+        if feed is None or feed.task.done():
+            feed = self.feeds[station_id] = StationFeed(station_id)
+        subscription = Subscription(feed)
+        feed.subscriptions.add(subscription)
+        try:
+            await feed.ready.wait()
+            if feed.task.done():
+                subscription.closed = True
+            yield subscription, feed.last_id
+        finally:
+            feed.subscriptions.discard(subscription)
+            if not feed.subscriptions and self.feeds.get(station_id) is feed:
+                feed.task.cancel()
+                del self.feeds[station_id]
+
+
+_hubs = weakref.WeakKeyDictionary()
+
+
+def get_hub():
+    loop = asyncio.get_running_loop()
+    hub = _hubs.get(loop)
+    if hub is None:
+        hub = _hubs[loop] = EventHub()
+    return hub
+
+
+def format_event(event_id, kind, data):
+    return f"id: {event_id}\nevent: {kind}\ndata: {data}\n\n"
+
+
+async def stream(station_id, resume_from=None):
+    """
+    Yield a station's events in the server-sent events format.
+
+    Args:
+        resume_from (int): The Last-Event-ID of a reconnecting client.
+            Events after it are sent first if they are still cached;
+            otherwise a 'reset' event tells the client to reload.
+    """
+    async with get_hub().subscribe(station_id) as (subscription, sent):
+        # Sent once subscribed, so nothing published after it is missed
+        yield f"retry: {RETRY_MS}\n\n"
+        if subscription.closed:
+            return
+        if resume_from is not None:
+            backlog = []
+            if 0 <= sent - resume_from <= MAX_BACKLOG:
+                backlog = await read_events(station_id, resume_from, sent)
+            if len(backlog) == sent - resume_from:
+                for event in backlog:
+                    yield format_event(*event)
+            else:
+                yield format_event(sent, 'reset', '{}')
+
+        while True:
+            try:
+                event = await asyncio.wait_for(
+                    subscription.queue.get(), HEARTBEAT_INTERVAL
+                )
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+            if subscription.closed:
+                return
+            if subscription.lagged:
+                # Whatever is still queued is superseded by the reload
+                while not subscription.queue.empty():
+                    subscription.queue.get_nowait()
+                subscription.lagged = False
+                sent = subscription.feed.last_id
+                yield format_event(sent, 'reset', '{}')
+                continue
+            if event is None or event[0] <= sent:
+                continue
+            sent = event[0]
+            yield format_event(*event)
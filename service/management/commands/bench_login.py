@@ -0,0 +1,146 @@
+import json
+import time
+from django.contrib.auth import authenticate
+from django.contrib.auth.backends import ModelBackend
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework_simplejwt.tokens import RefreshToken
+from owner.models import Owner
+from manager.models import Manager
+from station.models import Station
+from station_attendant.models import Attendant
+from service.tokens import CachedRefreshToken
+
+PASSWORD = 'bench-login-password'
+
+
+class Rollback(Exception):
+    """Raised to discard the benchmark fixtures."""
+
+
+def legacy_login(email, password):
+    """
+    The login pipeline as it was before roles were resolved in a single
+    query: one lookup per role model, a second backend pass on failure,
+    and the access token minted once per use.
+    """
+    user = None
+    for model in (Owner, Manager, Attendant):
+        try:
+            candidate = model.objects.get(email=email)
+        except model.DoesNotExist:
+            continue
+        if candidate.check_password(password):
+            user = candidate
+            break
+
+    if user is None:
+        user = ModelBackend().authenticate(
+            None, email=email, password=password
+        )
+    if user is None:
+        return None
+
+    refresh = RefreshToken.for_user(user)
+    str(refresh.access_token)
+    refresh = RefreshToken.for_user(user)
+    str(refresh), str(refresh.access_token), str(refresh.access_token)
+    return user
+
+
+def current_login(email, password):
+    """The login pipeline used by the owner, manager and attendant views."""
+    user = authenticate(None, email=email, password=password)
+    if user is None:
+        return None
+
+    refresh = CachedRefreshToken.for_user(user)
+    str(refresh), str(refresh.access_token)
+    return user
+
+
+class Command(BaseCommand):
+    """
+    Measure login throughput for each role, before and after the
+    single-lookup login pipeline, inside a transaction that is rolled
+    back at the end.
+    """
+    help = "Benchmark logins per second per worker for each role."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--iterations',
+            type=int,
+            default=50,
+            help="Logins to time per role and outcome.",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                emails = self.create_users()
+                results = self.run(emails, options['iterations'])
+                raise Rollback
+        except Rollback:
+            pass
+
+        self.stdout.write(json.dumps(results, indent=2))
+
+    def create_users(self):
+        owner = Owner.objects.create_user(
+            'bench-owner@example.com', PASSWORD,
+            name='Bench Owner', company_name='Bench Login Co'
+        )
+        station = Station.objects.create(
+            owner=owner, name='Bench Station',
+            email='bench-station@example.com', address='Bench'
+        )
+        Manager.objects.create_user(
+            'bench-manager@example.com', PASSWORD,
+            name='Bench Manager', station=station
+        )
+        Attendant.objects.create_user(
+            'bench-attendant@example.com', PASSWORD,
+            name='Bench Attendant', station=station
+        )
+        return {
+            'owner': 'bench-owner@example.com',
+            'manager': 'bench-manager@example.com',
+            'attendant': 'bench-attendant@example.com',
+            'unknown': 'bench-nobody@example.com',
+        }
+
+    def run(self, emails, iterations):
+        results = []
+        for role, email in emails.items():
+            outcomes = [('wrong_password', PASSWORD + 'x')]
+            if role != 'unknown':
+                outcomes.insert(0, ('success', PASSWORD))
+
+            for outcome, password in outcomes:
+                row = {'role': role, 'outcome': outcome}
+                for name, pipeline in (('before', legacy_login),
+                                       ('after', current_login)):
+                    row[name] = self.measure(
+                        pipeline, email, password, iterations
+                    )
+                row['speedup'] = round(
+                    row['after']['logins_per_sec'] /
+                    row['before']['logins_per_sec'], 2
+                )
+                results.append(row)
+        return results
+
+    @staticmethod
+    def measure(pipeline, email, password, iterations):
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            for _ in range(iterations):
+                pipeline(email, password)
+            elapsed = time.perf_counter() - started
+
+        return {
+            'logins_per_sec': round(iterations / elapsed, 2),
+            'queries_per_login': round(len(queries) / iterations, 2),
+        }
@@ -0,0 +1,133 @@
+import json
+import time
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from rest_framework_simplejwt.tokens import RefreshToken
+from owner.models import Owner, User
+from manager.models import Manager
+from station.models import Station
+from station_attendant.models import Attendant
+from service.claims import scope_claims
+from service.token_utils import get_refresh_token
+from service.tokens import ScopedTokenRefreshSerializer
+
+PASSWORD = 'bench-refresh-password'
+
+
+class Rollback(Exception):
+    """Raised to discard the benchmark fixtures."""
+
+
+def legacy_refresh(raw_token):
+    """
+    The refresh pipeline as it was before the cache blacklist: the stock
+    refresh, then a second decode, the user row and, for owners, their
+    stations read from the database.
+    """
+    serializer = TokenRefreshSerializer(data={'refresh': raw_token})
+    serializer.is_valid(raise_exception=True)
+    refresh = RefreshToken(raw_token)
+    user = User.objects.get_with_role(id=refresh['user_id'])
+    if user.role == 'owner':
+        refresh['station_ids'] = [
+            str(station_id)
+            for station_id in user.station_set.values_list('id', flat=True)
+        ]
+    else:
+        for claim, value in scope_claims(user).items():
+            refresh[claim] = value
+    str(refresh), str(refresh.access_token)
+
+
+def current_refresh(raw_token):
+    """The refresh pipeline used by CustomTokenRefreshView."""
+    serializer = ScopedTokenRefreshSerializer(data={'refresh': raw_token})
+    serializer.is_valid(raise_exception=True)
+    refresh = serializer.validated_data['refresh']
+    str(refresh), str(refresh.access_token)
+
+
+class Command(BaseCommand):
+    """
+    Measure token refresh throughput for each role, before and after the
+    cache blacklist and cached scope, inside a transaction that is rolled
+    back at the end.
+    """
+    help = "Benchmark token refreshes per second per worker for each role."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--iterations',
+            type=int,
+            default=200,
+            help="Refreshes to time per role and pipeline.",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                users = self.create_users()
+                results = self.run(users, options['iterations'])
+                raise Rollback
+        except Rollback:
+            pass
+
+        self.stdout.write(json.dumps(results, indent=2))
+
+    def create_users(self):
+        owner = Owner.objects.create_user(
+            'bench-refresh-owner@example.com', PASSWORD,
+            name='Bench Owner', company_name='Bench Refresh Co'
+        )
+        station = Station.objects.create(
+            owner=owner, name='Bench Station',
+            email='bench-refresh-station@example.com', address='Bench'
+        )
+        manager = Manager.objects.create_user(
+            'bench-refresh-manager@example.com', PASSWORD,
+            name='Bench Manager', station=station
+        )
+        attendant = Attendant.objects.create_user(
+            'bench-refresh-attendant@example.com', PASSWORD,
+            name='Bench Attendant', station=station
+        )
+        return {
+            'owner': owner.id,
+            'manager': manager.id,
+            'attendant': attendant.id,
+        }
+
+    def run(self, users, iterations):
+        results = []
+        for role, user_id in users.items():
+            user = User.objects.get_with_role(id=user_id)
+            # Issued the way each pipeline's login issued it
+            tokens = {
+                'before': str(RefreshToken.for_user(user)),
+                'after': str(get_refresh_token(user)),
+            }
+            row = {'role': role}
+            for name, pipeline in (('before', legacy_refresh),
+                                   ('after', current_refresh)):
+                row[name] = self.measure(pipeline, tokens[name], iterations)
+            row['speedup'] = round(
+                row['after']['refreshes_per_sec'] /
+                row['before']['refreshes_per_sec'], 2
+            )
+            results.append(row)
+        return results
+
+    @staticmethod
+    def measure(pipeline, raw_token, iterations):
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            for _ in range(iterations):
+                pipeline(raw_token)
+            elapsed = time.perf_counter() - started
+
+        return {
+            'refreshes_per_sec': round(iterations / elapsed, 2),
+            'queries_per_refresh': round(len(queries) / iterations, 2),
+        }
@@ -0,0 +1,311 @@
+import asyncio
+import json
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.test.utils import override_settings
+from django.utils import timezone
+from owner.models import Owner, User
+from service.management.commands.run_benchmarks import percentile
+from service.management.commands.seed_benchmark_data import BENCHMARK_DOMAIN
+from service.token_utils import get_refresh_token
+
+# Dashboard reads as (name, WSGI path, ASGI path), formatted with the
+# station id; endpoints with no sync variant are only run under ASGI
+ENDPOINTS = (
+    ('sales by station',
+     '/api/v1/sales/station/{station_id}',
+     '/api/v1/async/sales/station/{station_id}'),
+    ('pump readings by station',
+     '/api/v1/pumpreadings/station/{station_id}',
+     '/api/v1/async/pumpreadings/station/{station_id}'),
+    ('pit readings by station',
+     '/api/v1/pitreadings/station/{station_id}',
+     '/api/v1/async/pitreadings/station/{station_id}'),
+    ('station snapshot',
+     None,
+     '/api/v1/async/stations/{station_id}/snapshot'),
+)
+
+
+class ThreadCounter:
+    """
+    Samples how many threads a run starts, beyond those alive before it,
+    and keeps the most seen at once.
+    """
+
+    def __enter__(self):
+        self.baseline = threading.active_count()
+        self.peak = 0
+        self.stopped = threading.Event()
+        self.sampler = threading.Thread(target=self.sample, daemon=True)
+        self.sampler.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stopped.set()
+        self.sampler.join()
+
+    def sample(self):
+        while not self.stopped.wait(0.001):
+            # Not counting the sampler itself
+            started = threading.active_count() - self.baseline - 1
+            self.peak = max(self.peak, started)
+
+
+class Command(BaseCommand):
+    """
+    Compare how the WSGI and ASGI paths serve concurrent dashboard reads.
+
+    Both servers run in this process against data from
+    seed_benchmark_data. The WSGI path is Django's WSGIHandler behind a
+    fixed pool of worker threads, as a threaded WSGI worker runs it; the
+    ASGI path is Django's ASGIHandler on one event loop, serving the
+    async views. Every level of concurrency keeps that many clients
+    requesting back to back, and reports throughput, latency percentiles
+    including time spent queued, and the most threads the server ran at
+    once.
+
+    SQLite answers in microseconds, which hides what async views are
+    for; --query-latency-ms adds a delay to every query, as a database
+    across a network would.
+    """
+    help = "Benchmark concurrent dashboard reads over WSGI and ASGI."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            nargs='+',
+            default=[1, 8, 32, 64],
+            help="Concurrent clients per run.",
+        )
+        parser.add_argument(
+            '--requests',
+            type=int,
+            default=200,
+            help="Requests per run.",
+        )
+        parser.add_argument(
+            '--threads',
+            type=int,
+            default=8,
+            help="Worker threads serving the WSGI path.",
+        )
+        parser.add_argument(
+            '--query-latency-ms',
+            type=float,
+            default=0,
+            help="Delay added to every SQL query.",
+        )
+        parser.add_argument(
+            '--output',
+            help="Write the JSON report to this file instead of stdout.",
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor == 'sqlite' and (
+                connection.settings_dict['NAME'] == ':memory:'):
+            raise CommandError(
+                "An in-memory database is not shared between threads."
+            )
+        owner = Owner.objects.filter(
+            email__endswith=f'@{BENCHMARK_DOMAIN}'
+        ).order_by('email').first()
+        if owner is None:
+            raise CommandError("No benchmark data; run seed_benchmark_data.")
+        station = owner.station_set.order_by('email').first()
+        token = get_refresh_token(User.objects.get_with_role(id=owner.id))
+        self.authorization = f'Bearer {token.access_token}'
+
+        latency = options['query_latency_ms'] / 1000
+        if latency:
+            def delay(execute, sql, params, many, context):
+                time.sleep(latency)
+                return execute(sql, params, many, context)
+
+            def add_delay(sender, connection, **kwargs):
+                connection.execute_wrappers.append(delay)
+            connection_created.connect(add_delay, weak=False)
+        # Each thread opens its own connection from here on
+        connection.close()
+
+        results = []
+        with override_settings(
+            ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']
+        ):
+            wsgi, asgi = WSGIHandler(), ASGIHandler()
+            for name, sync_path, async_path in ENDPOINTS:
+                for concurrency in options['concurrency']:
+                    if sync_path:
+                        results.append(self.result(
+                            name, 'wsgi', concurrency,
+                            self.run_wsgi(
+                                wsgi, sync_path.format(station_id=station.id),
+                                concurrency, options
+                            )
+                        ))
+                    results.append(self.result(
+                        name, 'asgi', concurrency,
+                        self.run_asgi(
+                            asgi, async_path.format(station_id=station.id),
+                            concurrency, options
+                        )
+                    ))
+                    self.stderr.write(
+                        f"{name}, {concurrency} client(s): done"
+                    )
+
+        report = json.dumps({
+            'generated_at': timezone.now().isoformat(),
+            'database': connection.vendor,
+            'requests': options['requests'],
+            'wsgi_threads': options['threads'],
+            'query_latency_ms': options['query_latency_ms'],
+            'results': results,
+        }, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                output.write(report)
+            self.stdout.write(f"Wrote {len(results)} result(s).")
+        else:
+            self.stdout.write(report)
+
+    def result(self, name, server, concurrency, run):
+        latencies, statuses, seconds, peak_threads = run
+        latencies.sort()
+        return {
+            'endpoint': name,
+            'server': server,
+            'concurrency': concurrency,
+            'status': sorted(set(statuses)),
+            'requests_per_second': round(len(latencies) / seconds, 1),
+            'p50_ms': round(percentile(latencies, 50), 3),
+            'p95_ms': round(percentile(latencies, 95), 3),
+            'p99_ms': round(percentile(latencies, 99), 3),
+            'mean_ms': round(statistics.fmean(latencies), 3),
+            'peak_server_threads': peak_threads,
+        }
+
+    def run_wsgi(self, handler, path, concurrency, options):
+        """Serve the requests from a fixed pool of worker threads."""
+
+        def request():
+            statuses = []
+            environ = {
+                'REQUEST_METHOD': 'GET',
+                'PATH_INFO': path,
+                'QUERY_STRING': '',
+                'SERVER_NAME': 'testserver',
+                'SERVER_PORT': '80',
+                'SERVER_PROTOCOL': 'HTTP/1.1',
+                'HTTP_HOST': 'testserver',
+                'HTTP_AUTHORIZATION': self.authorization,
+                'wsgi.url_scheme': 'http',
+                'wsgi.input': BytesIO(),
+                'wsgi.errors': BytesIO(),
+            }
+            body = handler(
+                environ, lambda status, headers: statuses.append(status)
+            )
+            b''.join(body)
+            body.close()
+            return int(statuses[0].split()[0])
+
+        def client(count, latencies, statuses):
+            for _ in range(count):
+                started = time.perf_counter()
+                statuses.append(pool.submit(request).result())
+                latencies.append((time.perf_counter() - started) * 1000)
+
+        latencies, statuses = [], []
+        started = time.perf_counter()
+        with ThreadCounter() as threads, ThreadPoolExecutor(
+                max_workers=options['threads']) as pool:
+            clients = [
+                threading.Thread(
+                    target=client, args=(count, latencies, statuses)
+                )
+                for count in self.shares(options['requests'], concurrency)
+            ]
+            for thread in clients:
+                thread.start()
+            for thread in clients:
+                thread.join()
+        seconds = time.perf_counter() - started
+        # The client threads only stand in for remote clients
+        return latencies, statuses, seconds, threads.peak - concurrency
+
+    def run_asgi(self, handler, path, concurrency, options):
+        """Serve the requests on one event loop."""
+
+        async def request():
+            scope = {
+                'type': 'http',
+                'asgi': {'version': '3.0'},
+                'http_version': '1.1',
+                'method': 'GET',
+                'scheme': 'http',
+                'path': path,
+                'raw_path': path.encode(),
+                'query_string': b'',
+                'root_path': '',
+                'headers': [
+                    (b'host', b'testserver'),
+                    (b'authorization', self.authorization.encode()),
+                ],
+                'client': ('127.0.0.1', 0),
+                'server': ('testserver', 80),
+            }
+            received = False
+            response = {}
+
+            async def receive():
+                nonlocal received
+                if not received:
+                    received = True
+                    return {'type': 'http.request', 'body': b''}
+                # Wait for a disconnect that never comes
+                await asyncio.Future()
+
+            async def send(message):
+                if message['type'] == 'http.response.start':
+                    response['status'] = message['status']
+
+            await handler(scope, receive, send)
+            return response['status']
+
+        async def client(count, latencies, statuses):
+            for _ in range(count):
+                started = time.perf_counter()
+                statuses.append(await request())
+                latencies.append((time.perf_counter() - started) * 1000)
+
+        async def run():
+            latencies, statuses = [], []
+            started = time.perf_counter()
+            await asyncio.gather(*(
+                client(count, latencies, statuses)
+                for count in self.shares(options['requests'], concurrency)
+            ))
+            return latencies, statuses, time.perf_counter() - started
+
+        with ThreadCounter() as threads:
+            latencies, statuses, seconds = asyncio.run(run())
+        return latencies, statuses, seconds, threads.peak
+
+    @staticmethod
+    def shares(total, clients):
+        """Split a number of requests as evenly as possible among clients."""
+        return [
+            total // clients + (client < total % clients)
+            for client in range(clients)
+        ]
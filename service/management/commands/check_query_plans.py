@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import NotSupportedError
+from service.query_plans import explain_hot_queries
+
+
+class Command(BaseCommand):
+    """
+    EXPLAIN every hot query and fail if any of them reads its table in
+    full instead of through an index (see service.query_plans).
+    """
+    help = "Fail if a hot query falls back to a full table scan."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verbose-plans',
+            action='store_true',
+            help="Print every plan, not only the failing ones.",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            results = explain_hot_queries()
+        except NotSupportedError as error:
+            raise CommandError(error)
+
+        failures = 0
+        for name, plan, scans in results:
+            if scans:
+                failures += 1
+                self.stderr.write(f"FULL SCAN  {name}\n{plan}\n")
+            else:
+                self.stdout.write(f"indexed    {name}")
+                if options['verbose_plans']:
+                    self.stdout.write(f"{plan}\n")
+
+        if failures:
+            raise CommandError(f"{failures} hot query(s) scan a whole table.")
+        self.stdout.write(self.style.SUCCESS("Every hot query uses an index."))
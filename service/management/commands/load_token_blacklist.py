@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+from service.tokens import CachedRefreshToken
+
+
+class Command(BaseCommand):
+    """
+    Copy the unexpired tokens of the token_blacklist tables into the
+    cache blacklist, so tokens revoked before the switch stay revoked.
+    """
+    help = "Copy unexpired blacklisted refresh tokens into the cache."
+
+    def handle(self, *args, **options):
+        tokens = BlacklistedToken.objects.filter(
+            token__expires_at__gt=timezone.now()
+        ).values_list('token__jti', 'token__expires_at')
+        copied = 0
+        for jti, expires_at in tokens.iterator():
+            CachedRefreshToken.blacklist_jti(jti, expires_at.timestamp())
+            copied += 1
+        self.stdout.write(f"Copied {copied} blacklisted token(s).")
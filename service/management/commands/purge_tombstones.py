@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from service.models import TOMBSTONE_DAYS, Tombstone
+
+
+class Command(BaseCommand):
+    """
+    Delete the tombstones of rows deleted more than TOMBSTONE_DAYS ago.
+    Devices with older sync tokens start over, so nothing needs them.
+    Meant to run daily from cron.
+    """
+    help = "Purge tombstones older than the sync token lifetime."
+
+    def handle(self, *args, **options):
+        purged = Tombstone.purge()
+        self.stdout.write(
+            f"Purged {purged} tombstone(s) over {TOMBSTONE_DAYS} days old."
+        )
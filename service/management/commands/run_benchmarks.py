@@ -0,0 +1,516 @@
+import json
+import math
+import statistics
+import time
+from datetime import timedelta
+from functools import partial
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, reset_queries, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import URLResolver, get_resolver
+from django.utils import timezone
+from manager.models import Manager
+from owner.models import Owner
+from product.models import PumpReading
+from pit.models import PitReading
+from sales.models import Sales
+from service.management.commands.seed_benchmark_data import (
+    BENCHMARK_DOMAIN, PASSWORD, SUPERUSER_EMAIL
+)
+from service.token_utils import get_refresh_token
+
+# Roles tried, in order, until one is allowed to call an endpoint
+ROLES = ('anonymous', 'owner', 'manager', 'attendant', 'superuser')
+
+# Readings per pump in the benchmarked import
+IMPORTED_READINGS = 25
+
+# Which seeded object a route's <pk> refers to, by its first path segment
+PK_OBJECTS = {
+    'owner': 'owner',
+    'stations': 'station',
+    'manager': 'manager',
+    'attendants': 'attendant',
+    'attendant': 'attendant',
+    'products': 'product',
+    'pumps': 'pump',
+    'pumpreadings': 'pump_reading',
+    'pits': 'pit',
+    'pitreadings': 'pit_reading',
+    'sales': 'sale',
+}
+
+# Other path parameters and the seeded object they refer to
+PARAMETER_OBJECTS = {
+    'station_id': 'station',
+    'pump_id': 'pump',
+    'pump_pit_id': 'pit',
+    'pit_id': 'pit',
+    'product_id': 'product',
+    'attendant_id': 'attendant',
+}
+
+
+class Rollback(Exception):
+    """Raised to undo a benchmarked write."""
+
+
+def walk(patterns, prefix=''):
+    """Yield (route, pattern) for every URL pattern, depth first."""
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            yield from walk(pattern.url_patterns, prefix + str(pattern.pattern))
+        else:
+            yield prefix + str(pattern.pattern), pattern
+
+
+def pk_object(route):
+    """The kind of seeded object a route's <pk> refers to."""
+    return PK_OBJECTS[route.removeprefix('api/v1/').split('/')[0]]
+
+
+def route_methods(pattern):
+    """The HTTP methods a URL pattern's view answers."""
+    callback = pattern.callback
+    actions = getattr(callback, 'actions', None)
+    if actions:
+        return sorted(actions)
+    view_class = getattr(callback, 'view_class', None)
+    if view_class is None:
+        return ['get']
+    return [
+        method for method in view_class.http_method_names
+        if method not in ('head', 'options') and hasattr(view_class, method)
+    ]
+
+
+def percentile(samples, percent):
+    """Nearest-rank percentile of a sorted list."""
+    rank = max(math.ceil(percent / 100 * len(samples)), 1)
+    return samples[rank - 1]
+
+
+class Command(BaseCommand):
+    """
+    Drive every route in the URL configuration through the Django test
+    client against data from seed_benchmark_data, and report latency
+    percentiles, query counts and response sizes per endpoint as JSON.
+
+    Each endpoint is called as the first role (anonymous, owner, manager,
+    attendant, then superuser) that gets a successful response, so the
+    numbers measure the real work rather than permission denials. Writes
+    run in a transaction that is rolled back, so the dataset is the same
+    for every endpoint and every run. Their bodies are built from the
+    seeded objects before every request, so each carries a fresh token
+    and follows on from the data as it stands.
+    """
+    help = "Benchmark every API endpoint and report the results as JSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--iterations',
+            type=int,
+            default=20,
+            help="Timed requests per endpoint.",
+        )
+        parser.add_argument(
+            '--warmup',
+            type=int,
+            default=2,
+            help="Untimed requests per endpoint before timing.",
+        )
+        parser.add_argument(
+            '--no-writes',
+            action='store_true',
+            help="Only benchmark GET requests.",
+        )
+        parser.add_argument(
+            '--filter',
+            help="Only benchmark routes containing this text.",
+        )
+        parser.add_argument(
+            '--output',
+            help="Write the JSON report to this file instead of stdout.",
+        )
+
+    def handle(self, *args, **options):
+        owner = Owner.objects.filter(
+            email__endswith=f'@{BENCHMARK_DOMAIN}'
+        ).order_by('email').first()
+        superuser = get_user_model().objects.filter(
+            email=SUPERUSER_EMAIL, is_superuser=True
+        ).first()
+        if owner is None or superuser is None:
+            raise CommandError(
+                "No benchmark data; run seed_benchmark_data --clear."
+            )
+
+        with override_settings(
+            ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']
+        ):
+            self.objects = self.benchmark_objects(owner)
+            self.objects['superuser'] = superuser
+            self.clients, self.users = self.log_in()
+            results = self.run(options)
+
+        report = {
+            'generated_at': timezone.now().isoformat(),
+            'database': connection.vendor,
+            'iterations': options['iterations'],
+            'dataset': {
+                'pump_readings': PumpReading.objects.count(),
+                'pit_readings': PitReading.objects.count(),
+                'sales': Sales.objects.count(),
+            },
+            'results': results,
+        }
+        report = json.dumps(report, indent=2, default=str)
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                output.write(report)
+            self.stdout.write(f"Wrote {len(results)} result(s).")
+        else:
+            self.stdout.write(report)
+
+    def benchmark_objects(self, owner):
+        """Pick one seeded object of each kind, all from one station."""
+        station = owner.station_set.order_by('email').first()
+        manager = station.manager_station
+        attendant = station.attendants.order_by('email').first()
+        pump = station.pumps.order_by('name').first()
+        reading = pump.readings.filter(attendant=attendant).order_by(
+            '-timestamp'
+        ).first() or pump.readings.order_by('-timestamp').first()
+        return {
+            'owner': owner,
+            'station': station,
+            'manager': manager,
+            'attendant': attendant,
+            'product': pump.product_type,
+            'pump': pump,
+            'pit': pump.pump_pit,
+            'pump_reading': reading,
+            'pit_reading': pump.pump_pit.readings.order_by(
+                '-timestamp'
+            ).first(),
+            'sale': reading.sales,
+        }
+
+    def log_in(self):
+        """
+        Log every role in, through its login endpoint where it has one.
+
+        Returns:
+            tuple: A client per role sending its access token, and each
+                role's user, to sign fresh refresh tokens for.
+        """
+        clients = {'anonymous': Client()}
+        users = {}
+        for role in ROLES[1:]:
+            users[role] = get_user_model().objects.get_with_role(
+                id=self.objects[role].id
+            )
+            if role == 'superuser':
+                # Superusers have no role, so no login endpoint either
+                access = get_refresh_token(users[role]).access_token
+            else:
+                response = Client().post(
+                    f'/api/v1/{role}/login',
+                    {'email': self.objects[role].email, 'password': PASSWORD},
+                    content_type='application/json'
+                )
+                if response.status_code != 200:
+                    raise CommandError(
+                        f"Could not log in as the benchmark {role}: "
+                        f"{response.status_code} {response.content[:200]}"
+                    )
+                access = response.json()['access']
+            client = Client()
+            client.defaults['HTTP_AUTHORIZATION'] = f"Bearer {access}"
+            clients[role] = client
+        return clients, users
+
+    def request_body(self, route, pattern, method, role):
+        """
+        The body to send for a write, built from the seeded objects, or
+        None if the write is not benchmarked.
+
+        PUTs send the object's current representation, and imports are
+        sent as NDJSON text.
+        """
+        name = pattern.name
+        objects = self.objects
+        station = objects['station']
+        if name == 'pitreading-detail' and method == 'patch':
+            return {'actual_closing_stock': objects['pit'].current_volume}
+        if method in ('delete', 'patch'):
+            return {}
+        if name.startswith('change-') and name.endswith('-password'):
+            return {'password': PASSWORD}
+        if method == 'put':
+            return self.representation(route, pattern)
+        if name in ('login', 'manager-login', 'attendant-login'):
+            role = {'login': 'owner'}.get(name, name.split('-')[0])
+            return {'email': objects[role].email, 'password': PASSWORD}
+        if name in ('token_refresh', 'logout'):
+            # A logout blacklists its token in the cache, which rolling
+            # back does not undo, so every request gets a token of its own
+            user = self.users.get(role, self.users['owner'])
+            return {'refresh': str(get_refresh_token(user))}
+        if name == 'owner-create':
+            return {
+                'name': 'Benchmark Extra Owner',
+                'email': f'extra-owner@{BENCHMARK_DOMAIN}',
+                'company_name': 'Benchmark Extra Co',
+                'password': PASSWORD,
+            }
+        if name in ('manager-list-create', 'attendant-list-create'):
+            kind = name.split('-')[0]
+            return {
+                'name': f'Benchmark Extra {kind.title()}',
+                'email': f'extra-{kind}@{BENCHMARK_DOMAIN}',
+                'password': PASSWORD,
+            }
+        if name == 'pumpreadings-open-shift':
+            attendant_id = str(objects['attendant'].id)
+            return {'assignments': [
+                {'pump': str(pump_id), 'attendant': attendant_id}
+                for pump_id in station.pumps.values_list('id', flat=True)
+            ]}
+        if name == 'pumpreadings-import':
+            return self.import_lines()
+        if name == 'pumpreading-list-create':
+            return {
+                'pump': str(objects['pump'].id),
+                'attendant': str(objects['attendant'].id),
+            }
+        if name == 'pitreading-list-create':
+            return {'reading_pit': str(objects['pit'].id)}
+        if name == 'product-list-create':
+            return {
+                'name': 'Benchmark Product',
+                'station': str(station.id),
+                'description': 'Benchmark',
+            }
+        if name == 'pump-list-create':
+            return {
+                'name': 'Benchmark Extra Pump',
+                'station': str(station.id),
+                'product_type': str(objects['product'].id),
+                'pump_pit': str(objects['pit'].id),
+                'initial_meter': '0',
+            }
+        if name == 'pit-list-create':
+            return {
+                'name': 'Benchmark Extra Pit',
+                'station': str(station.id),
+                'pit_product': str(objects['product'].id),
+                'current_volume': 0,
+                'max_volume': 45000,
+            }
+        if name == 'station-list-create':
+            return {
+                'name': 'Benchmark Extra Station',
+                'email': f'extra@{BENCHMARK_DOMAIN}',
+                'address': 'Benchmark Extra Road',
+            }
+        if name == 'sales-close-shift':
+            # Every attendant with an open sale hands in zero figures
+            attendant_ids = Sales.objects.filter(
+                station=station, is_active=True
+            ).values_list('attendant_id', flat=True).distinct()
+            return {'figures': [
+                {'attendant': str(attendant_id)}
+                for attendant_id in attendant_ids
+            ]}
+        return None
+
+    def representation(self, route, pattern):
+        """
+        The seeded object a detail route updates, as the route's own
+        serializer renders it: a full update that changes nothing.
+        """
+        view = pattern.callback.cls(**pattern.callback.initkwargs)
+        view.action = 'update'
+        serializer_class = view.get_serializer_class()
+        return serializer_class(self.objects[pk_object(route)]).data
+
+    def import_lines(self):
+        """
+        NDJSON continuing every pump of the station, IMPORTED_READINGS a
+        pump, a minute apart after its latest reading.
+        """
+        pumps = self.objects['station'].pumps.values_list(
+            'id', 'current_meter', 'latest_reading__timestamp',
+            'latest_reading__rate'
+        )
+        lines = []
+        for pump_id, meter, latest, rate in pumps:
+            for number in range(1, IMPORTED_READINGS + 1):
+                liters = 10 * number
+                lines.append(json.dumps({
+                    'pump': str(pump_id),
+                    'attendant': str(self.objects['attendant'].id),
+                    'timestamp': (
+                        latest + timedelta(minutes=number)
+                    ).isoformat(),
+                    'opening_meter': str(meter),
+                    'closing_meter': str(meter + liters),
+                    'rate': str(rate),
+                    'sales': {'cash': str(liters * rate)},
+                }))
+                meter += liters
+        return '\n'.join(lines)
+
+    def prepare_write(self, name):
+        """
+        Put the data in the state a write needs. Runs inside the write's
+        rolled back transaction, before it is timed.
+        """
+        if name in ('pumpreadings-open-shift', 'pumpreadings-import'):
+            # Every seeded pump ends on an open reading, which blocks both
+            # a new shift and readings imported after it
+            PumpReading.objects.filter(
+                pump__station=self.objects['station'], status='PENDING'
+            ).update(status='COMPLETED')
+        elif name == 'manager-list-create':
+            # A station has one manager, who is replaced by deleting them
+            Manager.objects.filter(station=self.objects['station']).delete()
+
+    def resolve_path(self, route, pattern):
+        """Fill a route's parameters with the benchmark objects' ids."""
+        if pattern.pattern.regex.pattern.startswith('^.*'):
+            return '/'
+        path = route
+        for parameter in pattern.pattern.converters:
+            if parameter == 'pk':
+                kind = pk_object(route)
+            else:
+                kind = PARAMETER_OBJECTS[parameter]
+            path = path.replace(
+                f'<uuid:{parameter}>', str(self.objects[kind].id)
+            )
+        return '/' + path
+
+    def call(self, client, method, path, body, prepare=None):
+        """
+        Make one request, rolling it back if it is a write.
+
+        Args:
+            prepare: Called first in the request's transaction, untimed.
+
+        Returns:
+            tuple: The response, its body, the seconds taken and the
+                queries run. Streamed bodies are read while timing and
+                counting, since their queries run as they are read.
+        """
+        send = getattr(client, method)
+        kwargs = {}
+        if method != 'get':
+            content_type = 'application/json'
+            if isinstance(body, str):
+                content_type = 'application/x-ndjson'
+            kwargs = {'data': body, 'content_type': content_type}
+
+        # Keep the query log from filling up and skewing the counts
+        reset_queries()
+        queries = CaptureQueriesContext(connection)
+        try:
+            with transaction.atomic():
+                if prepare is not None:
+                    prepare()
+                started = time.perf_counter()
+                with queries:
+                    response = send(path, **kwargs)
+                    if response.streaming:
+                        content = b''.join(response.streaming_content)
+                    else:
+                        content = response.content
+                elapsed = time.perf_counter() - started
+                if method != 'get':
+                    raise Rollback
+        except Rollback:
+            pass
+        return response, content, elapsed, len(queries)
+
+    def run(self, options):
+        results = []
+        for route, pattern in walk(get_resolver().url_patterns):
+            if route.startswith('admin/'):
+                continue
+            if options['filter'] and options['filter'] not in route:
+                continue
+            path = self.resolve_path(route, pattern)
+            for method in route_methods(pattern):
+                result = {
+                    'route': route,
+                    'name': pattern.name,
+                    'method': method.upper(),
+                }
+                results.append(result)
+                if method != 'get' and options['no_writes']:
+                    result['skipped'] = 'writes disabled'
+                    continue
+                result.update(
+                    self.benchmark(route, pattern, method, path, options)
+                )
+        return results
+
+    def benchmark(self, route, pattern, method, path, options):
+        """Find a role allowed to call the endpoint, then time it."""
+        prepare = None
+        if method != 'get':
+            # Reads are not rolled back, so must not be prepared
+            prepare = partial(self.prepare_write, pattern.name)
+
+        def request(role):
+            # Bodies are built before every request, outside the timer
+            body = None
+            if method not in ('get', 'delete'):
+                body = self.request_body(route, pattern, method, role)
+                if body is None:
+                    return None
+            return self.call(self.clients[role], method, path, body, prepare)
+
+        chosen = None
+        denied = {}
+        for role in ROLES:
+            try:
+                called = request(role)
+            except Exception as error:
+                return {'error': repr(error)}
+            if called is None:
+                return {'skipped': 'no benchmark payload'}
+            response = called[0]
+            if response.status_code < 400:
+                chosen = role
+                break
+            denied[role] = response.status_code
+        if chosen is None:
+            return {'status': denied, 'error': 'no role was allowed'}
+
+        for _ in range(options['warmup']):
+            request(chosen)
+
+        latencies, query_counts, sizes, statuses = [], [], [], set()
+        for _ in range(options['iterations']):
+            response, content, elapsed, queries = request(chosen)
+            latencies.append(elapsed * 1000)
+            query_counts.append(queries)
+            sizes.append(len(content))
+            statuses.add(response.status_code)
+        latencies.sort()
+
+        return {
+            'role': chosen,
+            'status': sorted(statuses),
+            'p50_ms': round(percentile(latencies, 50), 3),
+            'p95_ms': round(percentile(latencies, 95), 3),
+            'p99_ms': round(percentile(latencies, 99), 3),
+            'mean_ms': round(statistics.fmean(latencies), 3),
+            'queries': statistics.median_low(query_counts),
+            'bytes': statistics.median_low(sizes),
+        }
@@ -0,0 +1,273 @@
+import random
+from datetime import timedelta
+from decimal import Decimal
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from owner.models import Owner
+from manager.models import Manager
+from station.models import Station
+from station_attendant.models import Attendant
+from product.models import Product, Pump, PumpReading
+from pit.models import Pit, PitReading, PitStockLedger
+from sales.models import DailySalesRollup, Sales
+
+# Every seeded user's email ends with this domain, so runs can find and
+# clear their own data
+BENCHMARK_DOMAIN = 'benchmark.example'
+PASSWORD = 'benchmark-password'
+SUPERUSER_EMAIL = f'admin@{BENCHMARK_DOMAIN}'
+BATCH_SIZE = 1000
+PRODUCTS = (('PMS', Decimal('617.00')), ('AGO', Decimal('1050.00')))
+
+
+class Command(BaseCommand):
+    """
+    Seed a deterministic benchmark dataset: owners with stations, each
+    with products, pits, pumps, a manager and attendants, and months of
+    pump reading, sales and pit reading history, plus a superuser for the
+    endpoints only superusers may call.
+
+    The history is bulk inserted, then the pit ledgers and daily rollups
+    are rebuilt from it. All users share the password in PASSWORD.
+    """
+    help = "Seed a realistic dataset for run_benchmarks."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--owners', type=int, default=2)
+        parser.add_argument(
+            '--stations', type=int, default=2, help="Stations per owner."
+        )
+        parser.add_argument(
+            '--pits', type=int, default=2, help="Pits per station."
+        )
+        parser.add_argument(
+            '--pumps', type=int, default=2, help="Pumps per pit."
+        )
+        parser.add_argument(
+            '--attendants', type=int, default=4, help="Attendants per station."
+        )
+        parser.add_argument(
+            '--months', type=int, default=3, help="Months of history."
+        )
+        parser.add_argument(
+            '--readings-per-day',
+            type=int,
+            default=2,
+            help="Shifts per pump per day.",
+        )
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument(
+            '--clear',
+            action='store_true',
+            help="Delete previously seeded benchmark data first.",
+        )
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        self.password = make_password(PASSWORD)
+
+        with transaction.atomic():
+            if options['clear']:
+                deleted, _ = get_user_model().objects.filter(
+                    email__endswith=f'@{BENCHMARK_DOMAIN}'
+                ).delete()
+                self.stdout.write(f"Deleted {deleted} benchmark row(s).")
+
+            get_user_model().objects.create_user(
+                SUPERUSER_EMAIL,
+                PASSWORD,
+                name='Benchmark Admin',
+                is_superuser=True
+            )
+
+            counts = {'stations': 0, 'readings': 0, 'pit_readings': 0}
+            for owner_number in range(options['owners']):
+                owner = Owner.objects.create(
+                    email=f'owner{owner_number}@{BENCHMARK_DOMAIN}',
+                    password=self.password,
+                    name=f'Benchmark Owner {owner_number}',
+                    company_name=f'Benchmark Co {owner_number}'
+                )
+                for station_number in range(options['stations']):
+                    created = self.seed_station(
+                        owner, f'{owner_number}-{station_number}', options
+                    )
+                    counts['stations'] += 1
+                    for name, count in created.items():
+                        counts[name] += count
+
+        self.stdout.write(self.style.SUCCESS(
+            "Seeded {stations} station(s), {readings} pump reading(s) and "
+            "{pit_readings} pit reading(s). Password: {password}".format(
+                password=PASSWORD, **counts
+            )
+        ))
+
+    def seed_station(self, owner, label, options):
+        station = Station.objects.create(
+            owner=owner,
+            name=f'Benchmark Station {label}',
+            email=f'station{label}@{BENCHMARK_DOMAIN}',
+            address=f'{label} Benchmark Road'
+        )
+        station.manager = Manager.objects.create(
+            email=f'manager{label}@{BENCHMARK_DOMAIN}',
+            password=self.password,
+            name=f'Benchmark Manager {label}',
+            station=station
+        )
+        station.save()
+        attendants = [
+            Attendant.objects.create(
+                email=f'attendant{label}-{number}@{BENCHMARK_DOMAIN}',
+                password=self.password,
+                name=f'Benchmark Attendant {label}-{number}',
+                station=station
+            )
+            for number in range(options['attendants'])
+        ]
+        products = [
+            (Product.objects.create(
+                name=name, station=station, description=f'{name} fuel'
+            ), rate)
+            for name, rate in PRODUCTS
+        ]
+
+        days = options['months'] * 30
+        shifts = options['readings_per_day']
+        start = timezone.now() - timedelta(days=days)
+        created = {'readings': 0, 'pit_readings': 0}
+        for pit_number in range(options['pits']):
+            product, rate = products[pit_number % len(products)]
+            pit = Pit.objects.create(
+                name=f'Pit {pit_number}',
+                pit_product=product,
+                station=station,
+                current_volume=30000,
+                max_volume=45000
+            )
+            pumps = [
+                Pump.objects.create(
+                    name=f'Pump {pit_number}-{number}',
+                    station=station,
+                    product_type=product,
+                    initial_meter=Decimal(self.random.randint(0, 90000)),
+                    pump_pit=pit
+                )
+                for number in range(options['pumps'])
+            ]
+            readings, daily_liters = self.seed_readings(
+                pumps, attendants, rate, start, days, shifts
+            )
+            created['readings'] += len(readings)
+            created['pit_readings'] += self.seed_pit_readings(
+                pit, daily_liters, start, days
+            )
+
+        Pump.sync_latest_readings(station.pumps.all())
+        PitStockLedger.rebuild(
+            pit_ids=list(station.pits.values_list('id', flat=True))
+        )
+        DailySalesRollup.rebuild(station_ids=[station.id])
+        return created
+
+    def seed_readings(self, pumps, attendants, rate, start, days, shifts):
+        """
+        Bulk insert each pump's chain of readings and their sales.
+
+        Returns:
+            tuple: The readings, and the liters sold per day across pumps.
+        """
+        readings = []
+        timestamps = []
+        daily_liters = [Decimal(0)] * days
+        for pump in pumps:
+            meter = pump.initial_meter
+            for day in range(days):
+                for shift in range(shifts):
+                    liters = Decimal(self.random.randint(50, 900))
+                    readings.append(PumpReading(
+                        pump=pump,
+                        attendant=self.random.choice(attendants),
+                        opening_meter=meter,
+                        closing_meter=meter + liters,
+                        rate=rate,
+                        status='COMPLETED'
+                    ))
+                    timestamps.append(
+                        start + timedelta(days=day, hours=24 * shift / shifts)
+                    )
+                    meter += liters
+                    daily_liters[day] += liters
+            readings[-1].status = 'PENDING'
+
+        PumpReading.objects.bulk_create(readings, batch_size=BATCH_SIZE)
+        # auto_now_add stamps inserts with the current time; backdate them
+        for reading, timestamp in zip(readings, timestamps):
+            reading.timestamp = timestamp
+        PumpReading.objects.bulk_update(
+            readings, ['timestamp'], batch_size=BATCH_SIZE
+        )
+
+        sales = []
+        for reading in readings:
+            amount = reading.amount
+            cash = (amount * Decimal(self.random.uniform(0.3, 0.7))).quantize(
+                Decimal('0.01')
+            )
+            transfer = ((amount - cash) / 2).quantize(Decimal('0.01'))
+            shortage = Decimal(self.random.randint(-500, 500))
+            pos = amount - cash - transfer - shortage
+            sales.append(Sales(
+                station_id=reading.pump.station_id,
+                pump_reading=reading,
+                attendant=reading.attendant,
+                cash=cash,
+                transfer=transfer,
+                pos=pos,
+                shortage_or_excess=shortage,
+                is_active=reading.status == 'PENDING'
+            ))
+        Sales.objects.bulk_create(sales, batch_size=BATCH_SIZE)
+        for sale in sales:
+            sale.timestamp = sale.created_at = sale.pump_reading.timestamp
+        Sales.objects.bulk_update(
+            sales, ['timestamp', 'created_at'], batch_size=BATCH_SIZE
+        )
+        return readings, daily_liters
+
+    def seed_pit_readings(self, pit, daily_liters, start, days):
+        """Bulk insert one dipped pit reading per day, with deliveries."""
+        pit_readings = []
+        stock = pit.current_volume
+        for day in range(days):
+            supply = 0
+            if stock < 15000:
+                supply = 30000 - stock
+            closing_stock = stock + supply - float(daily_liters[day])
+            pit_readings.append(PitReading(
+                reading_pit=pit,
+                supply=supply,
+                opening_stock=stock,
+                closing_stock=closing_stock,
+                actual_closing_stock=closing_stock + self.random.uniform(
+                    -20, 20
+                )
+            ))
+            stock = max(closing_stock, 0)
+
+        PitReading.objects.bulk_create(pit_readings, batch_size=BATCH_SIZE)
+        for day, pit_reading in enumerate(pit_readings):
+            pit_reading.timestamp = pit_reading.created_at = (
+                start + timedelta(days=day, hours=23)
+            )
+        PitReading.objects.bulk_update(
+            pit_readings, ['timestamp', 'created_at'], batch_size=BATCH_SIZE
+        )
+
+        pit.current_volume = stock
+        pit.save()
+        return len(pit_readings)
@@ -0,0 +1,183 @@
+import json
+import threading
+import time
+from decimal import Decimal
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, transaction
+from owner.models import Owner
+from station.models import Station
+from station_attendant.models import Attendant
+from product.models import Product, Pump, PumpReading
+from pit.models import Pit
+
+INITIAL_VOLUME = 1000
+INITIAL_METER = Decimal('100.00')
+
+
+def legacy_update_volume(pit_id, amount):
+    """Pit.update_volume as it was: read, add in Python, save."""
+    pit = Pit.objects.get(pk=pit_id)
+    pit.current_volume += amount
+    pit.save()
+
+
+def update_volume(pit_id, amount):
+    Pit(pk=pit_id).update_volume(amount)
+
+
+def open_and_close_reading(pump_id, attendant_id):
+    """Start a reading from the pump's last meter and sell one liter."""
+    with transaction.atomic():
+        reading = PumpReading(
+            pump_id=pump_id,
+            attendant_id=attendant_id,
+            opening_meter=None,
+            rate=1
+            )
+        reading.save()
+        reading.closing_meter = reading.opening_meter + 1
+        reading.save()
+
+
+class Command(BaseCommand):
+    """
+    Hammer one pit and one pump from many threads at once and check that
+    no pit volume change is lost and no two readings start from the same
+    meter.
+
+    Each thread has its own database connection, so this needs a database
+    server that allows concurrent writers (PostgreSQL). The fixtures are
+    committed while the workers run and deleted at the end.
+    """
+    help = "Stress concurrent pit volume and pump reading writes."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=16,
+            help="Concurrent threads.",
+        )
+        parser.add_argument(
+            '--iterations',
+            type=int,
+            default=50,
+            help="Volume changes and readings per thread.",
+        )
+        parser.add_argument(
+            '--legacy',
+            action='store_true',
+            help="Use the old read-modify-write pit update for comparison.",
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor == 'sqlite':
+            raise CommandError(
+                "SQLite serializes writers; run this against PostgreSQL."
+            )
+
+        fixtures = self.create_fixtures()
+        try:
+            results = self.run(fixtures, options)
+        finally:
+            fixtures['owner'].delete()
+
+        self.stdout.write(json.dumps(results, indent=2))
+        if results['lost_volume_updates'] or results['duplicate_meters'] or \
+                results['broken_meter_chain']:
+            raise CommandError("Concurrent writes were lost.")
+        self.stdout.write(self.style.SUCCESS("No updates were lost."))
+
+    def create_fixtures(self):
+        owner = Owner.objects.create_user(
+            'stress-owner@example.com', 'stress-password',
+            name='Stress Owner', company_name='Stress Co'
+        )
+        station = Station.objects.create(
+            owner=owner, name='Stress Station',
+            email='stress-station@example.com', address='Stress'
+        )
+        attendant = Attendant.objects.create_user(
+            'stress-attendant@example.com', 'stress-password',
+            name='Stress Attendant', station=station
+        )
+        product = Product.objects.create(
+            name='Stress Product', station=station, description='Stress'
+        )
+        pit = Pit.objects.create(
+            name='Stress Pit', pit_product=product, station=station,
+            current_volume=INITIAL_VOLUME, max_volume=10 ** 9
+        )
+        pump = Pump.objects.create(
+            name='Stress Pump', station=station, product_type=product,
+            initial_meter=INITIAL_METER, pump_pit=pit
+        )
+        return {
+            'owner': owner, 'pit': pit, 'pump': pump, 'attendant': attendant
+        }
+
+    def run(self, fixtures, options):
+        workers, iterations = options['workers'], options['iterations']
+        change_volume = (
+            legacy_update_volume if options['legacy'] else update_volume
+        )
+        errors = []
+        applied = []
+        start = threading.Barrier(workers)
+
+        def work():
+            try:
+                start.wait()
+                for _ in range(iterations):
+                    try:
+                        change_volume(fixtures['pit'].id, 1)
+                        applied.append(1)
+                    except ValidationError as error:
+                        errors.append(str(error))
+                    open_and_close_reading(
+                        fixtures['pump'].id, fixtures['attendant'].id
+                    )
+            except Exception as error:
+                errors.append(repr(error))
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=work) for _ in range(workers)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        fixtures['pit'].refresh_from_db()
+        readings = list(
+            PumpReading.objects.filter(pump=fixtures['pump']).order_by(
+                'opening_meter', 'timestamp'
+            ).values_list('opening_meter', 'closing_meter')
+        )
+        openings = [opening for opening, _ in readings]
+        meter = INITIAL_METER
+        broken = 0
+        for opening, closing in readings:
+            if opening != meter:
+                broken += 1
+            meter = closing
+
+        return {
+            'workers': workers,
+            'iterations': iterations,
+            'legacy': options['legacy'],
+            'seconds': round(elapsed, 3),
+            'errors': errors[:10],
+            'expected_volume': INITIAL_VOLUME + len(applied),
+            'final_volume': fixtures['pit'].current_volume,
+            'lost_volume_updates': (
+                INITIAL_VOLUME + len(applied) -
+                fixtures['pit'].current_volume
+            ),
+            'readings': len(readings),
+            'duplicate_meters': len(openings) - len(set(openings)),
+            'broken_meter_chain': broken,
+        }
@@ -0,0 +1,280 @@
+"""
+Per-route request metrics and their Prometheus text exposition.
+
+MetricsMiddleware times every request, counts the SQL it runs and the
+response bytes it returns, and files them under the matched URL route.
+CacheNamespace lookups report their hits and misses here too. The
+aggregates live in the worker process and are served by MetricsView at
+/api/v1/metrics; scrape every worker to see the whole deployment.
+"""
+import logging
+import threading
+import time
+from contextlib import ExitStack
+from asgiref.sync import (
+    iscoroutinefunction, markcoroutinefunction, sync_to_async
+)
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse
+from rest_framework import permissions
+from rest_framework.views import APIView
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10
+)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+# SQL statements kept per request for the slow request log
+MAX_LOGGED_QUERIES = 50
+
+
+class Histogram:
+    """Cumulative bucket counts plus a running sum, as Prometheus expects."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0
+
+    def observe(self, value):
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+
+
+class RouteMetrics:
+    """Everything recorded for one (route, method) pair."""
+
+    def __init__(self):
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.queries = Histogram(QUERY_COUNT_BUCKETS)
+        self.query_seconds = 0
+        self.response_bytes = 0
+        self.statuses = {}
+
+
+class MetricsRegistry:
+    """Thread-safe, process-wide store of request and cache metrics."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.routes = {}
+        self.cache = {}
+
+    def record_request(self, route, method, status, seconds, queries,
+                       query_seconds, response_bytes):
+        with self.lock:
+            metrics = self.routes.get((route, method))
+            if metrics is None:
+                metrics = self.routes[(route, method)] = RouteMetrics()
+            metrics.latency.observe(seconds)
+            metrics.queries.observe(queries)
+            metrics.query_seconds += query_seconds
+            metrics.response_bytes += response_bytes
+            metrics.statuses[status] = metrics.statuses.get(status, 0) + 1
+
+    def record_cache(self, namespace, hits, misses):
+        """
+        Count lookups in a cache namespace kind ('user', 'station',
+        'data').
+        """
+        with self.lock:
+            counts = self.cache.setdefault(namespace, {'hit': 0, 'miss': 0})
+            counts['hit'] += hits
+            counts['miss'] += misses
+
+    def reset(self):
+        with self.lock:
+            self.routes.clear()
+            self.cache.clear()
+
+    def render(self):
+        """Return every metric in the Prometheus text exposition format."""
+        with self.lock:
+            lines = []
+            self.render_routes(lines)
+            self.render_cache(lines)
+        return '\n'.join(lines) + '\n'
+
+    def render_routes(self, lines):
+        series = sorted(self.routes.items())
+
+        lines.append(
+            '# HELP gw_http_requests_total Requests by route, method and '
+            'status.'
+        )
+        lines.append('# TYPE gw_http_requests_total counter')
+        for (route, method), metrics in series:
+            for status, count in sorted(metrics.statuses.items()):
+                labels = format_labels(route=route, method=method,
+                                       status=status)
+                lines.append(f'gw_http_requests_total{{{labels}}} {count}')
+
+        for name, attribute, help_text in (
+                ('gw_http_request_duration_seconds', 'latency',
+                 'Request latency by route.'),
+                ('gw_db_queries_per_request', 'queries',
+                 'SQL queries run per request by route.')):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} histogram')
+            for (route, method), metrics in series:
+                histogram = getattr(metrics, attribute)
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    labels = format_labels(route=route, method=method,
+                                           le=bound)
+                    lines.append(f'{name}_bucket{{{labels}}} {count}')
+                labels = format_labels(route=route, method=method, le='+Inf')
+                lines.append(f'{name}_bucket{{{labels}}} {histogram.count}')
+                labels = format_labels(route=route, method=method)
+                lines.append(f'{name}_sum{{{labels}}} {histogram.sum}')
+                lines.append(f'{name}_count{{{labels}}} {histogram.count}')
+
+        for name, attribute, help_text in (
+                ('gw_db_query_duration_seconds_total', 'query_seconds',
+                 'Time spent in SQL by route.'),
+                ('gw_http_response_bytes_total', 'response_bytes',
+                 'Response body bytes by route.')):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} counter')
+            for (route, method), metrics in series:
+                labels = format_labels(route=route, method=method)
+                value = getattr(metrics, attribute)
+                lines.append(f'{name}{{{labels}}} {value}')
+
+    def render_cache(self, lines):
+        lines.append(
+            '# HELP gw_cache_lookups_total Cache namespace lookups by result.'
+        )
+        lines.append('# TYPE gw_cache_lookups_total counter')
+        for namespace, counts in sorted(self.cache.items()):
+            for result, count in sorted(counts.items()):
+                labels = format_labels(namespace=namespace, result=result)
+                lines.append(f'gw_cache_lookups_total{{{labels}}} {count}')
+
+
+def format_labels(**labels):
+    def escape(value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace(
+            '\n', '\\n'
+        )
+    return ','.join(
+        f'{name}="{escape(value)}"' for name, value in labels.items()
+    )
+
+
+registry = MetricsRegistry()
+
+
+class QueryRecorder:
+    """A database execute wrapper that times every statement it runs."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0
+        self.statements = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.count += 1
+            self.seconds += elapsed
+            if len(self.statements) < MAX_LOGGED_QUERIES:
+                self.statements.append((elapsed, sql))
+
+
+class MetricsMiddleware:
+    """
+    Record latency, SQL, and response size for every request under its
+    URL route, and log the SQL of requests slower than
+    settings.METRICS_SLOW_REQUEST_MS.
+    """
+    async_capable = True
+    sync_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        recorder = QueryRecorder()
+        started = time.perf_counter()
+        with self.watch_queries(recorder):
+            response = self.get_response(request)
+        self.record(request, response, recorder, started)
+        return response
+
+    async def __acall__(self, request):
+        recorder = QueryRecorder()
+        started = time.perf_counter()
+        # Under ASGI the ORM runs in the request's sync thread, whose
+        # connections are not the event loop's
+        stack = await sync_to_async(self.watch_queries)(recorder)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+        self.record(request, response, recorder, started)
+        return response
+
+    @staticmethod
+    def watch_queries(recorder):
+        """Wrap the current thread's connections with a recorder."""
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(recorder))
+        return stack
+
+    def record(self, request, response, recorder, started):
+        elapsed = time.perf_counter() - started
+        match = request.resolver_match
+        route = match.route if match else 'unmatched'
+        response_bytes = 0
+        if not response.streaming:
+            response_bytes = len(response.content)
+        registry.record_request(
+            route, request.method, response.status_code, elapsed,
+            recorder.count, recorder.seconds, response_bytes
+        )
+
+        slow_ms = getattr(settings, 'METRICS_SLOW_REQUEST_MS', None)
+        if slow_ms is not None and elapsed * 1000 >= slow_ms:
+            logger.warning(
+                "Slow request %s %s (%s): %.0f ms, %d queries, "
+                "%.0f ms in SQL\n%s",
+                request.method, request.path, route, elapsed * 1000,
+                recorder.count, recorder.seconds * 1000,
+                '\n'.join(
+                    f"  {seconds * 1000:.1f} ms  {sql}"
+                    for seconds, sql in recorder.statements
+                )
+            )
+
+
+class IsSuperUser(permissions.BasePermission):
+    def has_permission(self, request, view):
+        return bool(
+            request.user.is_authenticated and request.user.is_superuser
+        )
+
+
+class MetricsView(APIView):
+    """Serve the process's metrics in Prometheus text format."""
+    permission_classes = [IsSuperUser]
+
+    def get(self, request):
+        return HttpResponse(
+            registry.render(),
+            content_type='text/plain; version=0.0.4; charset=utf-8'
+        )
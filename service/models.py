@@ -0,0 +1,48 @@
+from datetime import timedelta
+from uuid import uuid4
+from django.db import models
+from django.utils import timezone
+
+# Days deleted rows are remembered for devices syncing changes
+TOMBSTONE_DAYS = 30
+
+
+class Tombstone(models.Model):
+    """
+    A deleted row that devices syncing a station's changes have to drop.
+
+    The station is kept as a plain id, so tombstones outlive the station
+    rows they were recorded for; they are purged after TOMBSTONE_DAYS.
+    """
+    id = models.UUIDField(
+        default=uuid4,
+        editable=False,
+        unique=True,
+        primary_key=True
+        )
+    station_id = models.UUIDField()
+    kind = models.CharField(max_length=30)
+    object_id = models.UUIDField()
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # A station's deletions in keyset order
+            models.Index(
+                fields=['station_id', 'deleted_at', 'id'],
+                name='tombstone_station_idx'
+                ),
+        ]
+
+    @classmethod
+    def record(cls, station_id, kind, object_id):
+        if station_id is not None:
+            cls.objects.create(
+                station_id=station_id, kind=kind, object_id=object_id
+                )
+
+    @classmethod
+    def purge(cls):
+        """Forget deletions older than any sync token still accepted."""
+        cutoff = timezone.now() - timedelta(days=TOMBSTONE_DAYS)
+        return cls.objects.filter(deleted_at__lt=cutoff).delete()[0]
@@ -0,0 +1,126 @@
+import json
+from uuid import UUID
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from django.conf import settings
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset (cursor) pagination ordered newest first by ``(timestamp, id)``.
+
+    Each page is fetched with an indexed range condition on the last row
+    of the previous page instead of an OFFSET, so deep pages cost the same
+    as the first one and rows inserted while a client is paging never
+    shift or repeat the rows it has yet to see.
+
+    Views choose the timestamp column with a ``cursor_field`` attribute
+    (``timestamp`` by default).
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    page_size = settings.PAGINATION_PAGE_SIZE
+    max_page_size = settings.PAGINATION_MAX_PAGE_SIZE
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        queryset = self.page_queryset(queryset, request, view)
+        return self.set_page(list(queryset))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """paginate_queryset for async views, using the async ORM."""
+        queryset = self.page_queryset(queryset, request, view)
+        return self.set_page([instance async for instance in queryset])
+
+    def page_queryset(self, queryset, request, view=None):
+        """Narrow a queryset to the requested page plus one extra row."""
+        self.request = request
+        self.cursor_field = getattr(view, 'cursor_field', 'timestamp')
+        self.current_page_size = self.get_page_size(request)
+
+        queryset = queryset.order_by(f'-{self.cursor_field}', '-id')
+        cursor = self.decode_cursor(request)
+        if cursor is not None:
+            position, pk = cursor
+            queryset = queryset.filter(
+                Q(**{f'{self.cursor_field}__lt': position}) |
+                Q(**{self.cursor_field: position, 'id__lt': pk})
+            )
+        return queryset[:self.current_page_size + 1]
+
+    def set_page(self, results):
+        self.has_next = len(results) > self.current_page_size
+        self.page = results[:self.current_page_size]
+        return self.page
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+
+        try:
+            data = json.loads(urlsafe_b64decode(encoded.encode('ascii')))
+            position = parse_datetime(data['p'])
+            pk = UUID(data['id'])
+        except (AttributeError, TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+        if position is None:
+            raise NotFound(self.invalid_cursor_message)
+        return position, pk
+
+    def encode_cursor(self, instance):
+        position = getattr(instance, self.cursor_field)
+        data = json.dumps({'p': position.isoformat(), 'id': str(instance.pk)})
+        return urlsafe_b64encode(data.encode('ascii')).decode('ascii')
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(
+            url, self.cursor_query_param, self.encode_cursor(self.page[-1])
+        )
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True},
+                'results': schema,
+            },
+        }
+
+
+class KeysetPaginatedMixin:
+    """
+    Paginates a viewset's list and custom ``by_*`` actions with
+    KeysetPagination.
+    """
+    pagination_class = KeysetPagination
+    cursor_field = 'timestamp'
+
+    def paginated_response(self, queryset):
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
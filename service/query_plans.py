@@ -0,0 +1,125 @@
+"""
+EXPLAIN checks for the application's hot queries.
+
+Each hot query is paired with the table it filters, which it must reach
+through an index instead of reading in full. Both the check_query_plans
+command and the service tests run these checks.
+"""
+import re
+from uuid import uuid4
+from django.db import NotSupportedError, connection, transaction
+from django.utils import timezone
+from station.models import Station
+from station_attendant.models import Attendant
+from product.models import PumpReading
+from pit.models import PitReading
+from sales.models import Sales
+from service.models import Tombstone
+
+
+def hot_queries():
+    """
+    The application's most frequent filters, as the views and models run
+    them, paired with the model whose table must not be scanned in full.
+    """
+    pump_id, attendant_id, pit_id = uuid4(), uuid4(), uuid4()
+    station_id, owner_id = uuid4(), uuid4()
+    newest = ('-timestamp', '-id')
+    changed = ('updated_at', 'id')
+    return [
+        ('latest reading of a pump', PumpReading,
+         PumpReading.objects.filter(pump_id=pump_id).order_by('-timestamp')[:1]),
+        ('readings by pump', PumpReading,
+         PumpReading.objects.filter(pump_id=pump_id).order_by(*newest)[:100]),
+        ('readings by attendant', PumpReading,
+         PumpReading.objects.filter(
+             attendant_id=attendant_id
+         ).order_by(*newest)[:100]),
+        ('open shifts by attendant', PumpReading,
+         PumpReading.objects.filter(
+             attendant_id=attendant_id, status='PENDING'
+         ).order_by('-timestamp')[:100]),
+        ('assigned reading check', PumpReading,
+         PumpReading.objects.filter(
+             id=uuid4(), attendant_id=attendant_id
+         ).values('id')[:1]),
+        ('sales by station', Sales,
+         Sales.objects.filter(station_id=station_id).order_by(*newest)[:100]),
+        ('sales by attendant', Sales,
+         Sales.objects.filter(
+             attendant_id=attendant_id
+         ).order_by(*newest)[:100]),
+        ('active sales by station', Sales,
+         Sales.objects.filter(
+             station_id=station_id, is_active=True
+         ).order_by('-timestamp')[:100]),
+        ('pit readings by pit', PitReading,
+         PitReading.objects.filter(
+             reading_pit_id=pit_id
+         ).order_by(*newest)[:100]),
+        ('attendants by station', Attendant,
+         Attendant.objects.filter(station_id=station_id)),
+        ('stations by owner', Station,
+         Station.objects.filter(owner_id=owner_id)),
+        ('station address check', Station,
+         Station.objects.filter(
+             owner_id=owner_id, address='1 Benchmark Road'
+         ).values('id')[:1]),
+        ('reading changes by station', PumpReading,
+         PumpReading.objects.filter(
+             pump__station_id=station_id, updated_at__gt=timezone.now()
+         ).order_by(*changed)[:200]),
+        ('sales changes by station', Sales,
+         Sales.objects.filter(
+             station_id=station_id, updated_at__gt=timezone.now()
+         ).order_by(*changed)[:200]),
+        ('pit reading changes by station', PitReading,
+         PitReading.objects.filter(
+             reading_pit__station_id=station_id, updated_at__gt=timezone.now()
+         ).order_by(*changed)[:200]),
+        ('deletions by station', Tombstone,
+         Tombstone.objects.filter(
+             station_id=station_id, deleted_at__gt=timezone.now()
+         ).order_by('deleted_at', 'id')[:200]),
+    ]
+
+
+def full_scans(plan, table):
+    """Return the plan lines that read every row of a table."""
+    if connection.vendor == 'sqlite':
+        pattern = rf'\bSCAN {table}\b(?! USING (COVERING )?INDEX)'
+    elif connection.vendor == 'postgresql':
+        pattern = rf'\bSeq Scan on {table}\b'
+    else:
+        raise NotSupportedError(
+            f"Query plans cannot be checked on {connection.vendor}."
+        )
+    return [line for line in plan.splitlines() if re.search(pattern, line)]
+
+
+def explain_hot_queries():
+    """
+    EXPLAIN every hot query.
+
+    On PostgreSQL sequential scans are disabled for the check, so the
+    result does not depend on how many rows the tables hold: if the
+    planner still picks one, no index can serve the query.
+
+    Returns:
+        list: (name, plan, full scan lines) for every hot query.
+
+    Raises:
+        NotSupportedError: On databases other than SQLite and PostgreSQL.
+    """
+    results = []
+    with transaction.atomic():
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+
+        for name, model, queryset in hot_queries():
+            plan = queryset.explain()
+            results.append(
+                (name, plan, full_scans(plan, model._meta.db_table))
+            )
+    return results
@@ -0,0 +1,71 @@
+from datetime import date, datetime, time, timedelta
+from uuid import UUID
+from django.utils import timezone
+from rest_framework import serializers
+from rest_framework.exceptions import NotFound, PermissionDenied
+from owner.permissions import owns_station, works_at_station
+from station.models import Station
+
+
+class ReportingMixin:
+    """Station and date range lookups shared by station reports."""
+
+    def reporting_station(self, request, station_id):
+        """Return the station a report is for, if the caller runs it."""
+        if not (owns_station(request, station_id) or
+                works_at_station(request, 'manager', station_id)):
+            raise PermissionDenied("You do not manage this station.")
+        station = Station.objects.filter(id=station_id).first()
+        if station is None:
+            raise NotFound("Station not found.")
+        return station
+
+    def reporting_dates(self, request, station, max_days):
+        """
+        Read the inclusive 'start' and 'end' query parameters (ISO dates in
+        the station's time zone), defaulting to the last 31 days.
+        """
+        try:
+            end = request.query_params.get('end')
+            end = date.fromisoformat(end) if end else timezone.localdate(
+                timezone=station.tzinfo
+                )
+            start = request.query_params.get('start')
+            start = date.fromisoformat(start) if start else (
+                end - timedelta(days=30)
+                )
+        except ValueError:
+            raise serializers.ValidationError(
+                "start and end must be dates in YYYY-MM-DD format."
+                )
+        if start > end:
+            raise serializers.ValidationError("start must not be after end.")
+        if (end - start).days >= max_days:
+            raise serializers.ValidationError(
+                f"At most {max_days} days can be requested."
+                )
+        return start, end
+
+    def reporting_attendant(self, request):
+        """Read the optional 'attendant' query parameter, an attendant id."""
+        attendant_id = request.query_params.get('attendant')
+        if not attendant_id:
+            return None
+        try:
+            return UUID(attendant_id)
+        except ValueError:
+            raise serializers.ValidationError("attendant must be an id.")
+
+    @staticmethod
+    def reporting_period(station, start, end):
+        """
+        The timestamp filter covering the station's local days from start
+        to end inclusive.
+        """
+        tzinfo = station.tzinfo
+        return {
+            'timestamp__gte': datetime.combine(start, time.min, tzinfo),
+            'timestamp__lt': datetime.combine(
+                end + timedelta(days=1), time.min, tzinfo
+                ),
+        }
@@ -0,0 +1,201 @@
+"""
+Fixtures shared by the apps' tests.
+
+Tests run against a local memory cache instead of the configured Redis
+server; decorate test cases with override_settings(CACHES=LOCAL_CACHES).
+Rows are bulk inserted, so tables can be grown to thousands of rows
+without running every model's save().
+"""
+from decimal import Decimal
+from types import SimpleNamespace
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from manager.models import Manager
+from owner.models import Owner
+from pit.models import Pit, PitReading
+from product.models import Product, Pump, PumpReading
+from sales.models import Sales
+from service.token_utils import get_refresh_token
+from station.models import Station
+from station_attendant.models import Attendant
+
+LOCAL_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+
+def create_station(name='Test'):
+    """
+    Create a station with its owner, manager, attendant, product, pit and
+    pump.
+
+    Returns:
+        SimpleNamespace: The created rows, as attributes.
+    """
+    slug = name.lower()
+    owner = Owner.objects.create_user(
+        f'{slug}-owner@example.com', 'password', name=f'{name} Owner',
+        company_name=f'{name} Company'
+        )
+    station = Station.objects.create(
+        owner=owner, name=name, email=f'{slug}@example.com',
+        address=f'1 {name} Road'
+        )
+    manager = Manager.objects.create_user(
+        f'{slug}-manager@example.com', 'password', name=f'{name} Manager',
+        station=station
+        )
+    station.manager = manager
+    station.save()
+    attendant = Attendant.objects.create_user(
+        f'{slug}-attendant@example.com', 'password',
+        name=f'{name} Attendant', station=station
+        )
+    product = Product.objects.create(
+        name='PMS', station=station, description='Premium motor spirit'
+        )
+    pit = Pit.objects.create(
+        name='Pit 1', pit_product=product, station=station,
+        current_volume=1000, max_volume=50000
+        )
+    pump = Pump.objects.create(
+        name='Pump 1', station=station, product_type=product,
+        initial_meter=0, pump_pit=pit
+        )
+    return SimpleNamespace(
+        owner=owner, station=station, manager=manager, attendant=attendant,
+        product=product, pit=pit, pump=pump
+        )
+
+
+def api_client(user):
+    """An APIClient holding an access token for the user."""
+    user = get_user_model().objects.get_with_role(id=user.id)
+    client = APIClient()
+    client.credentials(
+        HTTP_AUTHORIZATION=f'Bearer {get_refresh_token(user).access_token}'
+        )
+    return client
+
+
+def add_readings(fixture, count):
+    """Add completed readings of a liter each, with their sales records."""
+    start = PumpReading.objects.filter(pump=fixture.pump).count()
+    readings = PumpReading.objects.bulk_create(
+        (
+            PumpReading(
+                pump=fixture.pump,
+                attendant=fixture.attendant,
+                opening_meter=Decimal(number),
+                closing_meter=Decimal(number + 1),
+                rate=Decimal('10.00'),
+                status='COMPLETED'
+                )
+            for number in range(start, start + count)
+        ),
+        batch_size=1000
+        )
+    Sales.objects.bulk_create(
+        (
+            Sales(
+                station=fixture.station,
+                pump_reading=reading,
+                attendant=fixture.attendant,
+                cash=reading.amount,
+                shortage_or_excess=0,
+                is_active=False
+                )
+            for reading in readings
+        ),
+        batch_size=1000
+        )
+
+
+def add_pit_readings(fixture, count):
+    PitReading.objects.bulk_create(
+        (
+            PitReading(
+                reading_pit=fixture.pit, opening_stock=1000,
+                closing_stock=1000
+                )
+            for _ in range(count)
+        ),
+        batch_size=1000
+        )
+
+
+def add_products(fixture, count):
+    Product.objects.bulk_create(
+        (
+            Product(
+                name=f'Product {number}', station=fixture.station,
+                description=''
+                )
+            for number in range(count)
+        ),
+        batch_size=1000
+        )
+
+
+def add_pumps(fixture, count):
+    """Add pits of the fixture's product, and pumps on the fixture's pit."""
+    Pit.objects.bulk_create(
+        (
+            Pit(
+                name=f'Pit {number}', pit_product=fixture.product,
+                station=fixture.station, max_volume=50000
+                )
+            for number in range(count)
+        ),
+        batch_size=1000
+        )
+    Pump.objects.bulk_create(
+        (
+            Pump(
+                name=f'Pump {number}', station=fixture.station,
+                product_type=fixture.product, initial_meter=0,
+                pump_pit=fixture.pit
+                )
+            for number in range(count)
+        ),
+        batch_size=1000
+        )
+
+
+class FlatQueriesMixin:
+    """
+    Assert that endpoints run as many queries at large_rows rows as at
+    small_rows, so none of them loads anything per row.
+
+    The cache is cleared before every request, so cached users and
+    responses cannot hide the queries a request would otherwise run.
+    """
+    small_rows = 10
+    large_rows = 10000
+
+    def get_ok(self, client, url):
+        cache.clear()
+        response = client.get(url)
+        self.assertEqual(response.status_code, 200, url)
+        return response
+
+    def assertFlatQueries(self, client, urls, grow):
+        """
+        Count each URL's queries, call grow(rows) to add the rows that
+        make up large_rows, and require the same counts again.
+        """
+        counts = {}
+        for url in urls:
+            with CaptureQueriesContext(connection) as queries:
+                self.get_ok(client, url)
+            counts[url] = len(queries)
+
+        grow(self.large_rows - self.small_rows)
+        for url in urls:
+            with self.subTest(url=url), self.assertNumQueries(counts[url]):
+                self.get_ok(client, url)
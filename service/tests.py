@@ -0,0 +1,16 @@
+from unittest import skipUnless
+from django.db import connection
+from django.test import TestCase
+from service.query_plans import explain_hot_queries
+
+
+@skipUnless(
+    connection.vendor in ('sqlite', 'postgresql'),
+    "Query plans are only read on SQLite and PostgreSQL."
+    )
+class QueryPlanTests(TestCase):
+
+    def test_hot_queries_use_indexes(self):
+        for name, plan, scans in explain_hot_queries():
+            with self.subTest(query=name):
+                self.assertEqual(scans, [], f"Full table scan:\n{plan}")
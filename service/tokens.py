@@ -0,0 +1,80 @@
+"""
+Refresh tokens whose blacklist lives in the cache instead of the
+token_blacklist tables.
+
+A blacklisted token's jti is kept until the token would have expired
+anyway, so the blacklist never outgrows the tokens still in use. Issuing
+a token writes nothing; checking one is a single cache read.
+"""
+import time
+from django.core.cache import cache
+from rest_framework import serializers
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken, Token
+from service.cache_keys import blacklisted_token_key
+from service.claims import apply_scope_claims, load_user
+
+
+class CachedRefreshToken(RefreshToken):
+    """A RefreshToken checked against the cache blacklist."""
+
+    @classmethod
+    def for_user(cls, user):
+        # Token.for_user, without the OutstandingToken row
+        return Token.for_user.__func__(cls, user)
+
+    def check_blacklist(self):
+        jti = self.payload[api_settings.JTI_CLAIM]
+        if cache.get(blacklisted_token_key(jti)) is not None:
+            raise TokenError("Token is blacklisted")
+
+    def blacklist(self):
+        self.blacklist_jti(
+            self.payload[api_settings.JTI_CLAIM], self.payload['exp']
+        )
+
+    @staticmethod
+    def blacklist_jti(jti, exp):
+        """Blacklist a token id until its expiry, a Unix timestamp."""
+        remaining = int(exp - time.time()) + 1
+        if remaining > 0:
+            cache.set(blacklisted_token_key(jti), 1, timeout=remaining)
+
+
+class ScopedTokenRefreshSerializer(serializers.Serializer):
+    """
+    Validate a refresh token and re-sign its user's current role and
+    station scope into it.
+
+    The user comes from load_user, and an owner's station ids from their
+    cache namespace, so a refresh usually runs no SQL.
+
+    Validated data:
+        user: The token's user, with its role.
+        refresh (CachedRefreshToken): The token to hand back, rotated if
+            ROTATE_REFRESH_TOKENS is set.
+    """
+    refresh = serializers.CharField()
+
+    def validate(self, attrs):
+        refresh = CachedRefreshToken(attrs['refresh'])
+        user = load_user(refresh[api_settings.USER_ID_CLAIM])
+        if user is None:
+            raise AuthenticationFailed(
+                "User not found", code='user_not_found'
+            )
+        if not user.is_active:
+            raise AuthenticationFailed(
+                "User is inactive", code='user_inactive'
+            )
+        apply_scope_claims(refresh, user)
+
+        if api_settings.ROTATE_REFRESH_TOKENS:
+            if api_settings.BLACKLIST_AFTER_ROTATION:
+                refresh.blacklist()
+            refresh.set_jti()
+            refresh.set_exp()
+            refresh.set_iat()
+        return {'user': user, 'refresh': refresh}
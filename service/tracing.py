@@ -0,0 +1,205 @@
+"""
+Timed, nested spans written to a local JSONL file.
+
+A span with no parent starts a trace: a request (TracingMiddleware), or a
+save run outside one, such as from a management command. Spans opened
+while it runs become its children, across sync_to_async threads too. One
+trace in TRACE_SAMPLE_RATE is kept, as is every trace slower than
+TRACE_SLOW_MS; kept traces are appended to TRACE_FILE one span per line
+by a background thread, so requests and the event loop never wait on the
+file, and the rest are dropped when they end. With TRACE_FILE unset spans
+cost a context variable lookup.
+
+Span lines use OpenTelemetry's field names (trace_id, span_id,
+parent_span_id, start_time_unix_nano, ...), so a collector's file
+receiver can forward them unchanged.
+"""
+import functools
+import json
+import random
+import secrets
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+_current_span = ContextVar('current_span', default=None)
+# One thread, so traces are written whole and in the order they ended
+_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='tracing')
+
+
+class Trace:
+    """The spans of one trace, and whether it was sampled."""
+
+    def __init__(self, sampled):
+        self.trace_id = secrets.token_hex(16)
+        self.sampled = sampled
+        self.spans = []
+
+
+class Span:
+    """
+    One timed operation.
+
+    Attributes:
+        trace (Trace): The trace it belongs to, or None if it is not
+            recorded.
+        attributes (dict): JSON-serializable details of the operation.
+    """
+
+    def __init__(self, trace, name, parent_id=None, **attributes):
+        self.trace = trace
+        self.name = name
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+
+    def set(self, **attributes):
+        if self.trace is not None:
+            self.attributes.update(attributes)
+
+    def as_dict(self):
+        return {
+            'trace_id': self.trace.trace_id,
+            'span_id': self.span_id,
+            'parent_span_id': self.parent_id,
+            'name': self.name,
+            'start_time_unix_nano': self.start_ns,
+            'end_time_unix_nano': self.end_ns,
+            'duration_ms': round((self.end_ns - self.start_ns) / 1e6, 3),
+            'attributes': self.attributes,
+        }
+
+
+# Handed out inside traces that are not recorded
+UNRECORDED = Span(None, 'unrecorded')
+
+
+@contextmanager
+def span(name, **attributes):
+    """
+    Time the enclosed block as a child of the current span.
+
+    Yields:
+        Span: The span, whose attributes the block may add to.
+    """
+    parent = _current_span.get()
+    if parent is None:
+        trace = start_trace()
+        if trace is None:
+            token = _current_span.set(UNRECORDED)
+            try:
+                yield UNRECORDED
+            finally:
+                _current_span.reset(token)
+            return
+        current = Span(trace, name, **attributes)
+    elif parent.trace is None:
+        yield UNRECORDED
+        return
+    else:
+        current = Span(
+            parent.trace, name, parent_id=parent.span_id, **attributes
+        )
+
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.set(error=type(e).__name__)
+        raise
+    finally:
+        current.end_ns = time.time_ns()
+        current.trace.spans.append(current)
+        _current_span.reset(token)
+        if parent is None:
+            finish_trace(current)
+
+
+def traced(name=None):
+    """Run every call of the decorated function in a span."""
+    def decorator(func):
+        span_name = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def current_span():
+    """The innermost open span, or an unrecorded one."""
+    return _current_span.get() or UNRECORDED
+
+
+def start_trace():
+    """Return a new Trace to record spans in, or None to record nothing."""
+    if not getattr(settings, 'TRACE_FILE', None):
+        return None
+    sampled = random.random() < getattr(settings, 'TRACE_SAMPLE_RATE', 0)
+    if not sampled and getattr(settings, 'TRACE_SLOW_MS', None) is None:
+        return None
+    # Unsampled traces are recorded in case they turn out slow
+    return Trace(sampled)
+
+
+def finish_trace(root):
+    trace = root.trace
+    slow_ms = getattr(settings, 'TRACE_SLOW_MS', None)
+    duration_ms = (root.end_ns - root.start_ns) / 1e6
+    if not trace.sampled and (slow_ms is None or duration_ms < slow_ms):
+        return
+    _writer.submit(write_trace, settings.TRACE_FILE, trace.spans)
+
+
+def write_trace(path, spans):
+    lines = ''.join(
+        json.dumps(recorded.as_dict(), default=str) + '\n'
+        for recorded in spans
+    )
+    with open(path, 'a') as trace_file:
+        trace_file.write(lines)
+
+
+def flush_traces():
+    """Wait until every trace kept so far is in TRACE_FILE."""
+    _writer.submit(lambda: None).result()
+
+
+class TracingMiddleware:
+    """Start a trace for every request, named after its URL route."""
+    async_capable = True
+    sync_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with span(request.method, path=request.path) as root:
+            response = self.get_response(request)
+            self.describe(root, request, response)
+        return response
+
+    async def __acall__(self, request):
+        with span(request.method, path=request.path) as root:
+            response = await self.get_response(request)
+            self.describe(root, request, response)
+        return response
+
+    @staticmethod
+    def describe(root, request, response):
+        if root.trace is None:
+            return
+        match = request.resolver_match
+        root.name = f"{request.method} {match.route if match else 'unmatched'}"
+        root.set(status=response.status_code)
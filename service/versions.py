@@ -0,0 +1,42 @@
+"""
+Per-station data versions.
+
+Every committed change to a station's products, pumps, pits, attendants,
+readings or sales moves the version of its data namespace, and the one
+for lists spanning every station. Responses derived from that data can
+be tagged with the version and recognised as unchanged while it stays.
+"""
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from service.cache_keys import ALL_STATIONS, station_data_namespace
+
+
+def bump_station_data(*station_ids):
+    """
+    Move stations' data versions once the current transaction commits.
+    Bulk writes that bypass save() call this themselves.
+    """
+    station_ids = {station_id for station_id in station_ids if station_id}
+    if not station_ids:
+        return
+
+    def bump():
+        for station_id in (*station_ids, ALL_STATIONS):
+            station_data_namespace(station_id).invalidate()
+    transaction.on_commit(bump)
+
+
+def track_station_data(model, station_of):
+    """
+    Bump the station's data version whenever a row of the model is saved
+    or deleted.
+
+    Args:
+        station_of: Returns the station id of an instance.
+    """
+    def changed(sender, instance, **kwargs):
+        bump_station_data(station_of(instance))
+
+    uid = f'station_data:{model._meta.label}'
+    post_save.connect(changed, sender=model, weak=False, dispatch_uid=uid)
+    post_delete.connect(changed, sender=model, weak=False, dispatch_uid=uid)
@@ -1,6 +1,20 @@
-from django.db import models
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import models, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from owner.models import BaseModel, Owner
 from manager.models import Manager
+from service.cache_keys import user_namespace
+
+
+def validate_timezone(value):
+    """Reject names that are not IANA time zones."""
+    try:
+        ZoneInfo(value)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise ValidationError(f"{value} is not a known time zone.")
 
 
 class Station(BaseModel):
@@ -13,3 +27,48 @@ class Station(BaseModel):
         related_name='station_manager',
         null=True
         )
+    # Where the station's business day starts and ends
+    timezone = models.CharField(
+        max_length=63,
+        default=settings.TIME_ZONE,
+        validators=[validate_timezone]
+        )
+
+    class Meta:
+        indexes = [
+            # StationCreateSerializer checks addresses per owner
+            models.Index(
+                fields=['owner', 'address'],
+                name='station_owner_address_idx'
+                ),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._recorded_timezone = instance.__dict__.get('timezone')
+        return instance
+
+    @property
+    def tzinfo(self):
+        return ZoneInfo(self.timezone)
+
+    def save(self, *args, **kwargs):
+        previous_timezone = getattr(self, '_recorded_timezone', None)
+        super().save(*args, **kwargs)
+
+        if previous_timezone and previous_timezone != self.timezone:
+            # Every local day boundary moved, so re-bucket the history
+            from sales.models import DailySalesRollup
+            transaction.on_commit(
+                lambda: DailySalesRollup.rebuild(station_ids=[self.id])
+                )
+        self._recorded_timezone = self.timezone
+
+
+@receiver(post_save, sender=Station)
+@receiver(post_delete, sender=Station)
+def forget_owner_stations(sender, instance, created=True, **kwargs):
+    """Re-read an owner's station ids once a station is added or removed."""
+    if created:
+        transaction.on_commit(user_namespace(instance.owner_id).invalidate)
@@ -26,7 +26,8 @@ class StationCreateSerializer(serializers.ModelSerializer):
             'city',
             'state',
             'zip_code',
-            'country'
+            'country',
+            'timezone'
             ]
         read_only_fields = ['id', 'owner']
 
@@ -34,9 +35,11 @@ class StationCreateSerializer(serializers.ModelSerializer):
         """
         Check that the address is unique for the owner.
         """
-        owner = self.context['request'].user
+        owner_id = self.context['request'].user.id
         address = data['address']
-        if Station.objects.filter(owner=owner, address=address).exists():
+        if Station.objects.filter(
+                owner_id=owner_id, address=address
+                ).exists():
             raise serializers.ValidationError(
                 "This address is already in use by this owner."
                 )
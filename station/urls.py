@@ -1,5 +1,8 @@
 from django.urls import path
-from station.views import StationViewSet
+from station.views import (
+    StationChangesView, StationEventsView, StationSnapshotView,
+    StationViewSet
+    )
 
 app_name = 'station'
 
@@ -18,4 +21,12 @@ urlpatterns = [
             }
         ),
         name='station-detail'),
+
+    path('async/stations/<uuid:station_id>/snapshot',
+         StationSnapshotView.as_view(),
+         name='async-station-snapshot'),
+    path('async/stations/<uuid:station_id>/events',
+         StationEventsView.as_view(),
+         name='async-station-events'),
+    path('sync/changes', StationChangesView.as_view(), name='sync-changes'),
 ]
@@ -1,11 +1,31 @@
 from rest_framework import viewsets
+from rest_framework.exceptions import NotFound, PermissionDenied
 from rest_framework.response import Response
+from rest_framework.views import APIView
 from station.models import Station
 from station.serializers import StationSerializer, StationCreateSerializer
-from owner.permissions import IsAuthenticatedOwner, IsStationOwner
-from owner.models import Owner
+from owner.permissions import (
+    IsAuthenticatedAttendant, IsAuthenticatedManager, IsAuthenticatedOwner,
+    IsStationOwner
+)
 from rest_framework import serializers
-from django.core.exceptions import ObjectDoesNotExist
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.db import connections
+from django.db.models import Sum
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from pit.models import Pit, PitReading
+from pit.serializers import PitReadingSerializer, PitSerializer
+from product.models import Pump, PumpReading
+from product.serializers import PumpReadingSerializer, PumpSerializer
+from sales.models import DailySalesRollup, Sales
+from sales.serializers import DailySalesTotalsSerializer, SyncSalesSerializer
+from service import events
+from service.async_views import AsyncAPIView
+from service.claims import token_claims
+from service.models import Tombstone
+from service.sync import make_token, read_changes, read_token
 
 
 class StationViewSet(viewsets.ModelViewSet):
@@ -18,8 +38,8 @@ class StationViewSet(viewsets.ModelViewSet):
         Returns the queryset of stations owned by the authenticated owner.
 
         If the user is not authenticated, an empty queryset is returned.
-        If the user is authenticated but does not have an
-        associated Owner object, an empty queryset is returned.
+        If the user's token does not carry the owner role,
+        an empty queryset is returned.
         Otherwise, the queryset contains only the stations owned
         by the authenticated owner.
 
@@ -31,13 +51,11 @@ class StationViewSet(viewsets.ModelViewSet):
         if not user.is_authenticated:
             return Station.objects.none()
 
-        try:
-            owner = Owner.objects.get(pk=user.pk)
-        except Owner.DoesNotExist:
+        if token_claims(self.request).get('role') != 'owner':
             return Station.objects.none()
 
         # Return only the stations owned by the authenticated owner
-        return Station.objects.filter(owner=owner)
+        return Station.objects.filter(owner_id=user.id)
 
     def get_serializer_class(self):
         """
@@ -51,15 +69,13 @@ class StationViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         """
         Set the owner of the station to the
-        currently authenticated Owner instance during creation.
+        currently authenticated owner during creation.
         """
-        try:
-            owner = Owner.objects.get(pk=self.request.user.pk)
-            serializer.save(owner=owner)
-        except ObjectDoesNotExist:
+        if token_claims(self.request).get('role') != 'owner':
             raise serializers.ValidationError(
                 "The authenticated user is not an owner."
             )
+        serializer.save(owner_id=self.request.user.id)
 
     def perform_update(self, serializer):
         """
@@ -81,3 +97,167 @@ class StationViewSet(viewsets.ModelViewSet):
         serializer.is_valid(raise_exception=True)
         self.perform_update(serializer)
         return Response(serializer.data)
+
+
+class StationSnapshotView(AsyncAPIView):
+    """
+    A station's dashboard in one async request: the station and its
+    staff, its pumps with their current meters and latest readings, its
+    pits, and today's totals from the daily sales rollups.
+    """
+
+    async def get(self, request, station_id):
+        await self.check_station_access(request, station_id)
+        try:
+            station = await Station.objects.select_related(
+                'manager'
+                ).prefetch_related('attendants').aget(pk=station_id)
+        except Station.DoesNotExist:
+            raise NotFound("Station not found.")
+
+        pumps = Pump.objects.filter(station_id=station_id).select_related(
+            'product_type', 'pump_pit', 'latest_reading'
+            ).order_by('name')
+        pits = Pit.objects.filter(station_id=station_id).select_related(
+            'pit_product'
+            ).order_by('name')
+
+        today = timezone.localdate(timezone=station.tzinfo)
+        totals = await DailySalesRollup.objects.filter(
+            station_id=station_id, date=today
+            ).aaggregate(**{
+                field: Sum(field, default=0)
+                for field in DailySalesRollup.FIELDS
+                })
+        totals['date'] = today
+        totals['open_shifts'] = await PumpReading.objects.filter(
+            pump__station_id=station_id, status='PENDING'
+            ).acount()
+
+        return self.render({
+            'station': StationSerializer(station).data,
+            'pumps': PumpSerializer(
+                [pump async for pump in pumps], many=True
+                ).data,
+            'pits': PitSerializer([pit async for pit in pits], many=True).data,
+            'today': DailySalesTotalsSerializer(totals).data,
+        })
+
+
+class StationEventsView(AsyncAPIView):
+    """
+    A server-sent event stream of a station's pump readings, sales and
+    pit activity as it commits, for dashboards that would otherwise poll.
+
+    Reconnecting browsers send the Last-Event-ID header and are sent the
+    events they missed; clients that cannot set it may pass
+    ?last_event_id= instead. A 'reset' event asks the client to reload
+    its data over the REST endpoints before following the stream again.
+    """
+
+    async def get(self, request, station_id):
+        if not isinstance(request, ASGIRequest):
+            # A WSGI worker would buffer the endless stream
+            return self.render(
+                {'detail': "Event streams are only served over ASGI."},
+                status=501
+                )
+        await self.check_station_access(request, station_id)
+
+        resume_from = request.headers.get(
+            'Last-Event-ID', request.GET.get('last_event_id')
+            )
+        if resume_from is not None:
+            try:
+                resume_from = int(resume_from)
+            except ValueError:
+                raise serializers.ValidationError(
+                    "last_event_id must be an event id."
+                    )
+        # The stream never queries, so give its connection back now
+        await sync_to_async(connections.close_all)()
+
+        response = StreamingHttpResponse(
+            events.stream(station_id, resume_from),
+            content_type='text/event-stream'
+            )
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+
+class StationChangesView(APIView):
+    """
+    The rows of the caller's station created, updated or deleted since a
+    sync token, so staff devices on flaky connections keep a copy of the
+    station's pump readings, sales and pit readings without reloading it.
+
+    Without ?token=, or with one the server can no longer continue from,
+    the response has 'reset' set: the device drops its copy and pages
+    through every row. Each response carries the token to send next and
+    'has_more' while changes are still waiting. Deleted rows are listed
+    by id under 'deleted'.
+    """
+    permission_classes = [IsAuthenticatedManager | IsAuthenticatedAttendant]
+    # Most rows of each kind per response
+    page_size = 200
+
+    def synced(self, station_id):
+        """The (kind, queryset, serializer class) a device keeps."""
+        return (
+            ('pump_readings',
+             PumpReading.objects.filter(
+                 pump__station_id=station_id
+                 ).select_related('pump', 'attendant'),
+             PumpReadingSerializer),
+            ('sales',
+             Sales.objects.filter(station_id=station_id).select_related(
+                 'pump_reading__pump', 'attendant'
+                 ),
+             SyncSalesSerializer),
+            ('pit_readings',
+             PitReading.objects.filter(
+                 reading_pit__station_id=station_id
+                 ).select_related('reading_pit'),
+             PitReadingSerializer),
+        )
+
+    def get(self, request):
+        claims = token_claims(request)
+        station_id = claims.get('station_id')
+        if claims.get('role') not in ('manager', 'attendant') or (
+                not station_id):
+            raise PermissionDenied("Only station staff can sync a station.")
+
+        token = request.query_params.get('token')
+        cursors = read_token(token, station_id) if token else None
+        reset = cursors is None
+        cursors = cursors or {}
+
+        data = {'reset': reset}
+        next_cursors = {}
+        has_more = False
+        for kind, queryset, serializer_class in self.synced(station_id):
+            rows, next_cursors[kind], more = read_changes(
+                queryset, cursors.get(kind), self.page_size
+                )
+            data[kind] = serializer_class(rows, many=True).data
+            has_more = has_more or more
+        data['deleted'] = {kind: [] for kind in next_cursors}
+
+        tombstones = Tombstone.objects.filter(station_id=station_id)
+        if reset:
+            # A device starting over has nothing to delete
+            tombstones = tombstones.none()
+        tombstones, next_cursors['deleted'], more = read_changes(
+            tombstones, cursors.get('deleted'), self.page_size,
+            field='deleted_at'
+            )
+        for tombstone in tombstones:
+            data['deleted'].setdefault(tombstone.kind, []).append(
+                tombstone.object_id
+                )
+
+        data['has_more'] = has_more or more
+        data['token'] = make_token(station_id, next_cursors)
+        return Response(data)
@@ -1,6 +1,12 @@
 from django.db import models
+from operator import attrgetter
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
 from owner.models import User
 from station.models import Station
+from service.cache_keys import station_namespace
+from service.claims import revoke_scope, track_cached_user
+from service.versions import bump_station_data, track_station_data
 
 
 class Attendant(User):
@@ -15,3 +21,29 @@ class Attendant(User):
     is_attendant = models.BooleanField(default=True)
 
     REQUIRED_FIELDS = ['station']
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._recorded_station_id = instance.__dict__.get('station_id')
+        return instance
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        previous_station_id = getattr(self, '_recorded_station_id', None)
+        if previous_station_id and previous_station_id != self.station_id:
+            # Tokens signed for the old station must not be honoured
+            revoke_scope(self.pk)
+            station_namespace(previous_station_id).invalidate()
+            bump_station_data(previous_station_id)
+        self._recorded_station_id = self.station_id
+
+
+@receiver(post_delete, sender=Attendant)
+def forget_station_attendant(sender, instance, **kwargs):
+    """Stop treating a deleted attendant as a member of its station."""
+    station_namespace(instance.station_id).invalidate()
+
+
+track_station_data(Attendant, attrgetter('station_id'))
+track_cached_user(Attendant)
@@ -1,16 +1,15 @@
-from django.core.cache import cache
 from rest_framework import viewsets, status, permissions
 from station_attendant.models import Attendant
 from station_attendant.serializers import *
 from owner.permissions import IsAuthenticatedManager, IsAuthenticatedAttendant
 from rest_framework.response import Response
 from rest_framework_simplejwt.views import TokenObtainPairView
-from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework_simplejwt.exceptions import TokenError, InvalidToken
 from rest_framework.exceptions import PermissionDenied
 from rest_framework.decorators import action
 from product.models import PumpReading
-from service.token_utils import set_tokens_and_response
+from service.cache_keys import user_namespace, USER_PUMP_READINGS
+from service.token_utils import get_refresh_token, set_tokens_and_response
 
 
 class AttendantViewSet(viewsets.ModelViewSet):
@@ -98,29 +97,14 @@ class AttendantLoginView(TokenObtainPairView):
         # Retrieve the authenticated user
         user = serializer.validated_data['user']
 
-        if user.is_attendant:
-            refresh = RefreshToken.for_user(user)
-            # Store both is_attendant status and station_id in Redis
-            cache.set(
-                f"is_attendant_{user.id}",
-                user.is_attendant,
-                timeout=3600
-                )
-            cache.set(
-                f"attendant_station_{user.id}",
-                user.station_id,
-                timeout=3600
-                )
+        if user.role == 'attendant':
+            refresh = get_refresh_token(user)
 
             # Save last 10 pump readings assigned to this attendant in Redis
             pump_readings = PumpReading.objects.filter(attendant=user)
             pump_readings = pump_readings.order_by('-timestamp')[:10]
             pump_reading_ids = [pr.id for pr in pump_readings]
-            cache.set(
-                f"attendant_{user.id}_pump_readings",
-                pump_reading_ids,
-                timeout=3600
-                )
+            user_namespace(user.id).set(USER_PUMP_READINGS, pump_reading_ids)
 
             return set_tokens_and_response(request, user, refresh)
 